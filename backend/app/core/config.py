@@ -23,6 +23,63 @@ else:
 MONGO_URL = os.getenv("MONGO_URL")
 DB_NAME = os.getenv("DB_NAME", "moldz3d")
 
+# pool de conexões do Motor
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+
+# leituras de catálogo (produtos, estoque na vitrine) podem ir para secundários
+MONGO_CATALOG_READ_PREFERENCE = os.getenv("MONGO_CATALOG_READ_PREFERENCE", "secondaryPreferred")
+
+# write concern: "majority" ou número de nós; journal opcional
+MONGO_WRITE_CONCERN_W = os.getenv("MONGO_WRITE_CONCERN_W", "majority")
+MONGO_WRITE_CONCERN_JOURNAL = os.getenv(
+    "MONGO_WRITE_CONCERN_JOURNAL",
+    "true"
+).lower() in ("1", "true", "yes", "y")
+
+# comandos acima deste tempo são logados como lentos
+MONGO_SLOW_MS = float(os.getenv("MONGO_SLOW_MS", "100"))
+
+# respostas guardadas para o header Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+# tempo máximo de um handler idempotente; um registro "processing" mais
+# velho que isso é de um worker que morreu e pode ser assumido
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+
+# =========================
+# LOGGING
+# =========================
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# "json" (uma linha por registro) ou "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# nível por módulo, ex.: "app.routes.shipping=DEBUG,backend.mongo=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+# registros acima disso são descartados em vez de bloquear a requisição
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# =========================
+# TRACING
+# =========================
+
+# fração das requisições com spans gravados (0.0 a 1.0)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+# destinos dos traces: "memory", "console" (lista separada por vírgula) ou vazio
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "memory")
+
+# traces guardados em memória para GET /api/admin/traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+
 # =========================
 # CORS
 # =========================
@@ -66,6 +123,56 @@ MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
 # opcional — usado para validar webhook futuramente
 MP_WEBHOOK_SECRET = os.getenv("MP_WEBHOOK_SECRET", "")
 
+MP_BASE_URL = os.getenv("MP_BASE_URL", "https://api.mercadopago.com").rstrip("/")
+
+# =========================
+# CHAMADAS EXTERNAS (RESILIÊNCIA)
+# =========================
+
+# timeout padrão por chamada; operações específicas têm o seu em resilience.py
+OUTBOUND_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_TIMEOUT_SECONDS", "15"))
+
+# novas tentativas (só em chamadas idempotentes), com backoff exponencial + jitter
+OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", "2"))
+OUTBOUND_RETRY_BASE_SECONDS = float(os.getenv("OUTBOUND_RETRY_BASE_SECONDS", "0.2"))
+
+# falhas seguidas que abrem o circuito e quanto tempo ele fica aberto
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# pool de conexões compartilhado por serviço externo (keep-alive)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+# =========================
+# RATE LIMIT / LOAD SHEDDING
+# =========================
+
+# "MÉTODO rota=requisições/segundos[:concorrência]" por template de rota
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS",
+    "POST /api/shipping/quote=30/60:20,"
+    "POST /api/auth/login=10/60:8,"
+    "POST /api/auth/google=10/60:8,"
+    "POST /api/payments/{order_id}/create=10/60:10",
+)
+
+# "memory" (por worker) ou "mongo" (baldes compartilhados entre workers)
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").strip().lower()
+
+# proxies confiáveis na frente do app (o Procfile roda atrás do proxy da
+# plataforma = 1). O IP do cliente é o N-ésimo de X-Forwarded-For contando
+# da direita: o que o proxy mais externo viu, que o cliente não forja.
+# 0 = app exposto direto (usa o IP da conexão e ignora o header).
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1"))
+
+# acima disso (chamadas externas em andamento) as rotas limitadas respondem 503
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", "40"))
+
+# cotações guardadas para servir quando o Melhor Envio estiver fora
+QUOTE_CACHE_TTL_SECONDS = int(os.getenv("QUOTE_CACHE_TTL_SECONDS", "21600"))
+
 # =========================
 # MELHOR ENVIO
 # =========================
@@ -93,6 +200,42 @@ MELHOR_ENVIO_OAUTH_SCOPE = (
     os.getenv("MELHOR_ENVIO_OAUTH_SCOPE") or ""
 ).strip()
 
+# ids por chamada nas operações em lote (checkout/generate/print)
+ME_BATCH_SIZE = int(os.getenv("MELHOR_ENVIO_BATCH_SIZE", "50"))
+
+# reserva de criação do carrinho: passado esse tempo sem concluir, o
+# worker que reservou é dado como morto e outro pode assumir
+CARRIER_CART_CLAIM_MINUTES = int(os.getenv("CARRIER_CART_CLAIM_MINUTES", "10"))
+
+# caixas de envio para o empacotamento (nome:CxLxA em cm:peso_max_kg[:tara_kg])
+SHIPPING_BOXES = os.getenv(
+    "SHIPPING_BOXES",
+    "P:16x11x6:1:0.05,M:27x18x9:5:0.15,G:36x27x18:10:0.3,GG:54x36x27:30:0.6",
+)
+PACKING_VOLUMETRIC_DIVISOR = float(os.getenv("PACKING_VOLUMETRIC_DIVISOR", "6000"))
+PACKING_MAX_UNITS = int(os.getenv("PACKING_MAX_UNITS", "500"))
+
+# tabela de fretes aprendida das cotações (estimativas sem chamada externa)
+RATE_TABLE_CEP_PREFIX = int(os.getenv("RATE_TABLE_CEP_PREFIX", "3"))
+RATE_TABLE_WEIGHT_BRACKETS = os.getenv("RATE_TABLE_WEIGHT_BRACKETS", "0.3,0.5,1,2,3,5,10,15,20,30")
+RATE_TABLE_MAX_AGE_DAYS = int(os.getenv("RATE_TABLE_MAX_AGE_DAYS", "30"))
+
+# rastreio dos pedidos em trânsito é atualizado em lote neste intervalo
+TRACKING_REFRESH_SECONDS = int(os.getenv("TRACKING_REFRESH_SECONDS", "1800"))
+TRACKING_REFRESH_ENABLED = os.getenv(
+    "TRACKING_REFRESH_ENABLED",
+    "true"
+).lower() in ("1", "true", "yes", "y")
+
+# eventos de pedido (SSE): "memory" (um worker) ou "changestream" (replica set)
+ORDER_EVENTS_BACKEND = os.getenv("ORDER_EVENTS_BACKEND", "memory").strip().lower()
+ORDER_EVENTS_QUEUE_SIZE = int(os.getenv("ORDER_EVENTS_QUEUE_SIZE", "16"))
+ORDER_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("ORDER_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# cache em disco das etiquetas (PDF) já baixadas
+LABEL_CACHE_DIR = Path(os.getenv("LABEL_CACHE_DIR") or ROOT_DIR / "var" / "labels")
+LABEL_CACHE_MAX_MB = int(os.getenv("LABEL_CACHE_MAX_MB", "512"))
+
 # =========================
 # REMETENTE MELHOR ENVIO
 # =========================
@@ -113,7 +256,8 @@ ME_FROM_STATE = os.getenv("MELHOR_ENVIO_FROM_STATE", "")
 # MELHOR ENVIO URLS
 # =========================
 
-ME_BASE = (
+# MELHOR_ENVIO_BASE_URL permite apontar para um stub local (scripts/stub_falhas.py)
+ME_BASE = (os.getenv("MELHOR_ENVIO_BASE_URL") or "").rstrip("/") or (
     "https://sandbox.melhorenvio.com.br"
     if MELHOR_ENVIO_SANDBOX
     else "https://melhorenvio.com.br"
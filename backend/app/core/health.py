@@ -0,0 +1,39 @@
+"""
+Estado de prontidão do processo.
+
+`mark_warm` é chamado quando o startup termina (índices, caches em
+memória). Serviços em segundo plano registram aqui uma função que
+devolve o tamanho da sua fila, para que /health/ready mostre o backlog.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+_state = {"warm": False}
+
+_backlogs: dict[str, Callable[[], int]] = {}
+
+
+def mark_warm():
+    _state["warm"] = True
+
+
+def is_warm() -> bool:
+    return _state["warm"]
+
+
+def register_backlog(name: str, provider: Callable[[], int]):
+    _backlogs[name] = provider
+
+
+def backlog_snapshot() -> dict[str, int]:
+    out = {}
+
+    for name, provider in _backlogs.items():
+        try:
+            out[name] = int(provider())
+        except Exception:
+            out[name] = -1
+
+    return out
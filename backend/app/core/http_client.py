@@ -0,0 +1,40 @@
+"""
+Clientes httpx compartilhados, um por serviço externo.
+
+Abrir um AsyncClient por chamada refaz DNS, TCP e TLS toda vez. Aqui cada
+serviço (Melhor Envio, Mercado Pago) tem um cliente com pool e keep-alive,
+criado no primeiro uso e fechado no shutdown da aplicação. O timeout é
+passado por requisição.
+"""
+
+from __future__ import annotations
+
+import httpx
+
+from app.core import config
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def get_client(service: str) -> httpx.AsyncClient:
+    client = _clients.get(service)
+
+    if client is None or client.is_closed:
+        client = _clients[service] = httpx.AsyncClient(
+            timeout=config.OUTBOUND_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+
+    return client
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,151 @@
+"""
+Configuração de logging da API.
+
+Os handlers do root logger são substituídos por um QueueHandler: a
+requisição só enfileira o registro (com request id, rota e trace id já
+capturados) e uma thread do QueueListener formata e escreve no stdout.
+Assim nenhum log faz I/O síncrono no event loop. Se a fila encher, o
+registro é descartado e contado em `log_records_dropped_total`.
+
+LOG_FORMAT escolhe "json" (uma linha por registro) ou "text". LOG_LEVELS
+ajusta o nível por módulo, ex.: "app.routes.shipping=DEBUG,backend.mongo=WARNING".
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app.core.config import LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_QUEUE_SIZE
+from app.core.health import register_backlog
+from app.core.metrics import Counter, registry
+from app.core.request_context import RequestIdLogFilter, current_route
+from app.core.tracing import current_span
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# atributos padrão do LogRecord; o resto veio de `extra=` e vai para o JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "route", "trace_id",
+}
+
+log_records_dropped = registry.register(Counter(
+    "log_records_dropped_total",
+    "Registros de log descartados com a fila cheia.",
+))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "route": getattr(record, "route", "-"),
+        }
+
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextQueueHandler(QueueHandler):
+    """Captura o contexto da requisição antes de mandar o registro para a fila."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        record.route = current_route.get()
+
+        span = current_span.get()
+        record.trace_id = span.trace_id if span is not None and span.sampled else None
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+_listener: QueueListener | None = None
+
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    levels = {}
+
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+
+    return levels
+
+
+def setup_logging():
+    global _listener
+
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+    stream.addFilter(RequestIdLogFilter())
+
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdLogFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+    register_backlog("log_queue", log_queue.qsize)
+
+
+def stop_logging():
+    """Esvazia a fila e para a thread de escrita (shutdown)."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        # logs do resto do shutdown vão direto para o stream
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
@@ -0,0 +1,265 @@
+"""
+Métricas em formato texto do Prometheus, sem dependências externas.
+
+Contadores, gauges e histogramas simples com labels, um middleware ASGI
+que mede latência e requisições em andamento por template de rota, e um
+helper para cronometrar chamadas externas (Melhor Envio, Mercado Pago,
+Cloudinary, Google). Tudo é exposto em GET /metrics.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from app.core.request_context import current_route
+from app.core.tracing import tracer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+        parts.append(extra)
+
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+
+            if series is None:
+                # [contagem por bucket..., soma, total]
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+
+            series[-2] += value
+            series[-1] += 1
+
+    def series(self) -> dict[tuple, dict]:
+        """Cópia das séries: {labels: {"buckets": [...], "sum", "count"}} (buckets não cumulativos)."""
+        with self._lock:
+            return {
+                labels: {"buckets": list(s[:-2]), "sum": s[-2], "count": s[-1]}
+                for labels, s in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+                lbl = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{lbl} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{lbl} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list[str]]):
+        """Coletor chamado a cada scrape (para métricas calculadas na hora)."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        for collector in self._collectors:
+            lines.extend(collector())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições HTTP por template de rota.",
+    ("method", "route", "status"),
+))
+
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight",
+    "Requisições HTTP em andamento por rota.",
+    ("route",),
+))
+
+outbound_request_duration = registry.register(Histogram(
+    "outbound_request_duration_seconds",
+    "Latência de chamadas a serviços externos.",
+    ("service", "operation", "outcome"),
+))
+
+cache_requests = registry.register(Counter(
+    "cache_requests_total",
+    "Consultas aos caches em memória por resultado (hit/miss).",
+    ("cache", "result"),
+))
+
+
+outbound_requests_in_flight = registry.register(Gauge(
+    "outbound_requests_in_flight",
+    "Chamadas a serviços externos em andamento.",
+    ("service",),
+))
+
+# total atual (todas as chamadas), lido pelo RateLimitMiddleware para descartar carga
+_outbound_in_flight = 0
+
+
+def outbound_in_flight() -> int:
+    return _outbound_in_flight
+
+
+def cache_hit(cache: str, hit: bool):
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+
+@contextmanager
+def track_outbound(service: str, operation: str):
+    global _outbound_in_flight
+
+    start = time.perf_counter()
+    outcome = "ok"
+
+    _outbound_in_flight += 1
+    outbound_requests_in_flight.inc(service)
+
+    try:
+        with tracer.span(f"{service} {operation}", kind="client", service=service):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        _outbound_in_flight -= 1
+        outbound_requests_in_flight.dec(service)
+        outbound_request_duration.observe(
+            service, operation, outcome, value=time.perf_counter() - start
+        )
+
+
+class MetricsMiddleware:
+    """Mede latência e concorrência; deve rodar dentro do RequestContextMiddleware."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = current_route.get()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(route)
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(route)
+            http_request_duration.observe(
+                scope["method"], route, str(status["code"]),
+                value=time.perf_counter() - start,
+            )
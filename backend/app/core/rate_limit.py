@@ -0,0 +1,318 @@
+"""
+Rate limit e descarte de carga das rotas caras (bcrypt, Melhor Envio,
+Mercado Pago, Google).
+
+`RateLimitMiddleware` (ASGI) casa o template da rota resolvido pelo
+RequestContextMiddleware com as regras de RATE_LIMITS
+("POST /api/auth/login=10/60:8" = 10 requisições a cada 60 s por
+cliente, no máximo 8 simultâneas no worker). Para cada requisição de uma
+rota limitada, nesta ordem:
+
+1. chamadas externas em andamento >= OUTBOUND_MAX_IN_FLIGHT → 503;
+2. requisições simultâneas da rota >= concorrência da regra → 503;
+3. token bucket do cliente (usuário do JWT, ou IP) vazio → 429.
+
+O IP vem de X-Forwarded-For contando RATE_LIMIT_PROXY_HOPS da direita
+(o que o proxy confiável anotou; o cliente só consegue pôr entradas à
+esquerda), ou da conexão quando não há proxy.
+
+As respostas levam Retry-After. Os baldes ficam em memória (por worker)
+ou, com RATE_LIMIT_STORE=mongo, na coleção `rate_limits`, atualizados de
+forma atômica e compartilhados entre workers; um cliente já recusado é
+recusado de novo sem ir ao Mongo até o Retry-After vencer. Se o Mongo
+falhar, o balde em memória assume. Rotas sem regra (catálogo) passam
+direto.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from starlette.responses import JSONResponse
+
+from app.core import config
+from app.core.metrics import Counter, outbound_in_flight, registry
+from app.core.request_context import current_request_id, current_route
+
+logger = logging.getLogger(__name__)
+
+# baldes em memória; os mais antigos saem primeiro
+MEMORY_MAX_KEYS = 100_000
+
+rate_limited = registry.register(Counter(
+    "rate_limited_total",
+    "Requisições recusadas pelo RateLimitMiddleware (rate/concurrency/outbound).",
+    ("route", "reason"),
+))
+
+
+class Rule:
+    def __init__(self, method: str, path: str, capacity: int, period: float, concurrency: int | None = None):
+        self.method = method
+        self.path = path
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.concurrency = concurrency
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+def parse_rules(spec: str) -> dict[tuple[str, str], Rule]:
+    rules = {}
+
+    for raw in spec.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+
+        try:
+            route, limit = raw.rsplit("=", 1)
+            method, path = route.split(None, 1)
+            limit, _, concurrency = limit.partition(":")
+            capacity, period = limit.split("/")
+
+            rule = Rule(
+                method.upper(),
+                path.strip(),
+                int(capacity),
+                float(period),
+                int(concurrency) if concurrency else None,
+            )
+        except ValueError:
+            logger.warning(f"Invalid rate limit rule ignored: {raw!r}")
+            continue
+
+        rules[(rule.method, rule.path)] = rule
+
+    return rules
+
+
+# =========================
+# BALDES
+# =========================
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rule: Rule) -> tuple[bool, float]:
+        """(permitido, segundos até o próximo token)."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (rule.capacity, now))
+        tokens = min(rule.capacity, tokens + (now - updated) * rule.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / rule.rate
+
+
+class MongoBucketStore:
+    """Balde compartilhado: recarga e consumo em um único update com pipeline."""
+
+    def __init__(self, fallback: MemoryBucketStore | None = None, max_keys: int = MEMORY_MAX_KEYS):
+        self.fallback = fallback or MemoryBucketStore()
+        self.max_keys = max_keys
+        # chave -> instante (monotonic) em que volta a ter token; outros
+        # workers só consomem, então antes disso a resposta é certamente não
+        self._blocked: OrderedDict[str, float] = OrderedDict()
+
+    async def take(self, key: str, rule: Rule) -> tuple[bool, float]:
+        blocked_until = self._blocked.get(key)
+
+        if blocked_until is not None:
+            remaining = blocked_until - time.monotonic()
+
+            if remaining > 0:
+                return False, remaining
+
+            del self._blocked[key]
+
+        allowed, retry_after = await self._take(key, rule)
+
+        if not allowed:
+            self._blocked[key] = time.monotonic() + retry_after
+            self._blocked.move_to_end(key)
+
+            while len(self._blocked) > self.max_keys:
+                self._blocked.popitem(last=False)
+
+        return allowed, retry_after
+
+    async def _take(self, key: str, rule: Rule) -> tuple[bool, float]:
+        from app.db.mongo import get_db
+
+        now = time.time()
+        refilled = {
+            "$min": [
+                rule.capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", rule.capacity]},
+                        {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$ts", now]}]}]}, rule.rate]},
+                    ]
+                },
+            ]
+        }
+
+        try:
+            doc = await get_db().rate_limits.find_one_and_update(
+                {"_id": key},
+                [
+                    {
+                        "$set": {
+                            "tokens": refilled,
+                            "ts": now,
+                            # TTL: balde parado há um período inteiro já estaria cheio
+                            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=rule.period),
+                        }
+                    },
+                    {
+                        "$set": {
+                            "allowed": {"$gte": ["$tokens", 1]},
+                            "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                        }
+                    },
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, using memory: {e}")
+            return await self.fallback.take(key, rule)
+
+        if doc["allowed"]:
+            return True, 0.0
+
+        return False, (1 - doc["tokens"]) / rule.rate
+
+
+def build_store():
+    if config.RATE_LIMIT_STORE == "mongo":
+        return MongoBucketStore()
+    return MemoryBucketStore()
+
+
+# =========================
+# CLIENTE
+# =========================
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers") or []:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope) -> str:
+    """Usuário do JWT (assinatura conferida), ou IP do cliente."""
+    authorization = _header(scope, b"authorization")
+
+    if authorization and authorization.startswith("Bearer "):
+        from jose import JWTError, jwt
+
+        from app.routes.auth import ALGORITHM, SECRET_KEY
+
+        try:
+            sub = jwt.decode(authorization[7:].strip(), SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            sub = None
+
+        if sub:
+            return f"user:{sub}"
+
+    return f"ip:{client_ip(scope)}"
+
+
+def client_ip(scope, hops: int | None = None) -> str:
+    """IP do cliente visto pelo proxy confiável mais externo."""
+    hops = config.RATE_LIMIT_PROXY_HOPS if hops is None else hops
+    forwarded = _header(scope, b"x-forwarded-for") if hops > 0 else None
+
+    if forwarded:
+        chain = [ip.strip() for ip in forwarded.split(",") if ip.strip()]
+
+        # cada proxy acrescenta à direita quem se conectou a ele
+        if chain:
+            return chain[-min(hops, len(chain))]
+
+    client = scope.get("client")
+    return client[0] if client else "-"
+
+
+# =========================
+# MIDDLEWARE
+# =========================
+
+def _reject(status: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail, "request_id": current_request_id.get()},
+        status_code=status,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class RateLimitMiddleware:
+    """Deve rodar dentro do RequestContextMiddleware (usa o template da rota)."""
+
+    def __init__(self, app, rules: dict[tuple[str, str], Rule] | None = None, store=None):
+        self.app = app
+        self.rules = parse_rules(config.RATE_LIMITS) if rules is None else rules
+        self.store = store or build_store()
+        self._active: dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = current_route.get()
+        rule = self.rules.get((scope["method"], route))
+
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        response = await self._check(scope, rule, route)
+
+        if response is not None:
+            return await response(scope, receive, send)
+
+        self._active[rule.name] = self._active.get(rule.name, 0) + 1
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._active[rule.name] -= 1
+
+    async def _check(self, scope, rule: Rule, route: str) -> JSONResponse | None:
+        if outbound_in_flight() >= config.OUTBOUND_MAX_IN_FLIGHT:
+            rate_limited.inc(route, "outbound")
+            return _reject(503, "Servidor ocupado. Tente novamente em instantes.", 1)
+
+        if rule.concurrency and self._active.get(rule.name, 0) >= rule.concurrency:
+            rate_limited.inc(route, "concurrency")
+            return _reject(503, "Servidor ocupado. Tente novamente em instantes.", 1)
+
+        allowed, retry_after = await self.store.take(f"{rule.name}|{client_key(scope)}", rule)
+
+        if not allowed:
+            rate_limited.inc(route, "rate")
+            logger.info(f"Rate limited {rule.name}")
+            return _reject(429, "Muitas requisições. Tente novamente em instantes.", retry_after)
+
+        return None
@@ -0,0 +1,89 @@
+"""
+Contexto por requisição (rota atual e request id), acessível de qualquer camada.
+
+O middleware resolve o template da rota (ex.: /api/orders/{order_id})
+antes de chamar a aplicação e o guarda em uma ContextVar. Motor copia o
+contexto para as threads do executor, então até os listeners de comandos
+do pymongo enxergam a rota que originou a consulta.
+
+O request id vem do header X-Request-ID (quando válido) ou é gerado; ele
+volta no header da resposta, nos logs (RequestIdLogFilter) e no corpo
+das respostas de erro.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import uuid
+from contextvars import ContextVar
+
+from starlette.routing import Match
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{8,64}$")
+
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+current_request_id: ContextVar[str] = ContextVar("current_request_id", default="-")
+
+
+def _request_id_from(scope) -> str:
+    for name, value in scope.get("headers") or []:
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1")
+            if _REQUEST_ID_RE.match(candidate):
+                return candidate
+            break
+
+    return uuid.uuid4().hex
+
+
+def request_id_of(request) -> str:
+    """Request id de uma Request, mesmo fora do contexto (handlers de erro)."""
+    return request.scope.get("state", {}).get("request_id") or current_request_id.get()
+
+
+class RequestIdLogFilter(logging.Filter):
+    def filter(self, record):
+        # não sobrescreve o id capturado antes do registro passar pela fila
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id.get()
+        return True
+
+
+def resolve_route_template(app, scope) -> str:
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+
+        if match == Match.FULL:
+            return getattr(route, "path", scope.get("path", "-"))
+
+    return "unmatched"
+
+
+class RequestContextMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        router_app = scope.get("app") or self.app
+        request_id = _request_id_from(scope)
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        route_token = current_route.set(resolve_route_template(router_app, scope))
+        id_token = current_request_id.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_route.reset(route_token)
+            current_request_id.reset(id_token)
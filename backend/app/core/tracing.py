@@ -0,0 +1,327 @@
+"""
+Tracing por requisição no estilo OpenTelemetry, sem dependências externas.
+
+Cada requisição HTTP abre um span raiz (TracingMiddleware); funções de
+serviço decoradas com `@traced`, chamadas externas (`track_outbound`) e
+comandos do Mongo (listener em app.db.monitoring) viram spans filhos.
+O span atual fica em uma ContextVar, então a hierarquia acompanha
+`await`, tasks e as threads do executor do Motor.
+
+A decisão de amostragem é feita no span raiz (TRACE_SAMPLE_RATE, ou o
+flag do header `traceparent` quando presente). Traces não amostrados
+mantêm apenas os ids. Traces completos vão para os exporters
+configurados em TRACE_EXPORTERS: "memory" (GET /api/admin/traces) e/ou
+"console" (log JSON).
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core.config import TRACE_BUFFER_SIZE, TRACE_EXPORTERS, TRACE_SAMPLE_RATE
+from app.core.request_context import current_request_id, current_route
+
+logger = logging.getLogger("backend.tracing")
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# limite de spans por trace (listagens grandes geram muitos comandos)
+MAX_SPANS_PER_TRACE = 500
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "attributes",
+        "start", "end", "duration_ms", "status", "error", "sampled",
+        "_root", "_children", "_perf",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, sampled: bool, root=None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes: dict = {}
+        self.start = time.time()
+        self.end: float | None = None
+        self.duration_ms: float | None = None
+        self.status = "ok"
+        self.error: str | None = None
+        self.sampled = sampled
+        self._root = root or self
+        self._children: list[Span] | None = [] if root is None else None
+        self._perf = time.perf_counter()
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException):
+        self.status = "error"
+        self.error = f"{type(exc).__name__}: {exc}"[:300]
+
+    def finish(self, duration_s: float | None = None):
+        if duration_s is None:
+            duration_s = time.perf_counter() - self._perf
+
+        self.duration_ms = round(duration_s * 1000.0, 3)
+        self.end = self.start + duration_s
+
+        if self._root is not self:
+            children = self._root._children
+            if len(children) < MAX_SPANS_PER_TRACE:
+                children.append(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span devolvido quando a requisição não foi amostrada."""
+
+    sampled = False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_error(self, exc: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+# ======================================
+# EXPORTERS
+# ======================================
+
+class InMemoryExporter:
+    def __init__(self, maxlen: int = TRACE_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._traces: deque = deque(maxlen=maxlen)
+
+    def export(self, trace: dict):
+        with self._lock:
+            self._traces.append(trace)
+
+    def traces(self, limit: int = 50, min_ms: float = 0.0, route: str | None = None) -> list[dict]:
+        with self._lock:
+            items = list(self._traces)
+
+        items = [
+            t for t in reversed(items)
+            if t["duration_ms"] >= min_ms and (route is None or t["route"] == route)
+        ]
+
+        return [
+            {k: t[k] for k in ("trace_id", "request_id", "name", "route", "status", "start", "duration_ms")}
+            | {"spans": len(t["spans"])}
+            for t in items[:limit]
+        ]
+
+    def get(self, trace_id: str) -> dict | None:
+        with self._lock:
+            for t in self._traces:
+                if t["trace_id"] == trace_id:
+                    return t
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+class ConsoleExporter:
+    def export(self, trace: dict):
+        logger.info(json.dumps(trace, default=str, ensure_ascii=False))
+
+
+# ======================================
+# TRACER
+# ======================================
+
+class Tracer:
+    def __init__(self, sample_rate: float = 1.0, exporters: list | None = None):
+        self.sample_rate = sample_rate
+        self.exporters = exporters or []
+
+    def _should_sample(self) -> bool:
+        if not self.exporters:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def start_trace(self, name: str, traceparent: str | None = None) -> Span:
+        """Cria o span raiz, continuando o trace do header `traceparent` se vier."""
+        parent_id = None
+        match = TRACEPARENT_RE.match(traceparent or "")
+
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1) and bool(self.exporters)
+        else:
+            trace_id = _new_id(16)
+            sampled = self._should_sample()
+
+        return Span(name, trace_id, parent_id, sampled)
+
+    def end_trace(self, root: Span):
+        root.finish()
+
+        if not root.sampled:
+            return
+
+        spans = [root.to_dict()] + [s.to_dict() for s in root._children]
+        trace = {
+            "trace_id": root.trace_id,
+            "request_id": root.attributes.get("request_id"),
+            "name": root.name,
+            "route": root.attributes.get("http.route"),
+            "status": root.status,
+            "start": root.start,
+            "duration_ms": root.duration_ms,
+            "spans": spans,
+        }
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.warning(f"Trace exporter failed: {e}")
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = current_span.get()
+
+        if parent is None or not parent.sampled:
+            yield NOOP_SPAN
+            return
+
+        span = Span(name, parent.trace_id, parent.span_id, True, root=parent._root)
+        span.attributes.update(attributes)
+        token = current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            span.finish()
+
+    def record(self, name: str, duration_s: float, attributes: dict | None = None, failed: bool = False):
+        """Registra um span já concluído (ex.: comando do Mongo medido pelo listener)."""
+        parent = current_span.get()
+
+        if parent is None or not parent.sampled:
+            return
+
+        span = Span(name, parent.trace_id, parent.span_id, True, root=parent._root)
+        span.start = time.time() - duration_s
+        span.attributes.update(attributes or {})
+
+        if failed:
+            span.status = "error"
+
+        span.finish(duration_s)
+
+
+def _build_exporters() -> list:
+    exporters = []
+
+    for name in (n.strip().lower() for n in TRACE_EXPORTERS.split(",")):
+        if name == "memory":
+            exporters.append(memory_exporter)
+        elif name == "console":
+            exporters.append(ConsoleExporter())
+        elif name:
+            logger.warning(f"Unknown trace exporter: {name}")
+
+    return exporters
+
+
+memory_exporter = InMemoryExporter()
+tracer = Tracer(TRACE_SAMPLE_RATE, _build_exporters())
+
+
+def traced(name: str | None = None):
+    """Decorator que envolve uma função assíncrona em um span."""
+
+    def decorator(fn):
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ======================================
+# MIDDLEWARE
+# ======================================
+
+class TracingMiddleware:
+    """Abre o span raiz da requisição; deve rodar dentro do RequestContextMiddleware."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        route = current_route.get()
+
+        root = tracer.start_trace(f"{scope['method']} {route}", traceparent)
+        root.set_attribute("http.method", scope["method"])
+        root.set_attribute("http.route", route)
+        root.set_attribute("request_id", current_request_id.get())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = "error"
+            await send(message)
+
+        token = current_span.set(root)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.record_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            tracer.end_trace(root)
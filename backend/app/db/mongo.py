@@ -4,17 +4,42 @@ import logging
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi import HTTPException
+from pymongo import read_preferences
 
-from app.core.config import MONGO_URL, DB_NAME
+from app.core import config
+from app.core.config import MONGO_URL, DB_NAME, IDEMPOTENCY_TTL_SECONDS
+from app.db.monitoring import mongo_monitor, mongo_pool_monitor
+from app.services.webhook_ledger import NOTIFICATION_TTL_SECONDS
 
 logger = logging.getLogger("backend")
 
 _client: AsyncIOMotorClient | None = None
 _db = None
+_catalog_db = None
+
+
+def _write_concern_w():
+    w = config.MONGO_WRITE_CONCERN_W
+    return int(w) if w.isdigit() else w
+
+
+def _create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        MONGO_URL,
+        maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=config.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+        w=_write_concern_w(),
+        journal=config.MONGO_WRITE_CONCERN_JOURNAL,
+        event_listeners=[mongo_monitor, mongo_pool_monitor],
+    )
 
 
 def get_db():
-    global _client, _db
+    global _client, _db, _catalog_db
 
     if not MONGO_URL:
         raise HTTPException(
@@ -22,17 +47,85 @@ def get_db():
             detail="MONGO_URL is not set. Create backend/.env (see .env.example) or set it in your environment.",
         )
 
+    # normalmente já criado no lifespan; fallback para scripts/uso fora do app
     if _client is None:
         logger.info("Initializing Mongo client...")
-        _client = AsyncIOMotorClient(MONGO_URL)
+        _client = _create_client()
         _db = _client[DB_NAME]
+        _catalog_db = _client.get_database(
+            DB_NAME,
+            read_preference=read_preferences.make_read_preference(
+                read_preferences.read_pref_mode_from_name(config.MONGO_CATALOG_READ_PREFERENCE),
+                None,
+            ),
+        )
 
     return _db
 
 
+def get_catalog_db():
+    """Banco para leituras de catálogo, com a read preference configurada."""
+    get_db()
+    return _catalog_db
+
+
+async def init_db():
+    """Cria o cliente e abre as conexões antes do primeiro request."""
+    db = get_db()
+
+    await db.command("ping")
+
+    logger.info(
+        f"Mongo client ready (maxPoolSize={config.MONGO_MAX_POOL_SIZE}, "
+        f"minPoolSize={config.MONGO_MIN_POOL_SIZE})."
+    )
+
+
 def close_db():
-    global _client
+    global _client, _db, _catalog_db
     if _client is not None:
         _client.close()
         _client = None
-        logger.info("Mongo client closed.")
\ No newline at end of file
+        _db = None
+        _catalog_db = None
+        logger.info("Mongo client closed.")
+
+
+async def ensure_indexes():
+    db = get_db()
+
+    # listagem admin: ordenação keyset por (created_at, _id), com ou sem status
+    await db.orders.create_index([("created_at", -1), ("_id", -1)])
+    await db.orders.create_index([("status", 1), ("created_at", -1), ("_id", -1)])
+    await db.orders.create_index("melhor_envio.tracking_code", sparse=True)
+    await db.orders.create_index([("user_id", 1), ("created_at", -1)])
+    await db.orders.create_index("melhor_envio.cart_order_ids")
+
+    # baldes do rate limit compartilhado (RATE_LIMIT_STORE=mongo)
+    await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+
+    await db.carrier_events.create_index([("order_ids", 1), ("created_at", -1)])
+
+    await db.idempotency_keys.create_index(
+        "created_at",
+        expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS,
+    )
+
+    await db.payment_events.create_index(
+        [("provider", 1), ("payment_id", 1), ("status", 1)],
+        unique=True,
+    )
+
+    await db.payment_notifications.create_index([("provider", 1), ("key", 1)], unique=True)
+    await db.payment_notifications.create_index(
+        "created_at",
+        expireAfterSeconds=NOTIFICATION_TTL_SECONDS,
+    )
+
+    # multikey: um SKU só pode existir em uma variação de um produto
+    try:
+        await db.products.create_index("variations.sku", unique=True, sparse=True)
+    except Exception as e:
+        logger.warning(f"Unique index on variations.sku not created (SKUs duplicados?): {e}")
+
+    logger.info("Mongo indexes ensured.")
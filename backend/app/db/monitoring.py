@@ -0,0 +1,273 @@
+"""
+Instrumentação dos comandos do Mongo.
+
+`MongoCommandMonitor` é registrado como CommandListener no cliente Motor e
+alimenta o histograma `mongo_command_duration_seconds` do registry de
+app.core.metrics, por (comando, coleção, rota). Comandos acima de
+MONGO_SLOW_MS são logados com o formato do filtro (valores substituídos
+por "?") e ficam nos últimos eventos lentos expostos em
+GET /api/admin/metrics/mongo. `MongoPoolMonitor` mantém os gauges do
+pool de conexões no mesmo registry.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+from app.core.config import MONGO_SLOW_MS
+from app.core.metrics import Counter, Gauge, Histogram, registry
+from app.core.request_context import current_route
+from app.core.tracing import tracer
+
+logger = logging.getLogger("backend.mongo")
+
+# limites superiores dos buckets, em segundos (+Inf é acrescentado pelo Histogram)
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# comandos internos do driver que não interessam nas métricas
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+SLOW_LOG_SIZE = 50
+
+# onde cada comando guarda o filtro
+FILTER_KEYS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "delete": "deletes",
+    "update": "updates",
+    "aggregate": "pipeline",
+}
+
+
+def query_shape(value, depth: int = 0):
+    """Substitui valores por '?' preservando chaves e operadores."""
+    if depth > 6:
+        return "?"
+
+    if isinstance(value, dict):
+        return {k: query_shape(v, depth + 1) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, dict) for v in value):
+            return [query_shape(v, depth + 1) for v in value[:3]]
+        return ["?"]
+
+    return "?"
+
+
+def _command_filter(command_name: str, command: dict):
+    key = FILTER_KEYS.get(command_name)
+
+    if not key:
+        return None
+
+    value = command.get(key)
+
+    # update/delete: lista de statements com "q"
+    if command_name in ("update", "delete") and isinstance(value, list) and value:
+        value = value[0].get("q")
+
+    return query_shape(value)
+
+
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds",
+    "Latência dos comandos do Mongo por coleção e rota.",
+    ("command", "collection", "route"),
+    buckets=LATENCY_BUCKETS,
+))
+
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total",
+    "Comandos do Mongo que falharam, por coleção e rota.",
+    ("command", "collection", "route"),
+))
+
+mongo_pool_connections = registry.register(Gauge(
+    "mongo_pool_connections",
+    "Conexões abertas no pool do Mongo.",
+    ("address",),
+))
+
+mongo_pool_checked_out = registry.register(Gauge(
+    "mongo_pool_checked_out",
+    "Conexões do pool em uso.",
+    ("address",),
+))
+
+mongo_pool_checkout_failures = registry.register(Counter(
+    "mongo_pool_checkout_failures_total",
+    "Falhas ao obter conexão do pool.",
+))
+
+
+class MongoCommandMonitor(monitoring.CommandListener):
+    def __init__(self, slow_ms: float = MONGO_SLOW_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, tuple] = {}
+        # maior latência por série, só para o snapshot do admin
+        self._max_ms: dict[tuple[str, str, str], float] = {}
+        self.slow_commands: deque = deque(maxlen=SLOW_LOG_SIZE)
+
+    # ── pymongo callbacks (rodam nas threads do executor do Motor) ──
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+
+        collection = event.command.get(event.command_name)
+
+        if not isinstance(collection, str):
+            collection = "-"
+
+        info = (
+            collection,
+            current_route.get(),
+            _command_filter(event.command_name, event.command),
+        )
+
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = info
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            info = self._pending.pop((event.request_id, event.connection_id), None)
+
+        if info is None:
+            return
+
+        collection, route, shape = info
+        ms = event.duration_micros / 1000.0
+        key = (event.command_name, collection, route)
+
+        mongo_command_duration.observe(*key, value=ms / 1000.0)
+
+        if failed:
+            mongo_command_failures.inc(*key)
+
+        with self._lock:
+            self._max_ms[key] = max(self._max_ms.get(key, 0.0), ms)
+
+        tracer.record(
+            f"mongo.{event.command_name}",
+            ms / 1000.0,
+            {"db.collection": collection, "db.filter": shape},
+            failed=failed,
+        )
+
+        if ms >= self.slow_ms:
+            entry = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "command": event.command_name,
+                "collection": collection,
+                "route": route,
+                "duration_ms": round(ms, 3),
+                "filter": shape,
+                "failed": failed,
+            }
+            self.slow_commands.append(entry)
+            logger.warning(f"Slow Mongo command: {entry}")
+
+    # ── leitura ──
+
+    def snapshot(self) -> dict:
+        bounds = [("+Inf" if b == float("inf") else f"{b * 1000:g}") for b in mongo_command_duration.buckets]
+
+        with self._lock:
+            max_ms = dict(self._max_ms)
+            slow = list(self.slow_commands)
+
+        commands = []
+
+        for key, series in mongo_command_duration.series().items():
+            command, collection, route = key
+            count = series["count"]
+
+            commands.append({
+                "command": command,
+                "collection": collection,
+                "route": route,
+                "count": count,
+                "failures": int(mongo_command_failures.value(*key)),
+                "avg_ms": round(series["sum"] * 1000 / count, 3) if count else 0.0,
+                "max_ms": round(max_ms.get(key, 0.0), 3),
+                "buckets": dict(zip(bounds, series["buckets"])),
+            })
+
+        commands.sort(key=lambda item: item["count"] * item["avg_ms"], reverse=True)
+
+        return {
+            "slow_threshold_ms": self.slow_ms,
+            "commands": commands,
+            "slow_commands": slow,
+        }
+
+    def reset(self):
+        mongo_command_duration.reset()
+        mongo_command_failures.reset()
+
+        with self._lock:
+            self._max_ms.clear()
+            self.slow_commands.clear()
+
+
+mongo_monitor = MongoCommandMonitor()
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """Conexões abertas e em uso por servidor do pool do Motor."""
+
+    @staticmethod
+    def _address(event) -> str:
+        return f"{event.address[0]}:{event.address[1]}"
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(self._address(event))
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(self._address(event))
+
+    def connection_checked_out(self, event):
+        mongo_pool_checked_out.inc(self._address(event))
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(self._address(event))
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc()
+
+    # demais eventos do pool não alteram as contagens
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+mongo_pool_monitor = MongoPoolMonitor()
@@ -1,14 +1,32 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.cors import CORSMiddleware
 
-from app.core.config import CORS_ORIGINS, MONGO_URL
-from app.db.mongo import close_db
+from app.core.config import CORS_ORIGINS, MONGO_URL, TRACKING_REFRESH_ENABLED
+from app.core.health import mark_warm
+from app.core.http_client import close_clients
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.logging_config import setup_logging, stop_logging
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.request_context import RequestContextMiddleware, request_id_of
+from app.core.tracing import TracingMiddleware
+from app.db.mongo import close_db, ensure_indexes, get_db, init_db
 from app.services.image_sync import sync_images
+from app.services.order_events import order_events
+from app.services.rate_table import rate_table
+from app.services.sku_index import sku_index
+from app.services.tracking_refresh import tracking_refresher
 
 from app.routes.products import router as products_router
 from app.routes.shipping import router as shipping_router
@@ -19,16 +37,66 @@ from app.routes.webhooks import router as webhooks_router
 from app.routes.auth import router as auth_router
 from app.routes.addresses import router as addresses_router
 from app.routes.admin import router as admin_router
+from app.routes.stock import router as stock_router
+from app.routes.health import router as health_router
 
 
 # ======================================
 # LOGGING
 # ======================================
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+setup_logging()
+
+# ======================================
+# STARTUP / SHUTDOWN
+# ======================================
+
+def _sync_images_on_startup():
+    try:
+        from pymongo import MongoClient
+        client = MongoClient(MONGO_URL)
+        db_name = MONGO_URL.split("/")[-1].split("?")[0] or "moldz3d"
+        col = client[db_name]["products"]
+        results = sync_images(col)
+        client.close()
+        logging.info(f"Image sync on startup: {results}")
+    except Exception as e:
+        logging.warning(f"Image sync on startup failed (non-fatal): {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # abre o pool do Mongo antes de aceitar tráfego
+    try:
+        await init_db()
+    except Exception as e:
+        logging.warning(f"Mongo not reachable on startup: {e}")
+
+    await asyncio.to_thread(_sync_images_on_startup)
+
+    try:
+        await ensure_indexes()
+        await sku_index.rebuild(get_db())
+        await rate_table.load(get_db())
+    except Exception as e:
+        logging.warning(f"Index creation on startup failed (non-fatal): {e}")
+
+    if TRACKING_REFRESH_ENABLED:
+        tracking_refresher.start(get_db)
+
+    order_events.start(get_db)
+
+    # a partir daqui /health/ready libera tráfego para este worker
+    mark_warm()
+
+    yield
+
+    await tracking_refresher.stop()
+    await order_events.stop()
+    await close_clients()
+    close_db()
+    stop_logging()
+
 
 # ======================================
 # APP
@@ -37,22 +105,70 @@ logging.basicConfig(
 app = FastAPI(
     title="Modelo Loja API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
+# ordem importa: o último adicionado é o mais externo, então rota e
+# request id já estão resolvidos quando RateLimit/Metrics/Tracing rodam
+# (e as recusas do RateLimit entram nas métricas)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+
 # ======================================
 # CORS
 # ======================================
 
+# por último = mais externo: 429/503 do RateLimit também levam os headers
+# de CORS (sem eles o navegador esconde a resposta e o Retry-After)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=[origin.strip() for origin in CORS_ORIGINS.split(",")] if CORS_ORIGINS else ["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Retry-After"],
 )
 
 
+# ======================================
+# ERROS — sempre com o request id
+# ======================================
+
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    return JSONResponse(
+        {"detail": exc.detail, "request_id": request_id_of(request)},
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
+    )
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    return JSONResponse(
+        {"detail": jsonable_encoder(exc.errors()), "request_id": request_id_of(request)},
+        status_code=422,
+    )
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    request_id = request_id_of(request)
+    logging.getLogger("backend").error(
+        f"Unhandled error on {request.method} {request.url.path} [{request_id}]: {exc!r}"
+    )
+    # roda fora do RequestContextMiddleware, então o header vai aqui
+    return JSONResponse(
+        {"detail": "Erro interno do servidor.", "request_id": request_id},
+        status_code=500,
+        headers={"X-Request-ID": request_id},
+    )
+
+
 # ======================================
 # STATIC FILES (IMAGENS DOS PRODUTOS)
 # ======================================
@@ -77,40 +193,18 @@ app.include_router(webhooks_router)
 app.include_router(auth_router)
 app.include_router(addresses_router)
 app.include_router(admin_router)
+app.include_router(stock_router)
+app.include_router(health_router)
 
 
 
 # ======================================
-# HEALTH CHECK (PROFISSIONAL)
-# ======================================
-
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
-
-
-# ======================================
-# STARTUP — sincroniza imagens automaticamente
-# ======================================
-
-@app.on_event("startup")
-async def startup_sync_images():
-    try:
-        from pymongo import MongoClient
-        client = MongoClient(MONGO_URL)
-        db_name = MONGO_URL.split("/")[-1].split("?")[0] or "moldz3d"
-        col = client[db_name]["products"]
-        results = sync_images(col)
-        client.close()
-        logging.info(f"Image sync on startup: {results}")
-    except Exception as e:
-        logging.warning(f"Image sync on startup failed (non-fatal): {e}")
-
-
-# ======================================
-# SHUTDOWN
+# METRICS (PROMETHEUS)
 # ======================================
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    close_db()
\ No newline at end of file
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
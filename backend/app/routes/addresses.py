@@ -4,6 +4,7 @@ from datetime import datetime, timezone
 
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
+from pymongo import ReturnDocument
 
 from app.db.mongo import get_db
 from app.routes.auth import get_current_user
@@ -75,9 +76,9 @@ async def create_address(body: AddressCreate, current_user=Depends(get_current_u
         )
 
     result = await db.addresses.insert_one(payload)
-    doc = await db.addresses.find_one({"_id": result.inserted_id})
+    payload["_id"] = result.inserted_id
 
-    return serialize_address(doc)
+    return serialize_address(payload)
 
 
 @router.put("/{address_id}", response_model=AddressOut)
@@ -89,14 +90,6 @@ async def update_address(address_id: str, body: AddressUpdate, current_user=Depe
     except Exception:
         raise HTTPException(status_code=400, detail="address_id inválido.")
 
-    current = await db.addresses.find_one({
-        "_id": _id,
-        "user_id": str(current_user["_id"]),
-    })
-
-    if not current:
-        raise HTTPException(status_code=404, detail="Endereço não encontrado.")
-
     update_data = {
         k: v for k, v in body.model_dump(exclude_unset=True).items()
     }
@@ -106,18 +99,21 @@ async def update_address(address_id: str, body: AddressUpdate, current_user=Depe
 
     update_data["updated_at"] = utcnow()
 
-    if update_data.get("is_default") is True:
-        await db.addresses.update_many(
-            {"user_id": str(current_user["_id"])},
-            {"$set": {"is_default": False, "updated_at": utcnow()}},
-        )
-
-    await db.addresses.update_one(
+    doc = await db.addresses.find_one_and_update(
         {"_id": _id, "user_id": str(current_user["_id"])},
         {"$set": update_data},
+        return_document=ReturnDocument.AFTER,
     )
 
-    doc = await db.addresses.find_one({"_id": _id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Endereço não encontrado.")
+
+    if update_data.get("is_default") is True:
+        await db.addresses.update_many(
+            {"user_id": str(current_user["_id"]), "_id": {"$ne": _id}},
+            {"$set": {"is_default": False, "updated_at": update_data["updated_at"]}},
+        )
+
     return serialize_address(doc)
 
 
@@ -4,15 +4,31 @@ import cloudinary
 import cloudinary.uploader
 from bson import ObjectId
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from pymongo.errors import DuplicateKeyError
+from typing import List, Literal, Optional
 
 from app.core.config import (
     CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET
 )
-from app.db.mongo import get_db
+from app.core.metrics import track_outbound
+from app.core.tracing import memory_exporter
+from app.db.mongo import get_catalog_db, get_db
+from app.db.monitoring import mongo_monitor
 from app.routes.auth import get_current_user
+from app.services.carrier_events import list_carrier_events
+from app.services.catalog_import import CatalogImportError, import_catalog
+from app.services.label_store import label_response, label_store
+from app.services.order_service import ensure_carrier_cart, get_order
+from app.services.shipping_batch import run_shipping_batch
+from app.services.sku_index import sku_index
+from app.services.tracking_refresh import refresh_tracking, tracking_refresher
+from app.services.export_service import (
+    EXPORT_FORMATS, export_orders, export_products, gzip_stream,
+)
 
 # ── Cloudinary config ─────────────────────────────────────────
 cloudinary.config(
@@ -68,6 +84,13 @@ class ProductPatch(BaseModel):
     active: Optional[bool] = None
 
 
+class ShippingBatchPayload(BaseModel):
+    order_ids: Optional[List[str]] = None
+    status: Optional[str] = "paid"
+    steps: List[Literal["checkout", "generate", "print"]] = ["checkout", "generate", "print"]
+    include_labeled: Optional[bool] = None
+
+
 # ── Helper ────────────────────────────────────────────────────
 
 def _fmt(p: dict) -> dict:
@@ -79,6 +102,22 @@ def _now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+async def _duplicate_sku(db, e: DuplicateKeyError, variations: list | None, product_id=None) -> HTTPException:
+    """409 com o SKU que já existe em outro produto (índice único variations.sku)."""
+    sku = ((e.details or {}).get("keyValue") or {}).get("variations.sku")
+
+    if sku is None and variations:
+        query = {"variations.sku": {"$in": [v["sku"] for v in variations]}}
+        if product_id is not None:
+            query["_id"] = {"$ne": product_id}
+
+        other = await db.products.find_one(query, {"variations.sku": 1})
+        taken = {v.get("sku") for v in (other or {}).get("variations", [])}
+        sku = next((v["sku"] for v in variations if v["sku"] in taken), None)
+
+    return HTTPException(status_code=409, detail=f"SKU já cadastrado em outro produto: {sku}")
+
+
 # ── Image upload ──────────────────────────────────────────────
 
 @router.post("/images/upload")
@@ -90,17 +129,19 @@ async def upload_image(
         raise HTTPException(status_code=503, detail="Cloudinary não configurado.")
 
     contents = await file.read()
-    result = cloudinary.uploader.upload(
-        contents,
-        folder="moldz3d/products",
-        resource_type="image",
-    )
+    with track_outbound("cloudinary", "upload"):
+        result = cloudinary.uploader.upload(
+            contents,
+            folder="moldz3d/products",
+            resource_type="image",
+        )
     return {"url": result["secure_url"], "public_id": result["public_id"]}
 
 
 @router.delete("/images/{public_id:path}")
 async def delete_image(public_id: str, _admin=Depends(get_admin_user)):
-    cloudinary.uploader.destroy(public_id)
+    with track_outbound("cloudinary", "destroy"):
+        cloudinary.uploader.destroy(public_id)
     return {"deleted": True}
 
 
@@ -131,7 +172,13 @@ async def create_product(payload: ProductPayload, _admin=Depends(get_admin_user)
     doc = payload.model_dump()
     doc["created_at"] = now
     doc["updated_at"] = now
-    result = await db.products.insert_one(doc)
+
+    try:
+        result = await db.products.insert_one(doc)
+    except DuplicateKeyError as e:
+        raise await _duplicate_sku(db, e, doc["variations"])
+
+    sku_index.invalidate()
     doc["id"] = str(result.inserted_id)
     doc.pop("_id", None)
     return doc
@@ -146,12 +193,17 @@ async def update_product(
     db = get_db()
     data = payload.model_dump()
     data["updated_at"] = _now()
-    result = await db.products.update_one(
-        {"_id": ObjectId(product_id)},
-        {"$set": data},
-    )
+    _id = ObjectId(product_id)
+
+    try:
+        result = await db.products.update_one({"_id": _id}, {"$set": data})
+    except DuplicateKeyError as e:
+        raise await _duplicate_sku(db, e, data.get("variations"), _id)
+
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
+    sku_index.invalidate()
     return {"updated": True}
 
 
@@ -164,21 +216,49 @@ async def patch_product(
     db = get_db()
     data = {k: v for k, v in payload.model_dump().items() if v is not None}
     data["updated_at"] = _now()
-    result = await db.products.update_one(
-        {"_id": ObjectId(product_id)},
-        {"$set": data},
-    )
+    _id = ObjectId(product_id)
+
+    try:
+        result = await db.products.update_one({"_id": _id}, {"$set": data})
+    except DuplicateKeyError as e:
+        raise await _duplicate_sku(db, e, data.get("variations"), _id)
+
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
+    sku_index.invalidate()
     return {"updated": True}
 
 
+@router.post("/products/import")
+async def import_products(
+    file: UploadFile = File(...),
+    dry_run: bool = True,
+    _admin=Depends(get_admin_user),
+):
+    db = get_db()
+    contents = await file.read()
+
+    try:
+        report = await import_catalog(db, contents, file.filename or "", dry_run=dry_run)
+    except CatalogImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # gravação interrompida no meio: 207 com o que foi aplicado e os erros
+    if report.get("partial"):
+        return JSONResponse(status_code=207, content=jsonable_encoder(report))
+
+    return report
+
+
 @router.delete("/products/{product_id}")
 async def delete_product(product_id: str, _admin=Depends(get_admin_user)):
     db = get_db()
     result = await db.products.delete_one({"_id": ObjectId(product_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
+    sku_index.invalidate()
     return {"deleted": True}
 
 
@@ -197,3 +277,174 @@ async def get_stats(_admin=Depends(get_admin_user)):
         "users": users,
         "orders": orders,
     }
+
+
+# ── Metrics ───────────────────────────────────────────────────
+
+@router.get("/metrics/mongo")
+async def mongo_metrics(_admin=Depends(get_admin_user)):
+    return mongo_monitor.snapshot()
+
+
+@router.delete("/metrics/mongo")
+async def reset_mongo_metrics(_admin=Depends(get_admin_user)):
+    mongo_monitor.reset()
+    return {"reset": True}
+
+
+# ── Traces ────────────────────────────────────────────────────
+
+@router.get("/traces")
+async def list_traces(
+    limit: int = Query(default=50, ge=1, le=200),
+    min_ms: float = Query(default=0.0, ge=0),
+    route: Optional[str] = None,
+    _admin=Depends(get_admin_user),
+):
+    return memory_exporter.traces(limit=limit, min_ms=min_ms, route=route)
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, _admin=Depends(get_admin_user)):
+    trace = memory_exporter.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace não encontrado.")
+    return trace
+
+
+@router.delete("/traces")
+async def clear_traces(_admin=Depends(get_admin_user)):
+    memory_exporter.clear()
+    return {"reset": True}
+
+
+# ── Shipping em lote ──────────────────────────────────────────
+
+@router.post("/shipping/batches")
+async def create_shipping_batch(payload: ShippingBatchPayload, _admin=Depends(get_admin_user)):
+    if not payload.steps:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma etapa.")
+
+    db = get_db()
+    return await run_shipping_batch(
+        db,
+        order_ids=payload.order_ids,
+        status=payload.status,
+        steps=tuple(payload.steps),
+        include_labeled=payload.include_labeled,
+    )
+
+
+@router.get("/shipping/batches/{batch_id}/labels")
+async def shipping_batch_labels(batch_id: str, request: Request, _admin=Depends(get_admin_user)):
+    db = get_db()
+
+    try:
+        _id = ObjectId(batch_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="batch_id inválido.")
+
+    batch = await db.shipping_batches.find_one({"_id": _id}, {"label_file": 1})
+    label_file = (batch or {}).get("label_file")
+
+    if not label_file:
+        raise HTTPException(status_code=404, detail="Lote sem etiquetas.")
+
+    f = label_store.open(label_file["sha256"], label_file["content_type"])
+
+    if not f:
+        raise HTTPException(status_code=410, detail="PDF do lote expirou do cache; reimprima o lote.")
+
+    return label_response(f, label_file["content_type"], f"etiquetas_lote_{batch_id}.pdf", request.headers.get("range"))
+
+
+# ── Pedidos ───────────────────────────────────────────────────
+
+@router.get("/orders/{order_id}/carrier-events")
+async def order_carrier_events(order_id: str, _admin=Depends(get_admin_user)):
+    db = get_db()
+
+    try:
+        _id = ObjectId(order_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="order_id inválido.")
+
+    return await list_carrier_events(db, _id)
+
+
+@router.post("/orders/{order_id}/carrier-cart")
+async def retry_order_carrier_cart(order_id: str, _admin=Depends(get_admin_user)):
+    """Refaz o carrinho no Melhor Envio de um pedido pago (após cart_error)."""
+    db = get_db()
+    projection = {"status": 1, "melhor_envio.cart_order_ids": 1, "melhor_envio.cart_error": 1}
+
+    order = await get_order(db, order_id, projection)
+
+    if order.get("status") != "paid":
+        raise HTTPException(status_code=409, detail="Só pedidos pagos têm carrinho no Melhor Envio.")
+
+    doc = await ensure_carrier_cart(db, order, projection)
+    melhor_envio = doc.get("melhor_envio") or {}
+
+    return {
+        "order_id": order_id,
+        "cart_order_ids": melhor_envio.get("cart_order_ids") or [],
+        "cart_error": melhor_envio.get("cart_error"),
+    }
+
+
+# ── Rastreio ──────────────────────────────────────────────────
+
+@router.post("/tracking/refresh")
+async def refresh_tracking_now(_admin=Depends(get_admin_user)):
+    db = get_db()
+    return await refresh_tracking(db)
+
+
+@router.get("/tracking/refresh")
+async def tracking_refresh_status(_admin=Depends(get_admin_user)):
+    return {"last_run": tracking_refresher.last_run}
+
+
+# ── Export ────────────────────────────────────────────────────
+
+def _export_response(chunks, name: str, fmt: str, gzip: bool) -> StreamingResponse:
+    filename = f"{name}_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.{fmt}"
+    media_type = EXPORT_FORMATS[fmt]
+
+    if gzip:
+        chunks = gzip_stream(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@router.get("/export/orders")
+async def export_orders_route(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    gzip: bool = False,
+    _admin=Depends(get_admin_user),
+):
+    db = get_db()
+    chunks = export_orders(db, format, status, date_from, date_to)
+    return _export_response(chunks, "pedidos", format, gzip)
+
+
+@router.get("/export/products")
+async def export_products_route(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    active: Optional[bool] = None,
+    gzip: bool = False,
+    _admin=Depends(get_admin_user),
+):
+    db = get_catalog_db()
+    chunks = export_products(db, format, active)
+    return _export_response(chunks, "produtos", format, gzip)
@@ -5,13 +5,15 @@ from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 
+from app.core.metrics import track_outbound
 from app.db.mongo import get_db
 from app.schemas.auth import UserRegister, UserLogin, UserOut, AuthResponse
 
@@ -24,6 +26,10 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
+# token do EventSource (vai na query string): curto e preso a um pedido
+STREAM_TOKEN_EXPIRE_MINUTES = 5
+STREAM_TOKEN_SCOPE = "order_events"
+
 
 class GoogleAuthRequest(BaseModel):
     credential: str
@@ -48,6 +54,15 @@ def create_access_token(data: dict[str, Any]) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_stream_token(user_id: str, order_id: str) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(minutes=STREAM_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode(
+        {"sub": user_id, "scope": STREAM_TOKEN_SCOPE, "order_id": order_id, "exp": expire},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
 def serialize_user(user: dict[str, Any]) -> UserOut:
     return UserOut(
         id=str(user["_id"]),
@@ -63,8 +78,28 @@ async def get_current_user(authorization: str | None = Header(default=None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token ausente ou inválido.")
 
-    token = authorization.replace("Bearer ", "").strip()
+    return await user_from_token(authorization.replace("Bearer ", "").strip())
+
+
+async def get_current_user_stream(
+    order_id: str,
+    authorization: str | None = Header(default=None),
+    stream_token: str | None = Query(default=None),
+):
+    """
+    Como get_current_user, mas aceita ?stream_token= (EventSource não envia
+    headers). Só vale o token de stream do próprio pedido, nunca o de sessão.
+    """
+    if authorization and authorization.startswith("Bearer "):
+        return await user_from_token(authorization.replace("Bearer ", "").strip())
+
+    if not stream_token:
+        raise HTTPException(status_code=401, detail="Token ausente ou inválido.")
+
+    return await user_from_token(stream_token, scope=STREAM_TOKEN_SCOPE, order_id=order_id)
 
+
+async def user_from_token(token: str, scope: str | None = None, order_id: str | None = None):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
@@ -74,6 +109,10 @@ async def get_current_user(authorization: str | None = Header(default=None)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Token inválido.")
 
+    # token de sessão não serve na query string, e token de stream não serve como sessão
+    if payload.get("scope") != scope or (scope and payload.get("order_id") != order_id):
+        raise HTTPException(status_code=401, detail="Token inválido.")
+
     db = get_db()
 
     try:
@@ -111,7 +150,7 @@ async def register(body: UserRegister):
 
     result = await db.users.insert_one(doc)
 
-    user = await db.users.find_one({"_id": result.inserted_id})
+    user = {**doc, "_id": result.inserted_id}
     token = create_access_token({"sub": str(user["_id"])})
 
     return AuthResponse(
@@ -160,11 +199,12 @@ async def google_login(body: GoogleAuthRequest):
         )
 
     try:
-        token_info = id_token.verify_oauth2_token(
-            body.credential,
-            google_requests.Request(),
-            GOOGLE_CLIENT_ID,
-        )
+        with track_outbound("google", "verify_id_token"):
+            token_info = id_token.verify_oauth2_token(
+                body.credential,
+                google_requests.Request(),
+                GOOGLE_CLIENT_ID,
+            )
     except Exception:
         raise HTTPException(status_code=401, detail="Token do Google inválido.")
 
@@ -203,12 +243,11 @@ async def google_login(body: GoogleAuthRequest):
         if not user.get("provider") or user.get("provider") == "local":
             update_data["provider"] = "google"
 
-        await db.users.update_one(
+        user = await db.users.find_one_and_update(
             {"_id": user["_id"]},
             {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
         )
-
-        user = await db.users.find_one({"_id": user["_id"]})
     else:
         doc = {
             "name": name or "Usuário Google",
@@ -223,7 +262,7 @@ async def google_login(body: GoogleAuthRequest):
         }
 
         result = await db.users.insert_one(doc)
-        user = await db.users.find_one({"_id": result.inserted_id})
+        user = {**doc, "_id": result.inserted_id}
 
     token = create_access_token({"sub": str(user["_id"])})
 
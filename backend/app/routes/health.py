@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.health import backlog_snapshot, is_warm
+from app.db.mongo import get_db
+from app.services import melhor_envio as me
+
+router = APIRouter(tags=["health"])
+
+MONGO_PING_TIMEOUT = 1.0
+
+# load balancers podem consultar à vontade: o resultado vale por 1 s
+READY_CACHE_SECONDS = 1.0
+
+_ready_cache: dict = {"at": 0.0, "status_code": 503, "body": None}
+_ready_lock = asyncio.Lock()
+
+
+async def _check_mongo() -> dict:
+    start = time.perf_counter()
+
+    try:
+        await asyncio.wait_for(get_db().command("ping"), timeout=MONGO_PING_TIMEOUT)
+    except Exception as e:
+        return {"ok": False, "error": getattr(e, "detail", None) or type(e).__name__}
+
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+def _check_melhor_envio_token() -> dict:
+    doc = me.cached_token_doc()
+
+    if not doc or not doc.get("access_token"):
+        return {"ok": False, "connected": False}
+
+    expires_at = doc.get("expires_at")
+
+    if expires_at is None:
+        return {"ok": True, "connected": True, "expires_in": None}
+
+    expires_in = int(expires_at - time.time())
+
+    return {"ok": expires_in > 0, "connected": True, "expires_in": expires_in}
+
+
+async def _compute_readiness() -> tuple[int, dict]:
+    mongo = await _check_mongo()
+
+    # o token é lido do cache; só recarrega do Mongo se o cache expirou
+    if mongo["ok"]:
+        try:
+            await me.load_token_doc()
+        except Exception:
+            pass
+
+    token = _check_melhor_envio_token()
+    warm = is_warm()
+    ready = mongo["ok"] and warm
+
+    body = {
+        "status": ("ok" if token["ok"] else "degraded") if ready else "unavailable",
+        "warm": warm,
+        "checks": {
+            "mongo": mongo,
+            "melhor_envio_token": token,
+        },
+        "backlog": backlog_snapshot(),
+    }
+
+    return (200 if ready else 503), body
+
+
+# =========================
+# LIVENESS
+# =========================
+@router.get("/health")
+@router.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+
+# =========================
+# READINESS
+# =========================
+@router.get("/health/ready")
+async def health_ready():
+    async with _ready_lock:
+        if time.monotonic() - _ready_cache["at"] >= READY_CACHE_SECONDS:
+            status_code, body = await _compute_readiness()
+            _ready_cache.update(at=time.monotonic(), status_code=status_code, body=body)
+
+    return JSONResponse(status_code=_ready_cache["status_code"], content=_ready_cache["body"])
@@ -6,6 +6,7 @@ from urllib.parse import urlencode
 import httpx
 
 from app.core import config
+from app.core.metrics import track_outbound
 from app.services import melhor_envio as me
 from app.db.mongo import get_db
 
@@ -52,8 +53,9 @@ async def melhorenvio_callback(request: Request, code: str | None = None, state:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30) as http:
-            resp = await http.post(config.ME_TOKEN_URL, data=data)
+        with track_outbound("melhor_envio", "POST /oauth/token"):
+            async with httpx.AsyncClient(timeout=30) as http:
+                resp = await http.post(config.ME_TOKEN_URL, data=data)
             if resp.status_code >= 400:
                 return JSONResponse(
                     status_code=resp.status_code,
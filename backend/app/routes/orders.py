@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Depends
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
 
 from app.db.mongo import get_db
 from app.schemas.order import OrderCreate, OrderOut, OrderStatusPatch
@@ -10,11 +14,22 @@ from app.services.order_service import (
     update_order_status,
     to_order_out,
     list_orders,
+    ORDER_LIST_MAX_LIMIT,
     get_order_label,
     get_order_tracking,
     list_orders_by_user,
+    TRACKING_PROJECTION,
+)
+from app.routes.auth import (
+    STREAM_TOKEN_EXPIRE_MINUTES, create_stream_token, get_current_user, get_current_user_stream,
 )
-from app.routes.auth import get_current_user
+from app.services.idempotency import run_idempotent
+from app.services.order_events import event_stream, order_events, status_event
+from app.services.payment_service import schedule_preference
+
+logger = logging.getLogger(__name__)
+
+OWNER_PROJECTION = {"user_id": 1}
 
 router = APIRouter(
     prefix="/api/orders",
@@ -25,15 +40,32 @@ router = APIRouter(
 # LIST ORDERS (ADMIN)
 # =========================
 @router.get("")
-async def list_orders_route(status: str | None = None):
+async def list_orders_route(
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    q: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=ORDER_LIST_MAX_LIMIT),
+):
     db = get_db()
 
     try:
-        orders = await list_orders(db, status)
-        return orders
+        return await list_orders(
+            db,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            q=q,
+            cursor=cursor,
+            limit=limit,
+        )
 
-    except Exception as e:
-        print("❌ LIST ORDERS ERROR:", e)
+    except HTTPException:
+        raise
+
+    except Exception:
+        logger.exception("List orders failed")
         raise HTTPException(
             status_code=500,
             detail="Internal server error while listing orders"
@@ -49,8 +81,8 @@ async def list_my_orders_route(current_user=Depends(get_current_user)):
     try:
         return await list_orders_by_user(db, str(current_user["_id"]))
 
-    except Exception as e:
-        print("❌ LIST MY ORDERS ERROR:", e)
+    except Exception:
+        logger.exception("List user orders failed")
         raise HTTPException(
             status_code=500,
             detail="Internal server error while listing user orders"
@@ -60,10 +92,14 @@ async def list_my_orders_route(current_user=Depends(get_current_user)):
 # CREATE ORDER
 # =========================
 @router.post("", response_model=OrderOut)
-async def create_order_route(body: OrderCreate, current_user=Depends(get_current_user)):
+async def create_order_route(
+    body: OrderCreate,
+    current_user=Depends(get_current_user),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     db = get_db()
 
-    try:
+    async def _create() -> dict:
         payload = body.model_dump()
         payload["user_id"] = str(current_user["_id"])
 
@@ -75,13 +111,29 @@ async def create_order_route(body: OrderCreate, current_user=Depends(get_current
                 detail="Failed to create order"
             )
 
+        # deixa a preferência do Mercado Pago pronta antes do clique em "pagar"
+        schedule_preference(db, doc)
+
         return to_order_out(doc)
 
+    try:
+        if not idempotency_key:
+            return await _create()
+
+        return await run_idempotent(
+            db,
+            "orders.create",
+            idempotency_key,
+            str(current_user["_id"]),
+            body.model_dump(),
+            _create,
+        )
+
     except HTTPException:
         raise
 
-    except Exception as e:
-        print("❌ CREATE ORDER ERROR:", e)
+    except Exception:
+        logger.exception("Create order failed")
         raise HTTPException(
             status_code=500,
             detail="Internal server error while creating order"
@@ -114,8 +166,8 @@ async def get_order_route(order_id: str, current_user=Depends(get_current_user))
     except HTTPException:
         raise
 
-    except Exception as e:
-        print("❌ GET ORDER ERROR:", e)
+    except Exception:
+        logger.exception("Get order failed")
         raise HTTPException(
             status_code=500,
             detail="Internal server error while fetching order"
@@ -147,8 +199,8 @@ async def update_order_status_route(order_id: str, body: OrderStatusPatch):
     except HTTPException:
         raise
 
-    except Exception as e:
-        print("❌ UPDATE STATUS ERROR:", e)
+    except Exception:
+        logger.exception("Update order status failed")
         raise HTTPException(
             status_code=500,
             detail="Internal server error while updating order"
@@ -162,7 +214,7 @@ async def get_order_label_route(order_id: str, current_user=Depends(get_current_
     db = get_db()
 
     try:
-        order = await get_order(db, order_id)
+        order = await get_order(db, order_id, OWNER_PROJECTION)
 
         if order.get("user_id") != str(current_user["_id"]):
             raise HTTPException(
@@ -175,8 +227,8 @@ async def get_order_label_route(order_id: str, current_user=Depends(get_current_
     except HTTPException:
         raise
 
-    except Exception as e:
-        print("❌ GET LABEL ERROR:", e)
+    except Exception:
+        logger.exception("Get label failed")
         raise HTTPException(
             status_code=500,
             detail="Erro ao buscar etiqueta"
@@ -190,7 +242,7 @@ async def get_order_tracking_route(order_id: str, current_user=Depends(get_curre
     db = get_db()
 
     try:
-        order = await get_order(db, order_id)
+        order = await get_order(db, order_id, TRACKING_PROJECTION)
 
         if order.get("user_id") != str(current_user["_id"]):
             raise HTTPException(
@@ -198,14 +250,75 @@ async def get_order_tracking_route(order_id: str, current_user=Depends(get_curre
                 detail="Você não tem permissão para acessar este pedido"
             )
 
-        return await get_order_tracking(db, order_id)
+        return await get_order_tracking(db, order_id, order)
 
     except HTTPException:
         raise
 
-    except Exception as e:
-        print("❌ TRACKING ERROR:", e)
+    except Exception:
+        logger.exception("Get tracking failed")
         raise HTTPException(
             status_code=500,
             detail="Erro ao buscar tracking"
-        )
\ No newline at end of file
+        )
+# =========================
+# ORDER EVENTS TOKEN
+# =========================
+@router.post("/{order_id}/events/token")
+async def order_events_token_route(order_id: str, current_user=Depends(get_current_user)):
+    """Token curto para o EventSource, que só consegue mandar credencial na URL."""
+    db = get_db()
+
+    order = await get_order(db, order_id, OWNER_PROJECTION)
+
+    if order.get("user_id") != str(current_user["_id"]):
+        raise HTTPException(
+            status_code=403,
+            detail="Você não tem permissão para acessar este pedido"
+        )
+
+    return {
+        "stream_token": create_stream_token(str(current_user["_id"]), str(order["_id"])),
+        "expires_in": STREAM_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+# =========================
+# ORDER EVENTS (SSE)
+# =========================
+@router.get("/{order_id}/events")
+async def order_events_route(
+    order_id: str,
+    request: Request,
+    current_user=Depends(get_current_user_stream),
+):
+    db = get_db()
+
+    order = await get_order(db, order_id, OWNER_PROJECTION)
+
+    if order.get("user_id") != str(current_user["_id"]):
+        raise HTTPException(
+            status_code=403,
+            detail="Você não tem permissão para acessar este pedido"
+        )
+
+    key = str(order["_id"])
+    queue = order_events.subscribe(key)
+
+    try:
+        # relê depois de assinar: uma transição no meio do caminho não se perde
+        current = await db.orders.find_one({"_id": order["_id"]}, {"status": 1, "updated_at": 1})
+    except Exception:
+        order_events.unsubscribe(key, queue)
+        raise
+
+    snapshot = status_event(key, current["status"], current.get("updated_at"), "snapshot")
+
+    return StreamingResponse(
+        event_stream(key, queue, snapshot, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # nginx: não bufferizar o stream
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import logging
 from fastapi import APIRouter, HTTPException, Request
 from bson import ObjectId
 
 from app.db.mongo import get_db
-from app.services.payment_service import create_preference, get_payment
+from app.services.payment_service import ensure_preference, get_payment
+from app.services.order_state import InvalidTransition, mark_paid, transition
+from app.services.webhook_ledger import (
+    REVERSED_PAYMENT_STATUSES, already_final, claim_notification, forget_event,
+    notification_key, record_event, release_notification,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
+PROVIDER = "mercadopago"
+
 
 # =========================
 # CREATE PAYMENT (Generate MercadoPago Checkout)
@@ -22,29 +31,15 @@ async def create_payment(order_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido.")
 
-    order = await db.orders.find_one({"_id": _id})
+    order = await db.orders.find_one(
+        {"_id": _id},
+        {"items": 1, "total": 1, "mercado_pago": 1},
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
 
-    # 🔥 Criar preferência no MercadoPago
-    preference = await create_preference(order)
-
-    # 🔥 Salvar dados do pagamento no pedido
-    await db.orders.update_one(
-        {"_id": _id},
-        {
-            "$set": {
-                "payment_id": preference.get("id"),
-                "payment_provider": "mercadopago",
-                "updated_at": datetime.now(timezone.utc),
-                "mercado_pago": {
-                    "preference_id": preference.get("id"),
-                    "init_point": preference.get("init_point"),
-                    "sandbox_init_point": preference.get("sandbox_init_point"),
-                },
-            }
-        },
-    )
+    # reaproveita a preferência (normalmente já pré-criada junto com o pedido)
+    preference = await ensure_preference(db, order)
 
     return {
         "checkout_url": preference.get("init_point"),
@@ -69,13 +64,33 @@ async def mercado_pago_webhook(request: Request):
     if not payment_id:
         return {"ok": True}
 
+    payment_id = str(payment_id)
+
+    # MercadoPago reenvia a mesma notificação várias vezes
+    if await already_final(db, PROVIDER, payment_id):
+        return {"ok": True, "duplicate": True}
+
+    key = notification_key(data)
+
+    if key and not await claim_notification(db, PROVIDER, key):
+        return {"ok": True, "duplicate": True}
+
+    try:
+        return await _process_payment(db, payment_id)
+    except Exception:
+        if key:
+            await release_notification(db, PROVIDER, key)
+        raise
+
+
+async def _process_payment(db, payment_id: str) -> dict:
     #  Buscar detalhes completos do pagamento
     payment = await get_payment(payment_id)
 
     order_id = payment.get("external_reference")
     payment_status = payment.get("status")
 
-    if not order_id:
+    if not order_id or not payment_status:
         return {"ok": True}
 
     try:
@@ -83,17 +98,52 @@ async def mercado_pago_webhook(request: Request):
     except Exception:
         return {"ok": True}
 
+    if not await record_event(db, PROVIDER, payment_id, payment_status, order_id):
+        return {"ok": True, "duplicate": True}
+
     # 🔥 Atualizar apenas se aprovado
     if payment_status == "approved":
-        await db.orders.update_one(
-            {"_id": _id},
-            {
-                "$set": {
-                    "status": "paid",
-                    "payment_status": "paid",
-                    "updated_at": datetime.now(timezone.utc),
-                }
-            },
-        )
-
-    return {"ok": True}
\ No newline at end of file
+        try:
+            await mark_paid(
+                db,
+                _id,
+                source=PROVIDER,
+                payment_id=payment_id,
+                meta={"payment_status": payment_status},
+                extra_set={"mercado_pago.payment_id": payment_id},
+            )
+        except InvalidTransition as e:
+            # pedido já enviado/cancelado: nada a fazer, não pedir reenvio
+            logger.info(f"Mercado Pago webhook ignored: {e.detail}")
+        except Exception:
+            await forget_event(db, PROVIDER, payment_id, payment_status)
+            raise
+
+    # estorno/chargeback de um pagamento aprovado: o pedido não fica "paid".
+    # Pedidos pagos pelo admin/outro webhook não têm mercado_pago.payment_id;
+    # os pagos por outro pagamento do Mercado Pago não casam.
+    elif payment_status in REVERSED_PAYMENT_STATUSES:
+        try:
+            await transition(
+                db,
+                {
+                    "_id": _id,
+                    "payment_provider": PROVIDER,
+                    "mercado_pago.payment_id": {"$in": [payment_id, None]},
+                },
+                "cancelled",
+                PROVIDER,
+                meta={"payment_status": payment_status},
+                extra_set={"payment_status": payment_status},
+                projection={"status": 1},
+            )
+        except InvalidTransition as e:
+            logger.info(f"Mercado Pago webhook ignored: {e.detail}")
+        except HTTPException as e:
+            # outro pagamento do mesmo pedido: não mexe no status
+            logger.info(f"Mercado Pago webhook ignored for payment {payment_id}: {e.detail}")
+        except Exception:
+            await forget_event(db, PROVIDER, payment_id, payment_status)
+            raise
+
+    return {"ok": True}
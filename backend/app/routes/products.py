@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException
 
-from app.db.mongo import get_db
+from app.db.mongo import get_catalog_db, get_db
 from app.schemas.products import ProductCreate, ProductOut
 
 router = APIRouter(prefix="/api")
@@ -39,7 +39,7 @@ async def create_product(payload: ProductCreate):
 @router.get("/products", response_model=list[ProductOut])
 async def list_products(limit: int = 50):
 
-    db = get_db()
+    db = get_catalog_db()
 
     items = await db.products.find({}).limit(limit).to_list(limit)
 
@@ -63,7 +63,7 @@ async def list_products(limit: int = 50):
 @router.get("/products/{product_id}", response_model=ProductOut)
 async def get_product_by_id(product_id: str):
 
-    db = get_db()
+    db = get_catalog_db()
 
     try:
         _id = ObjectId(product_id)
@@ -89,7 +89,7 @@ async def get_product_by_id(product_id: str):
 @router.get("/public/products")
 async def list_public_products():
 
-    db = get_db()
+    db = get_catalog_db()
 
     products = []
 
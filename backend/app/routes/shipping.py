@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+
 from datetime import datetime, timezone
 from typing import Any, Dict
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from bson import ObjectId
 from bson.errors import InvalidId
 
@@ -11,6 +14,11 @@ from app.core import config
 from app.db.mongo import get_db
 
 from app.services import melhor_envio as me
+from app.services.cep_index import resolve_state, validate_cep
+from app.services.packing import me_volume, pack_items
+from app.services.quote_cache import quote_cache, quote_key
+from app.services.rate_table import rate_table
+from app.services.sku_index import find_variation
 from app.services.shipping_service import (
     checkout_shipping,
     generate_label_shipping,
@@ -23,6 +31,8 @@ from app.schemas.shipping import (
     CreateShipmentResponse,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api")
 
 # =====================================================
@@ -30,52 +40,87 @@ router = APIRouter(prefix="/api")
 # =====================================================
 async def find_product(db, product_id: str):
 
-    print("🔍 ID recebido:", product_id)
-
     prod = None
 
     # tenta buscar como ObjectId
     try:
         obj_id = ObjectId(product_id)
         prod = await db.products.find_one({"_id": obj_id})
-        print("Busca por ObjectId:", prod)
     except InvalidId:
-        print("ID não é ObjectId válido")
+        logger.debug(f"Product id is not an ObjectId: {product_id}")
 
     # fallback (caso tenha salvo como string)
     if not prod:
         prod = await db.products.find_one({"id": product_id})
-        print("Busca por campo id:", prod)
 
     # fallback final
     if not prod:
         prod = await db.products.find_one({"_id": product_id})
-        print("Busca por _id string:", prod)
 
     return prod
 
 
+def pick_variation(prod: dict, sku: str | None) -> dict:
+
+    if not prod.get("variations"):
+        raise HTTPException(status_code=400, detail="Produto sem variações.")
+
+    # sem SKU (clientes antigos): mantém a primeira variação
+    if not sku:
+        return prod["variations"][0]
+
+    variation = find_variation(prod, sku)
+
+    if not variation:
+        raise HTTPException(status_code=404, detail=f"Variação não encontrada: {sku}")
+
+    return variation
+
+
+def variation_item(prod: dict, variation: dict, quantity: int) -> dict:
+    """Variação no formato de item de pedido, para o empacotamento."""
+    return {
+        "sku": variation.get("sku"),
+        "name": prod.get("name"),
+        "quantity": int(quantity),
+        "unit_price": float(variation.get("price", 0)),
+        "weight_kg": float(variation["weight_kg"]),
+        "width_cm": float(variation["width_cm"]),
+        "height_cm": float(variation["height_cm"]),
+        "length_cm": float(variation["length_cm"]),
+    }
+
+
+def fallback_quote_or_raise(cache_key: tuple, to_cep: str, weight: float, error: HTTPException) -> dict:
+    """Última cotação igual; senão, estimativa da tabela de fretes; senão, o erro."""
+    cached = quote_cache.get(cache_key)
+
+    if cached:
+        logger.info(f"Serving cached quote ({error.status_code} from Melhor Envio)")
+        return {"options": cached["options"], "cached": True, "quoted_at": cached["quoted_at"]}
+
+    estimate = rate_table.estimate(to_cep, weight)
+
+    if estimate:
+        logger.info(f"Serving estimated quote ({error.status_code} from Melhor Envio)")
+        return estimate
+
+    raise error
+
+
 # =================================
 # CALCULAR FRETE
 # =================================
 @router.post("/shipping/quote")
 async def shipping_quote(body: QuoteRequest):
 
-    me.require_me_config()
-
-    to_cep = me.sanitize_cep(body.to_cep)
-
-    if len(to_cep) != 8:
-        raise HTTPException(status_code=400, detail="CEP inválido.")
+    to_cep = validate_cep(body.to_cep)
 
     if body.quantity < 1:
         raise HTTPException(status_code=400, detail="quantity inválido.")
 
     db = get_db()
 
-    products = await db.products.find().to_list(5)
-    print("📦 PRODUTOS NO BANCO:", products)
-
     # ---------------------------
     # BUSCAR PRODUTO
     # ---------------------------
@@ -87,15 +132,12 @@ async def shipping_quote(body: QuoteRequest):
             detail=f"Produto não encontrado no Mongo: {body.product_id}"
         )
 
-    print("✅ Produto encontrado:", prod.get("name"))
+    logger.debug(f"Quote for product {prod['_id']} ({prod.get('name')})")
 
     # ---------------------------
     # PEGAR VARIAÇÃO
     # ---------------------------
-    if not prod.get("variations"):
-        raise HTTPException(status_code=400, detail="Produto sem variações.")
-
-    variation = prod["variations"][0]
+    variation = pick_variation(prod, body.sku)
 
     from_cep = me.sanitize_cep(config.MELHOR_ENVIO_FROM_CEP)
 
@@ -104,27 +146,53 @@ async def shipping_quote(body: QuoteRequest):
     if insurance_value is None:
         insurance_value = float(variation.get("price", 0)) * int(body.quantity)
 
+    parcels = await asyncio.to_thread(pack_items, [variation_item(prod, variation, body.quantity)])
+
     payload: Dict[str, Any] = {
         "from": {"postal_code": from_cep},
         "to": {"postal_code": to_cep},
-        "products": [
-            {
-                "id": str(body.product_id),
-                "width": float(variation["width_cm"]),
-                "height": float(variation["height_cm"]),
-                "length": float(variation["length_cm"]),
-                "weight": float(variation["weight_kg"]),
-                "insurance_value": float(insurance_value),
-                "quantity": int(body.quantity),
-            }
-        ],
+        "volumes": [me_volume(parcel) for parcel in parcels],
+        "options": {
+            "insurance_value": float(insurance_value),
+            "receipt": False,
+            "own_hand": False,
+        },
     }
 
-    token_doc = await me.get_current_token_doc()
+    cache_key = quote_key(to_cep, body.product_id, body.sku, body.quantity, insurance_value)
+
+    weight = sum(parcel["billable_weight"] for parcel in parcels)
+
+    # página de produto: só a tabela, sem chamada ao Melhor Envio
+    if body.estimate:
+        estimate = rate_table.estimate(to_cep, weight)
+
+        if not estimate:
+            raise HTTPException(status_code=404, detail="Sem estimativa de frete para este CEP.")
+
+        return estimate
+
+    try:
+        me.require_me_config()
+        token_doc = await me.get_current_token_doc()
+    except HTTPException as e:
+        # sem configuração/token do Melhor Envio: só dá para estimar
+        return fallback_quote_or_raise(cache_key, to_cep, weight, e)
 
     url = f"{config.ME_BASE}/api/v2/me/shipment/calculate"
 
-    r = await me.http_post(url, payload, token_doc)
+    try:
+        r = await me.http_post(url, payload, token_doc, idempotent=True)
+    except HTTPException as e:
+        # circuito aberto / timeout: tenta a última cotação conhecida
+        if e.status_code < 500:
+            raise
+        return fallback_quote_or_raise(cache_key, to_cep, weight, e)
+
+    if r.status_code >= 500:
+        return fallback_quote_or_raise(
+            cache_key, to_cep, weight, HTTPException(status_code=r.status_code, detail=r.text)
+        )
 
     if r.status_code >= 400:
         raise HTTPException(status_code=r.status_code, detail=r.text)
@@ -144,6 +212,9 @@ async def shipping_quote(body: QuoteRequest):
                 "service": item.get("service"),
             })
 
+    quote_cache.put(cache_key, options)
+    rate_table.learn(db, to_cep, weight, options)
+
     return {"options": options}
 
 
@@ -156,10 +227,7 @@ async def shipping_create(body: CreateShipmentRequest):
     me.require_me_config()
     me.require_sender_config_for_cart()
 
-    to_cep = me.sanitize_cep(body.to_cep)
-
-    if len(to_cep) != 8:
-        raise HTTPException(status_code=400, detail="CEP inválido.")
+    to_cep = validate_cep(body.to_cep)
 
     if body.quantity < 1:
         raise HTTPException(status_code=400, detail="quantity inválido.")
@@ -181,13 +249,15 @@ async def shipping_create(body: CreateShipmentRequest):
             detail=f"Produto não encontrado: {body.product_id}"
         )
 
-    variation = prod["variations"][0]
+    variation = pick_variation(prod, body.sku)
 
     insurance_value = body.insurance_value
 
     if insurance_value is None:
         insurance_value = float(variation.get("price", 0)) * int(body.quantity)
 
+    parcels = await asyncio.to_thread(pack_items, [variation_item(prod, variation, body.quantity)])
+
     payload: Dict[str, Any] = {
         "service": int(body.service_id),
         "from": from_obj,
@@ -201,7 +271,7 @@ async def shipping_create(body: CreateShipmentRequest):
             "complement": body.receiver_complement,
             "district": body.receiver_district,
             "city": body.receiver_city,
-            "state_abbr": body.receiver_state,
+            "state_abbr": resolve_state(to_cep, body.receiver_state),
             "postal_code": to_cep,
         },
         "products": [
@@ -209,12 +279,9 @@ async def shipping_create(body: CreateShipmentRequest):
                 "name": prod["name"],
                 "quantity": int(body.quantity),
                 "unitary_value": float(variation.get("price", 0)),
-                "weight": float(variation["weight_kg"]),
-                "width": float(variation["width_cm"]),
-                "height": float(variation["height_cm"]),
-                "length": float(variation["length_cm"]),
             }
         ],
+        "volumes": [me_volume(parcel) for parcel in parcels],
         "options": {
             "insurance_value": float(insurance_value),
             "receipt": False,
@@ -266,8 +333,8 @@ async def shipping_generate_by_order(order_id: str):
 # BAIXAR ETIQUETA
 # =================================
 @router.get("/shipping/label/order/{order_id}")
-async def shipping_label_by_order(order_id: str):
+async def shipping_label_by_order(order_id: str, request: Request):
     db = get_db()
-    return await get_label_shipping(db, order_id)
+    return await get_label_shipping(db, order_id, request.headers.get("range"))
 
 
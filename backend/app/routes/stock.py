@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException
+
+from app.db.mongo import get_db
+from app.services.sku_index import get_stock
+
+router = APIRouter(prefix="/api", tags=["stock"])
+
+MAX_SKUS_PER_REQUEST = 100
+
+
+# =========================
+# STOCK BY SKU (BATCH)
+# =========================
+@router.get("/stock")
+async def stock_by_skus(skus: str):
+
+    requested = [s.strip() for s in skus.split(",") if s.strip()]
+
+    if not requested:
+        raise HTTPException(status_code=400, detail="Informe ao menos um SKU.")
+
+    if len(requested) > MAX_SKUS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {MAX_SKUS_PER_REQUEST} SKUs por consulta.",
+        )
+
+    db = get_db()
+
+    return {"items": await get_stock(db, requested)}
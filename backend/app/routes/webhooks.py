@@ -7,13 +7,19 @@ from fastapi import APIRouter, Request, HTTPException
 
 from app.db.mongo import get_db
 from app.core import config
-from app.services.order_service import update_order_status
+from app.services.order_state import InvalidTransition, mark_paid, transition
 
 router = APIRouter(
     prefix="/api/webhooks",
     tags=["webhooks"]
 )
 
+ME_EVENT_STATUS = {
+    "order.posted": "shipped",
+    "order.delivered": "delivered",
+    "order.cancelled": "cancelled",
+}
+
 
 def verify_signature(body: bytes, signature: str):
 
@@ -51,32 +57,28 @@ async def melhor_envio_webhook(request: Request):
 
     order_id_me = str(resource.get("id"))
 
-    db = get_db()
-
-    order = await db.orders.find_one({
-        "melhor_envio.cart_order_ids": order_id_me
-    })
-
-    if not order:
-        return {"status": "order_not_found"}
-
-    update = {}
-
-    if event == "order.posted":
-        update["status"] = "shipped"
+    target = ME_EVENT_STATUS.get(event)
 
-    elif event == "order.delivered":
-        update["status"] = "delivered"
-
-    elif event == "order.cancelled":
-        update["status"] = "cancelled"
+    if not target:
+        return {"status": "ignored"}
 
-    if update:
+    db = get_db()
 
-        await db.orders.update_one(
-            {"_id": order["_id"]},
-            {"$set": update}
+    try:
+        await transition(
+            db,
+            {"melhor_envio.cart_order_ids": order_id_me},
+            target,
+            source="melhorenvio",
+            meta={"event": event},
+            projection={"_id": 1, "status": 1},
         )
+    except InvalidTransition as e:
+        return {"status": "ignored", "reason": e.detail}
+    except HTTPException as e:
+        if e.status_code == 404:
+            return {"status": "order_not_found"}
+        raise
 
     return {
         "status": "ok"
@@ -102,14 +104,16 @@ async def payment_webhook(request: Request):
 
     if event == "payment.approved":
 
-        await update_order_status(
-            db,
-            order_id,
-            "paid",
-            meta={
-                "payment_id": payment_id
-            }
-        )
+        try:
+            await mark_paid(
+                db,
+                order_id,
+                source="payment_webhook",
+                payment_id=payment_id,
+                meta={"event": event},
+            )
+        except InvalidTransition as e:
+            return {"status": "ignored", "reason": e.detail}
 
         return {
             "status": "payment_confirmed",
@@ -5,8 +5,11 @@ from pydantic import BaseModel
 class QuoteRequest(BaseModel):
     to_cep: str
     product_id: str
+    sku: str | None = None
     quantity: int = 1
     insurance_value: float | None = None
+    # só a tabela de fretes (página de produto), sem chamada ao Melhor Envio
+    estimate: bool = False
 
 class QuoteResponse(BaseModel):
     raw: Any
@@ -14,6 +17,7 @@ class QuoteResponse(BaseModel):
 class CreateShipmentRequest(BaseModel):
     to_cep: str
     product_id: str
+    sku: str | None = None
     quantity: int = 1
     service_id: int
 
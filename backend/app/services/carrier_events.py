@@ -0,0 +1,68 @@
+"""
+Respostas brutas do Melhor Envio guardadas fora do pedido.
+
+O checkout e o generate devolvem payloads grandes que nenhuma tela usa.
+Antes ficavam embutidos em `melhor_envio.checkout` / `melhor_envio.label`
+e iam junto em toda leitura de pedido. Agora cada resposta vira um
+documento em `carrier_events` e o pedido guarda só um resumo com o
+`event_id` (GET /api/admin/orders/{id}/carrier-events mostra os brutos).
+
+Pedidos antigos são convertidos com scripts/migrar_payloads_transportadora.py.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+
+def checkout_summary(event_id: ObjectId, response, at: datetime, batch: bool = False) -> dict:
+    purchase = response.get("purchase", response) if isinstance(response, dict) else {}
+
+    return {
+        "event_id": event_id,
+        "purchase_id": purchase.get("id") if isinstance(purchase, dict) else None,
+        "batch": batch,
+        "at": at,
+    }
+
+
+def label_summary(event_id: ObjectId, at: datetime, batch: bool = False) -> dict:
+    # qualquer valor não nulo em melhor_envio.label marca "etiqueta gerada"
+    return {"event_id": event_id, "generated": True, "batch": batch, "at": at}
+
+
+def event_doc(order_ids: list[ObjectId], kind: str, payload, at: datetime | None = None) -> dict:
+    return {
+        "order_ids": list(order_ids),
+        "provider": "melhor_envio",
+        "kind": kind,
+        "payload": payload,
+        "created_at": at or datetime.now(timezone.utc),
+    }
+
+
+async def record_carrier_event(db, order_ids: list[ObjectId], kind: str, payload, at: datetime | None = None) -> ObjectId:
+    res = await db.carrier_events.insert_one(event_doc(order_ids, kind, payload, at))
+    return res.inserted_id
+
+
+async def list_carrier_events(db, order_id: ObjectId, limit: int = 50) -> list[dict]:
+    docs = await (
+        db.carrier_events.find({"order_ids": order_id})
+        .sort("created_at", -1)
+        .limit(limit)
+        .to_list(limit)
+    )
+
+    return [
+        {
+            "id": str(doc["_id"]),
+            "kind": doc["kind"],
+            "provider": doc["provider"],
+            "created_at": doc["created_at"],
+            "payload": doc["payload"],
+        }
+        for doc in docs
+    ]
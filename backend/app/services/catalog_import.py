@@ -0,0 +1,263 @@
+"""
+Importação em massa do catálogo de produtos.
+
+Lê arquivos CSV (uma linha por variação, mesmo layout da exportação) ou
+JSON (lista de produtos no formato de ProductCreate), valida cada produto,
+compara com os documentos atuais pelo SKU e monta as operações de
+`bulk_write`. O plano pode ser aplicado tanto pelo endpoint admin (Motor)
+quanto pelo script `scripts/importar_catalogo.py` (pymongo síncrono).
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.schemas.products import ProductCreate
+from app.services.sku_index import sku_index
+
+IMPORT_CHUNK_SIZE = 500
+
+# campos de produto comparados no diff (variações são comparadas inteiras)
+PRODUCT_FIELDS = ("name", "description", "categories", "images", "variations", "active")
+
+VARIATION_FIELDS = (
+    "sku", "model", "color", "size", "price", "stock", "active",
+    "weight_kg", "width_cm", "height_cm", "length_cm", "image",
+)
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def _split_list(value: str | None) -> list[str]:
+    return [v.strip() for v in (value or "").split("|") if v.strip()]
+
+
+def _parse_bool(value: str | None, default: bool = True) -> bool:
+    if value is None or str(value).strip() == "":
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "sim")
+
+
+def _rows_to_products(rows: list[dict]) -> list[dict]:
+    """Agrupa linhas de variação em produtos, pelo nome (ou product_id)."""
+    products: dict[str, dict] = {}
+
+    for row in rows:
+        key = (row.get("product_id") or row.get("name") or "").strip()
+
+        if key not in products:
+            products[key] = {
+                "name": (row.get("name") or "").strip(),
+                "description": row.get("description") or "",
+                "categories": _split_list(row.get("categories")),
+                "images": _split_list(row.get("images")),
+                "active": _parse_bool(row.get("active")),
+                "variations": [],
+            }
+
+        if row.get("sku"):
+            products[key]["variations"].append(
+                {
+                    "sku": row["sku"].strip(),
+                    "model": row.get("model") or "",
+                    "color": row.get("color") or "",
+                    "size": row.get("size") or "",
+                    "price": row.get("price"),
+                    "stock": row.get("stock") or 0,
+                    "active": _parse_bool(row.get("variation_active")),
+                    "weight_kg": row.get("weight_kg"),
+                    "width_cm": row.get("width_cm"),
+                    "height_cm": row.get("height_cm"),
+                    "length_cm": row.get("length_cm"),
+                    "image": row.get("image") or None,
+                }
+            )
+
+    return list(products.values())
+
+
+def parse_catalog(content: bytes, filename: str) -> list[dict]:
+    text = content.decode("utf-8-sig")
+
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+
+        if isinstance(data, dict):
+            data = data.get("products", [])
+
+        if not isinstance(data, list):
+            raise CatalogImportError("JSON deve ser uma lista de produtos.")
+
+        return data
+
+    if filename.lower().endswith(".csv"):
+        return _rows_to_products(list(csv.DictReader(io.StringIO(text))))
+
+    raise CatalogImportError("Formato não suportado (use .csv ou .json).")
+
+
+def validate_catalog(raw_products: list[dict]) -> tuple[list[dict], list[dict]]:
+    valid: list[dict] = []
+    errors: list[dict] = []
+    seen_skus: dict[str, str] = {}
+
+    for index, raw in enumerate(raw_products):
+        name = raw.get("name") if isinstance(raw, dict) else None
+
+        try:
+            product = ProductCreate.model_validate(raw).model_dump()
+        except ValidationError as e:
+            errors.append({"index": index, "name": name, "errors": e.errors(include_url=False, include_context=False)})
+            continue
+
+        if not product["variations"]:
+            errors.append({"index": index, "name": name, "errors": ["produto sem variações"]})
+            continue
+
+        duplicated = [v["sku"] for v in product["variations"] if v["sku"] in seen_skus]
+
+        if duplicated:
+            errors.append({"index": index, "name": name, "errors": [f"SKU repetido no arquivo: {', '.join(duplicated)}"]})
+            continue
+
+        for v in product["variations"]:
+            seen_skus[v["sku"]] = product["name"]
+
+        valid.append(product)
+
+    return valid, errors
+
+
+def _comparable(doc: dict) -> dict:
+    out = {k: doc.get(k) for k in PRODUCT_FIELDS}
+    out["variations"] = [
+        {k: v.get(k) for k in VARIATION_FIELDS}
+        for v in doc.get("variations", [])
+    ]
+    return out
+
+
+def plan_import(products: list[dict], existing_docs: list[dict]) -> dict:
+    """
+    Compara o catálogo validado com os documentos atuais.
+
+    Um produto do arquivo corresponde a um documento existente quando
+    compartilham ao menos um SKU. Retorna as operações de bulk_write e
+    um relatório legível do que seria feito.
+    """
+    by_sku: dict[str, dict] = {}
+
+    for doc in existing_docs:
+        for v in doc.get("variations", []):
+            by_sku[v.get("sku")] = doc
+
+    now = datetime.now(timezone.utc).isoformat()
+
+    operations = []
+    report = {"created": [], "updated": [], "unchanged": [], "errors": []}
+
+    for product in products:
+        matches = {
+            by_sku[v["sku"]]["_id"]: by_sku[v["sku"]]
+            for v in product["variations"]
+            if v["sku"] in by_sku
+        }
+
+        if len(matches) > 1:
+            report["errors"].append(
+                {"name": product["name"], "errors": ["SKUs pertencem a produtos diferentes no banco"]}
+            )
+            continue
+
+        if not matches:
+            operations.append(InsertOne({**product, "created_at": now, "updated_at": now}))
+            report["created"].append({"name": product["name"], "skus": [v["sku"] for v in product["variations"]]})
+            continue
+
+        current = next(iter(matches.values()))
+        incoming = _comparable(product)
+        existing = _comparable(current)
+
+        changed = [k for k in PRODUCT_FIELDS if incoming[k] != existing[k]]
+
+        if not changed:
+            report["unchanged"].append({"id": str(current["_id"]), "name": product["name"]})
+            continue
+
+        update = {k: product[k] for k in changed}
+        update["updated_at"] = now
+
+        operations.append(UpdateOne({"_id": current["_id"]}, {"$set": update}))
+        report["updated"].append({"id": str(current["_id"]), "name": product["name"], "fields": changed})
+
+    return {"operations": operations, "report": report}
+
+
+def chunked(items: list, size: int = IMPORT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def all_skus(products: list[dict]) -> list[str]:
+    return [v["sku"] for p in products for v in p["variations"]]
+
+
+async def import_catalog(db, content: bytes, filename: str, dry_run: bool = True) -> dict:
+    try:
+        raw_products = parse_catalog(content, filename)
+    except (CatalogImportError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise CatalogImportError(f"Arquivo inválido: {e}")
+
+    products, errors = validate_catalog(raw_products)
+
+    existing = await db.products.find(
+        {"variations.sku": {"$in": all_skus(products)}}
+    ).to_list(None)
+
+    plan = plan_import(products, existing)
+    report = plan["report"]
+    report["errors"] = errors + report["errors"]
+    report["dry_run"] = dry_run
+
+    if dry_run or not plan["operations"]:
+        return report
+
+    inserted = modified = offset = 0
+
+    try:
+        for chunk in chunked(plan["operations"]):
+            try:
+                result = await db.products.bulk_write(chunk, ordered=True)
+            except BulkWriteError as e:
+                # ordered: parou no primeiro erro; o que veio antes já foi gravado
+                inserted += e.details.get("nInserted", 0)
+                modified += e.details.get("nModified", 0)
+                report["write_errors"] = [
+                    {
+                        "operation": offset + err["index"],
+                        "code": err.get("code"),
+                        "message": err.get("errmsg"),
+                    }
+                    for err in e.details.get("writeErrors", [])
+                ]
+                break
+
+            inserted += result.inserted_count
+            modified += result.modified_count
+            offset += len(chunk)
+    finally:
+        sku_index.invalidate()
+
+    report["applied"] = {"inserted": inserted, "modified": modified}
+    report["partial"] = bool(report.get("write_errors"))
+
+    return report
@@ -0,0 +1,121 @@
+"""
+Índice CEP → UF/região a partir das faixas de CEP dos Correios.
+
+As faixas ficam em app/data/cep_faixas_uf.csv (uma linha por faixa; uma
+UF pode ter mais de uma). O índice guarda os inícios ordenados e acha a
+faixa de um CEP com `bisect`. Serve para:
+
+- validar o endereço do pedido (CEP fora de qualquer UF, ou UF informada
+  que não bate com o CEP) antes de chegar ao Melhor Envio;
+- derivar o `state_abbr` do carrinho a partir do CEP;
+- agrupar cotações por UF na tabela de fretes.
+
+CEPs que caem em um buraco entre faixas não são rejeitados: ficam com a
+UF informada pelo cliente.
+"""
+
+from __future__ import annotations
+
+import csv
+import unicodedata
+from bisect import bisect_right
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from app.utils.validators import sanitize_cep
+
+DATA_FILE = Path(__file__).resolve().parents[1] / "data" / "cep_faixas_uf.csv"
+
+# abaixo disso não há CEP em nenhuma UF
+FIRST_CEP = 1000000
+
+
+def _plain(text: str) -> str:
+    """minúsculas e sem acento, para casar nomes de estado."""
+    normalized = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in normalized if not unicodedata.combining(c)).lower().strip()
+
+
+class CepIndex:
+    def __init__(self, path: Path = DATA_FILE):
+        rows = []
+
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                rows.append((int(row["cep_inicio"]), int(row["cep_fim"]), row["uf"], row["regiao"], row["nome"]))
+
+        rows.sort()
+
+        self._starts = [r[0] for r in rows]
+        self._ends = [r[1] for r in rows]
+        self._ufs = [r[2] for r in rows]
+
+        self.regions = {r[2]: r[3] for r in rows}
+        self.names = {_plain(r[4]): r[2] for r in rows}
+
+    def uf(self, cep: str) -> str | None:
+        digits = sanitize_cep(cep)
+
+        if len(digits) != 8:
+            return None
+
+        value = int(digits)
+        i = bisect_right(self._starts, value) - 1
+
+        if i >= 0 and value <= self._ends[i]:
+            return self._ufs[i]
+
+        return None
+
+    def region(self, cep: str) -> str | None:
+        uf = self.uf(cep)
+        return self.regions.get(uf) if uf else None
+
+    def state_abbr(self, state: str) -> str | None:
+        """UF a partir de sigla ou nome ("RJ", "rio de janeiro", "São Paulo")."""
+        plain = _plain(state)
+
+        if len(plain) == 2 and plain.upper() in self.regions:
+            return plain.upper()
+
+        return self.names.get(plain)
+
+
+cep_index = CepIndex()
+
+
+def validate_cep(cep: str) -> str:
+    """CEP só com dígitos; 400 se não tem 8 dígitos ou não existe."""
+    digits = sanitize_cep(cep)
+
+    if len(digits) != 8:
+        raise HTTPException(status_code=400, detail="CEP inválido.")
+
+    if int(digits) < FIRST_CEP:
+        raise HTTPException(status_code=400, detail="CEP inexistente.")
+
+    return digits
+
+
+def resolve_state(cep: str, state: str | None) -> str:
+    """
+    UF do endereço: a do CEP, conferida com a informada pelo cliente.
+
+    400 se as duas divergem ou se nenhuma das duas dá uma UF.
+    """
+    from_cep = cep_index.uf(cep)
+    informed = cep_index.state_abbr(state) if state else None
+
+    if from_cep and informed and from_cep != informed:
+        raise HTTPException(
+            status_code=400,
+            detail=f"CEP {cep} é de {from_cep}, mas o estado informado é {informed}.",
+        )
+
+    uf = from_cep or informed
+
+    if not uf:
+        raise HTTPException(status_code=400, detail="Estado (UF) inválido.")
+
+    return uf
@@ -0,0 +1,217 @@
+"""
+Exportação de pedidos e produtos em NDJSON ou CSV.
+
+Os documentos são lidos do cursor do Mongo em lotes e convertidos em
+linhas à medida que chegam, então o consumo de memória não depende do
+tamanho da exportação. A compressão gzip também é feita em streaming.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable
+
+from app.services.order_service import build_order_filter_clauses
+
+EXPORT_BATCH_SIZE = 500
+
+# linhas acumuladas antes de cada yield — evita um chunk HTTP por documento
+EXPORT_FLUSH_ROWS = 200
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# payloads brutos das transportadoras ficam de fora da exportação
+ORDER_EXPORT_PROJECTION = {
+    "melhor_envio.checkout": 0,
+    "melhor_envio.label": 0,
+}
+
+ORDER_CSV_COLUMNS = [
+    "id",
+    "created_at",
+    "status",
+    "payment_status",
+    "user_id",
+    "receiver_name",
+    "receiver_city",
+    "receiver_state",
+    "to_cep",
+    "items_count",
+    "subtotal",
+    "shipping_price",
+    "total",
+    "shipping_service_id",
+    "shipping_company",
+    "tracking_code",
+]
+
+PRODUCT_CSV_COLUMNS = [
+    "product_id",
+    "name",
+    "description",
+    "active",
+    "categories",
+    "images",
+    "sku",
+    "model",
+    "color",
+    "size",
+    "price",
+    "stock",
+    "variation_active",
+    "weight_kg",
+    "width_cm",
+    "height_cm",
+    "length_cm",
+    "image",
+]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _order_csv_rows(doc: dict) -> list[dict]:
+    address = doc.get("address") or {}
+    shipping = doc.get("shipping") or {}
+
+    return [
+        {
+            "id": str(doc["_id"]),
+            "created_at": _json_default(doc.get("created_at")),
+            "status": doc.get("status"),
+            "payment_status": doc.get("payment_status"),
+            "user_id": doc.get("user_id"),
+            "receiver_name": address.get("receiver_name"),
+            "receiver_city": address.get("receiver_city"),
+            "receiver_state": address.get("receiver_state"),
+            "to_cep": address.get("to_cep"),
+            "items_count": sum(int(it.get("quantity", 0)) for it in doc.get("items", [])),
+            "subtotal": doc.get("subtotal"),
+            "shipping_price": doc.get("shipping_price"),
+            "total": doc.get("total"),
+            "shipping_service_id": shipping.get("service_id"),
+            "shipping_company": shipping.get("company_name"),
+            "tracking_code": (doc.get("melhor_envio") or {}).get("tracking_code"),
+        }
+    ]
+
+
+def _product_csv_rows(doc: dict) -> list[dict]:
+    base = {
+        "product_id": str(doc["_id"]),
+        "name": doc.get("name"),
+        "description": doc.get("description"),
+        "active": doc.get("active", True),
+        "categories": "|".join(doc.get("categories", [])),
+        "images": "|".join(doc.get("images", [])),
+    }
+
+    rows = []
+
+    for v in doc.get("variations", []):
+        rows.append(
+            {
+                **base,
+                "sku": v.get("sku"),
+                "model": v.get("model"),
+                "color": v.get("color"),
+                "size": v.get("size"),
+                "price": v.get("price"),
+                "stock": v.get("stock"),
+                "variation_active": v.get("active", True),
+                "weight_kg": v.get("weight_kg"),
+                "width_cm": v.get("width_cm"),
+                "height_cm": v.get("height_cm"),
+                "length_cm": v.get("length_cm"),
+                "image": v.get("image"),
+            }
+        )
+
+    return rows or [base]
+
+
+async def _encode_rows(
+    cursor,
+    fmt: str,
+    columns: list[str],
+    to_rows: Callable[[dict], list[dict]],
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = None
+
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+
+    pending = 0
+
+    async for doc in cursor:
+        if writer is not None:
+            writer.writerows(to_rows(doc))
+        else:
+            doc["id"] = str(doc.pop("_id"))
+            buffer.write(json.dumps(doc, default=_json_default, ensure_ascii=False))
+            buffer.write("\n")
+
+        pending += 1
+
+        if pending >= EXPORT_FLUSH_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    tail = buffer.getvalue()
+
+    if tail:
+        yield tail.encode("utf-8")
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # wbits=31 → container gzip (não zlib cru)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def export_orders(
+    db,
+    fmt: str,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> AsyncIterator[bytes]:
+    clauses = build_order_filter_clauses(status, date_from, date_to)
+    query = {"$and": clauses} if clauses else {}
+
+    cursor = (
+        db.orders.find(query, ORDER_EXPORT_PROJECTION)
+        .sort("created_at", 1)
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+
+    return _encode_rows(cursor, fmt, ORDER_CSV_COLUMNS, _order_csv_rows)
+
+
+def export_products(db, fmt: str, active: bool | None = None) -> AsyncIterator[bytes]:
+    query = {} if active is None else {"active": active}
+
+    cursor = db.products.find(query).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+    return _encode_rows(cursor, fmt, PRODUCT_CSV_COLUMNS, _product_csv_rows)
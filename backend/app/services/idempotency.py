@@ -0,0 +1,178 @@
+"""
+Suporte ao header Idempotency-Key.
+
+A primeira requisição com uma chave grava um registro "processing" na
+coleção `idempotency_keys` (com TTL) e executa normalmente; ao terminar,
+a resposta é salva no registro. Repetições com a mesma chave recebem a
+resposta salva. Duplicatas concorrentes esperam a primeira terminar:
+no mesmo processo via asyncio.Lock, entre processos via polling do
+registro no Mongo.
+
+O registro "processing" tem um lease (`lease_until`). Se o worker morre
+no meio do handler, o registro fica órfão; vencido o lease, a próxima
+requisição com a mesma chave e o mesmo conteúdo o assume (troca atômica
+condicionada ao lease observado) e executa o handler.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from app.core import config
+from app.core.tracing import traced
+
+# quanto tempo uma duplicata espera a requisição original terminar
+WAIT_TIMEOUT_SECONDS = 15
+POLL_INTERVAL_SECONDS = 0.2
+
+# record_id -> [lock, número de requisições usando o lock]
+_locks: dict[str, list] = {}
+
+
+def request_fingerprint(payload: Any) -> str:
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@contextlib.asynccontextmanager
+async def key_lock(record_id: str):
+    entry = _locks.setdefault(record_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+
+        if entry[1] == 0:
+            _locks.pop(record_id, None)
+
+
+def _lease_expired(doc: dict) -> bool:
+    lease_until = doc.get("lease_until")
+
+    # registros anteriores ao lease só têm created_at
+    if lease_until is None and doc.get("created_at") is not None:
+        lease_until = doc["created_at"] + timedelta(seconds=config.IDEMPOTENCY_LEASE_SECONDS)
+
+    if lease_until is None:
+        return True
+
+    if lease_until.tzinfo is None:
+        lease_until = lease_until.replace(tzinfo=timezone.utc)
+
+    return lease_until <= datetime.now(timezone.utc)
+
+
+async def _take_over(db, record_id: str, stale: dict, fingerprint: str) -> bool:
+    """Assume um registro "processing" vencido; False se outro chegou antes."""
+    now = datetime.now(timezone.utc)
+
+    taken = await db.idempotency_keys.find_one_and_update(
+        {"_id": record_id, "status": "processing", "lease_until": stale.get("lease_until")},
+        {
+            "$set": {
+                "fingerprint": fingerprint,
+                "created_at": now,
+                "lease_until": now + timedelta(seconds=config.IDEMPOTENCY_LEASE_SECONDS),
+            }
+        },
+    )
+
+    return taken is not None
+
+
+async def _wait_for_completion(db, record_id: str) -> dict | None:
+    deadline = asyncio.get_running_loop().time() + WAIT_TIMEOUT_SECONDS
+
+    while asyncio.get_running_loop().time() < deadline:
+        doc = await db.idempotency_keys.find_one({"_id": record_id})
+
+        # registro removido: a requisição original falhou, pode tentar de novo
+        if doc is None or doc.get("status") == "completed":
+            return doc
+
+        # lease vencido: a requisição original não vai terminar
+        if _lease_expired(doc):
+            return doc
+
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    raise HTTPException(
+        status_code=409,
+        detail="Requisição com esta Idempotency-Key ainda em processamento.",
+    )
+
+
+@traced()
+async def run_idempotent(
+    db,
+    scope: str,
+    key: str,
+    owner: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[dict]],
+) -> dict:
+    """Executa `handler` uma única vez por (scope, owner, key)."""
+    key = key.strip()
+
+    if not key or len(key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key inválida.")
+
+    record_id = f"{scope}:{owner}:{key}"
+    fingerprint = request_fingerprint(payload)
+
+    async with key_lock(record_id):
+        while True:
+            now = datetime.now(timezone.utc)
+
+            try:
+                await db.idempotency_keys.insert_one(
+                    {
+                        "_id": record_id,
+                        "status": "processing",
+                        "fingerprint": fingerprint,
+                        "created_at": now,
+                        "lease_until": now + timedelta(seconds=config.IDEMPOTENCY_LEASE_SECONDS),
+                    }
+                )
+                break
+            except DuplicateKeyError:
+                existing = await _wait_for_completion(db, record_id)
+
+                if existing is None:
+                    continue
+
+                if existing.get("fingerprint") != fingerprint:
+                    raise HTTPException(
+                        status_code=422,
+                        detail="Idempotency-Key já usada com outro conteúdo.",
+                    )
+
+                if existing.get("status") == "completed":
+                    return existing["response"]
+
+                if await _take_over(db, record_id, existing, fingerprint):
+                    break
+
+        try:
+            response = await handler()
+        except BaseException:
+            await db.idempotency_keys.delete_one({"_id": record_id})
+            raise
+
+        await db.idempotency_keys.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "completed", "response": response}},
+        )
+
+        return response
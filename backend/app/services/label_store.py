@@ -0,0 +1,289 @@
+"""
+Cache em disco das etiquetas do Melhor Envio.
+
+A etiqueta é baixada uma vez (logo após o generate, em segundo plano, ou
+no primeiro download) e gravada em um store endereçado por conteúdo
+(sha256) em LABEL_CACHE_DIR. O pedido guarda só a referência em
+`melhor_envio.label_file`. Quando o diretório passa de LABEL_CACHE_MAX_MB
+os arquivos menos usados recentemente são removidos; uma etiqueta
+removida é baixada de novo no próximo acesso.
+
+`label_response` serve o arquivo em streaming, com suporte a Range.
+Leitores recebem o arquivo já aberto (`LabelStore.open`): uma evicção
+concorrente só remove o nome, e o handle continua legível até o fim da
+resposta.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from app.core import config
+from app.core.health import register_backlog
+from app.core.metrics import cache_hit
+from app.services import melhor_envio as me
+from app.services.idempotency import key_lock
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+EXTENSIONS = {"application/pdf": ".pdf", "application/json": ".json"}
+
+
+class LabelStore:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: int | None = None
+
+    def _path(self, digest: str, content_type: str) -> Path:
+        ext = EXTENSIONS.get(content_type, ".bin")
+        return self.root / digest[:2] / f"{digest}{ext}"
+
+    def _files(self) -> list[Path]:
+        return [p for p in self.root.glob("*/*") if p.is_file()]
+
+    def _ensure_total(self):
+        if self._total is None:
+            self._total = sum(p.stat().st_size for p in self._files()) if self.root.exists() else 0
+
+    def open(self, digest: str, content_type: str) -> BinaryIO | None:
+        """Arquivo aberto para leitura, ou None se não está (mais) no cache."""
+        path = self._path(digest, content_type)
+
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        try:
+            # mtime marca o último uso, para a evicção LRU
+            os.utime(path)
+        except FileNotFoundError:
+            # removido depois de aberto: o handle continua válido
+            pass
+
+        return f
+
+    def put(self, content: bytes, content_type: str) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest, content_type)
+
+        if path.exists():
+            os.utime(path)
+            return digest
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # grava em arquivo temporário e renomeia: leitores nunca veem meio arquivo
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._ensure_total()
+            self._total += len(content)
+
+            if self._total > self.max_bytes:
+                self._evict(keep=path)
+
+        return digest
+
+    def _evict(self, keep: Path):
+        files = sorted(self._files(), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Label evicted from cache: {path.name}")
+
+        self._total = total
+
+
+label_store = LabelStore(config.LABEL_CACHE_DIR, config.LABEL_CACHE_MAX_MB * 1024 * 1024)
+
+# downloads de etiqueta agendados após o generate
+_pending: set[asyncio.Task] = set()
+
+register_backlog("label_prefetch", lambda: len(_pending))
+
+
+async def fetch_label(db, order: dict) -> tuple[BinaryIO, str]:
+    """
+    Etiqueta aberta para leitura, baixando do Melhor Envio se preciso.
+
+    O chamador fecha o arquivo (label_response fecha ao fim do streaming).
+    """
+    melhor_envio = order.get("melhor_envio") or {}
+    cart_ids = melhor_envio.get("cart_order_ids") or []
+
+    if not cart_ids:
+        raise HTTPException(status_code=400, detail="Carrinho do Melhor Envio vazio")
+
+    cached = melhor_envio.get("label_file")
+
+    if cached:
+        f = label_store.open(cached["sha256"], cached["content_type"])
+
+        if f:
+            cache_hit("labels", True)
+            return f, cached["content_type"]
+
+    cache_hit("labels", False)
+
+    async with key_lock(f"label:{order['_id']}"):
+        # outro download do mesmo pedido pode ter terminado enquanto esperávamos
+        current = await db.orders.find_one({"_id": order["_id"]}, {"melhor_envio.label_file": 1})
+        cached = ((current or {}).get("melhor_envio") or {}).get("label_file")
+
+        if cached:
+            f = label_store.open(cached["sha256"], cached["content_type"])
+            if f:
+                return f, cached["content_type"]
+
+        token_doc = await me.get_current_token_doc()
+
+        url = f"{config.ME_BASE}/api/v2/me/shipment/print/{cart_ids[0]}"
+
+        r = await me.http_get(url, token_doc)
+
+        if r.status_code >= 400:
+            logger.error(f"Melhor Envio print error {r.status_code}: {r.text[:500]}")
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+
+        content_type = r.headers.get("content-type", "application/pdf").split(";")[0].strip()
+
+        digest = await asyncio.to_thread(label_store.put, r.content, content_type)
+
+        await db.orders.update_one(
+            {"_id": order["_id"]},
+            {
+                "$set": {
+                    "melhor_envio.label_file": {
+                        "sha256": digest,
+                        "content_type": content_type,
+                        "size": len(r.content),
+                        "cached_at": datetime.now(timezone.utc),
+                    }
+                }
+            },
+        )
+
+        # outro put pode ter removido o arquivo recém-gravado: serve da memória
+        f = label_store.open(digest, content_type)
+
+        return f or io.BytesIO(r.content), content_type
+
+
+async def _prefetch(db, order: dict):
+    try:
+        f, _ = await fetch_label(db, order)
+        f.close()
+    except Exception as e:
+        logger.warning(f"Label prefetch failed for order {order['_id']}: {getattr(e, 'detail', e)}")
+
+
+def schedule_label_prefetch(db, order: dict):
+    task = asyncio.create_task(_prefetch(db, order))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+def _iter_file(f: BinaryIO, start: int, length: int):
+    with f:
+        f.seek(start)
+        remaining = length
+
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """(início, fim inclusivo) de um Range de faixa única; None = arquivo inteiro."""
+    match = RANGE_RE.match((header or "").strip())
+
+    if not match or size == 0:
+        return None
+
+    first, last = match.groups()
+
+    if first == "" and last == "":
+        return None
+
+    if first == "":
+        # sufixo: últimos N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Range inválido.",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    return start, end
+
+
+def label_response(f: BinaryIO, content_type: str, filename: str, range_header: str | None = None) -> Response:
+    """Resposta em streaming de `f`, que é fechado ao fim (ou no erro de Range)."""
+    size = f.seek(0, io.SEEK_END)
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except HTTPException:
+        f.close()
+        raise
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={filename}",
+    }
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(f, 0, size), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    return StreamingResponse(
+        _iter_file(f, start, length),
+        status_code=206,
+        media_type=content_type,
+        headers=headers,
+    )
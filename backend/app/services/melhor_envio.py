@@ -1,13 +1,18 @@
 from __future__ import annotations
 
+import time
 from datetime import datetime, timezone
 from typing import Any, Dict
+import re
 import uuid
 import httpx
 from fastapi import HTTPException
 
 from app.core import config
+from app.core.http_client import get_client
+from app.core.metrics import cache_hit
 from app.db.mongo import get_db
+from app.services import resilience
 
 def sanitize_cep(value: str) -> str:
     return "".join([c for c in str(value or "") if c.isdigit()])[:8]
@@ -71,6 +76,11 @@ async def pop_oauth_state(state: str) -> bool:
     doc = await db.oauth_states.find_one_and_delete({"state": state})
     return bool(doc)
 
+# token lido do Mongo fica em memória por alguns segundos
+TOKEN_CACHE_SECONDS = 60
+
+_token_cache: dict[str, Any] = {"doc": None, "loaded_at": 0.0}
+
 async def save_token(token_payload: dict):
     db = get_db()
     now = datetime.now(timezone.utc)
@@ -93,9 +103,26 @@ async def save_token(token_payload: dict):
 
     await db.melhorenvio_tokens.update_one({"_id": "current"}, {"$set": doc}, upsert=True)
 
-async def get_current_token_doc() -> dict:
+    _token_cache.update(doc=doc, loaded_at=time.monotonic())
+
+async def load_token_doc(max_age: float = TOKEN_CACHE_SECONDS) -> dict | None:
+    if time.monotonic() - _token_cache["loaded_at"] < max_age:
+        cache_hit("melhor_envio_token", True)
+        return _token_cache["doc"]
+
+    cache_hit("melhor_envio_token", False)
+
     db = get_db()
     doc = await db.melhorenvio_tokens.find_one({"_id": "current"}, {"_id": 0})
+    _token_cache.update(doc=doc, loaded_at=time.monotonic())
+    return doc
+
+def cached_token_doc() -> dict | None:
+    """Último token carregado, sem ir ao Mongo (pode estar desatualizado)."""
+    return _token_cache["doc"]
+
+async def get_current_token_doc() -> dict:
+    doc = await load_token_doc()
     if not doc or not doc.get("access_token"):
         raise HTTPException(status_code=401, detail="Melhor Envio não conectado (token não encontrado).")
     return doc
@@ -135,13 +162,46 @@ def headers_basic(token_doc: dict) -> dict:
         "User-Agent": config.MELHOR_ENVIO_USER_AGENT,
     }
 
-async def http_post(url: str, json: dict, token_doc: dict) -> httpx.Response:
-    async with httpx.AsyncClient(timeout=30) as http:
-        return await http.post(url, json=json, headers=headers_json(token_doc))
+def operation_name(url: str) -> str:
+    """Path da URL com ids trocados por {id}, para usar como label."""
+    path = httpx.URL(url).path
+    return re.sub(r"/[0-9a-fA-F-]{8,}|/\d+", "/{id}", path)
+
+# timeout por operação (segundos); o resto usa OUTBOUND_TIMEOUT_SECONDS
+OPERATION_TIMEOUTS = {
+    "POST /api/v2/me/shipment/calculate": 8,
+    "POST /api/v2/me/cart": 15,
+    "POST /api/v2/me/shipment/checkout": 20,
+    "POST /api/v2/me/shipment/generate": 20,
+    "POST /api/v2/me/shipment/print": 30,
+    "GET /api/v2/me/shipment/print/{id}": 20,
+    "GET /api/v2/me/shipment/tracking/{id}": 10,
+    "POST /api/v2/me/shipment/tracking": 20,
+}
+
+async def _request(method: str, url: str, timeout: float, **kwargs) -> httpx.Response:
+    return await get_client("melhor_envio").request(method, url, timeout=timeout, **kwargs)
+
+async def http_post(url: str, json: dict, token_doc: dict, idempotent: bool = False) -> httpx.Response:
+    """POST no Melhor Envio. Só repete a chamada se `idempotent` (ex.: cotação)."""
+    operation = f"POST {operation_name(url)}"
+    return await resilience.call(
+        "melhor_envio",
+        operation,
+        lambda timeout: _request("POST", url, timeout, json=json, headers=headers_json(token_doc)),
+        timeout=OPERATION_TIMEOUTS.get(operation),
+        idempotent=idempotent,
+    )
 
 async def http_get(url: str, token_doc: dict) -> httpx.Response:
-    async with httpx.AsyncClient(timeout=30) as http:
-        return await http.get(url, headers=headers_basic(token_doc))
+    operation = f"GET {operation_name(url)}"
+    return await resilience.call(
+        "melhor_envio",
+        operation,
+        lambda timeout: _request("GET", url, timeout, headers=headers_basic(token_doc)),
+        timeout=OPERATION_TIMEOUTS.get(operation),
+        idempotent=True,
+    )
 
 def new_state() -> str:
     return str(uuid.uuid4())
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Eventos de pedido para o stream SSE (GET /api/orders/{id}/events).
+
+Cada página de pedido aberta assina o id do pedido no `order_events` e
+recebe as mudanças de status (e de rastreio) assim que acontecem, em vez
+de ficar consultando /api/orders/{id} e /tracking.
+
+Dois backends (ORDER_EVENTS_BACKEND):
+
+- "memory": `transition` e o refresh de rastreio publicam direto no
+  barramento do próprio processo. Basta com um worker só.
+- "changestream": um change stream em `orders` alimenta o barramento de
+  cada worker, então o evento chega qualquer que seja o worker que fez a
+  escrita. Exige replica set; sem ele, volta para "memory".
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+from app.core import config
+from app.core.metrics import Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+order_event_streams = registry.register(Gauge(
+    "order_event_streams",
+    "Conexões SSE abertas em /api/orders/{id}/events.",
+))
+
+# updatedFields vem com chaves pontuadas ("melhor_envio.tracking"), que
+# um $project não alcança; o filtro fica em _relay
+WATCH_PIPELINE = [{"$match": {"operationType": "update"}}]
+
+
+def _iso(value) -> str:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return datetime.now(timezone.utc).isoformat()
+
+
+def status_event(order_id, status: str, at=None, source: str | None = None) -> dict:
+    return {"type": "status", "order_id": str(order_id), "status": status, "at": _iso(at), "source": source}
+
+
+def tracking_event(order_id, tracking: dict) -> dict:
+    return {
+        "type": "tracking",
+        "order_id": str(order_id),
+        "tracking": tracking.get("data"),
+        "at": _iso(tracking.get("refreshed_at")),
+    }
+
+
+class OrderEventBus:
+    def __init__(self, queue_size: int = config.ORDER_EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._task: asyncio.Task | None = None
+        self.backend = "memory"
+
+    # ---------- assinaturas ----------
+
+    def subscribe(self, order_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(order_id, set()).add(queue)
+        order_event_streams.inc()
+        return queue
+
+    def unsubscribe(self, order_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(order_id)
+
+        if queues is None or queue not in queues:
+            return
+
+        queues.discard(queue)
+        order_event_streams.dec()
+
+        if not queues:
+            del self._subscribers[order_id]
+
+    def _deliver(self, event: dict):
+        for queue in self._subscribers.get(event["order_id"], ()):
+            if queue.full():
+                # cliente lento: descarta o evento mais antigo, o último status é o que importa
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    # ---------- publicação ----------
+
+    def publish(self, event: dict):
+        """Publica um evento gerado neste processo."""
+        if self.backend == "changestream":
+            # o change stream entrega para todos os workers, inclusive este
+            return
+
+        self._deliver(event)
+
+    # ---------- change stream ----------
+
+    def start(self, get_db):
+        if config.ORDER_EVENTS_BACKEND != "changestream" or self._task is not None:
+            return
+
+        self.backend = "changestream"
+        self._task = asyncio.create_task(self._watch(get_db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        self.backend = "memory"
+
+    async def _watch(self, get_db):
+        resume_token = None
+
+        while True:
+            try:
+                async with get_db().orders.watch(WATCH_PIPELINE, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._relay(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                code = getattr(e, "code", None)
+
+                # 40573: "The $changeStream stage is only supported on replica sets"
+                if code == 40573 or "replica set" in str(e):
+                    logger.warning("Change streams unavailable (no replica set); order events fall back to memory")
+                    self.backend = "memory"
+                    self._task = None
+                    return
+
+                logger.warning(f"Order change stream interrupted: {e}")
+                await asyncio.sleep(1)
+
+    def _relay(self, change: dict):
+        order_id = change["documentKey"]["_id"]
+        fields = (change.get("updateDescription") or {}).get("updatedFields") or {}
+
+        if "status" in fields:
+            self._deliver(status_event(order_id, fields["status"], fields.get("updated_at")))
+
+        tracking = fields.get("melhor_envio.tracking")
+
+        if isinstance(tracking, dict):
+            self._deliver(tracking_event(order_id, tracking))
+
+
+order_events = OrderEventBus()
+
+# depois destes status o pedido não muda mais; o stream é encerrado
+FINAL_STATUSES = {"delivered", "cancelled"}
+
+
+def sse_message(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def event_stream(order_id: str, queue: asyncio.Queue, snapshot: dict, is_disconnected):
+    """
+    Corpo do text/event-stream: o status atual e, depois, cada evento publicado.
+
+    Manda um comentário a cada ORDER_EVENTS_HEARTBEAT_SECONDS sem eventos,
+    para proxies não derrubarem a conexão ociosa e para notar que o
+    cliente saiu.
+    """
+    try:
+        yield f"retry: 5000\n{sse_message(snapshot)}"
+
+        if snapshot.get("status") in FINAL_STATUSES:
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=config.ORDER_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+
+            yield sse_message(event)
+
+            if event["type"] == "status" and event["status"] in FINAL_STATUSES:
+                return
+    finally:
+        order_events.unsubscribe(order_id, queue)
@@ -1,50 +1,33 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import base64
+import json
+import logging
+import re
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from bson import ObjectId
 from fastapi import HTTPException
+from pymongo import ReturnDocument
 
-from app.utils.validators import sanitize_cep
 from app.services import melhor_envio as me
+from app.services.cep_index import cep_index, resolve_state, validate_cep
+from app.services.label_store import fetch_label
+from app.services.packing import me_volume, pack_items
+from app.services.sku_index import find_variation
+from app.services.order_state import mark_paid, parse_order_id, transition
 from app.core import config
+from app.core.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 def _utcnow():
     return datetime.now(timezone.utc)
 
-STATE_MAP = {
-    "rio de janeiro": "RJ",
-    "são paulo": "SP",
-    "sao paulo": "SP",
-    "minas gerais": "MG",
-    "espírito santo": "ES",
-    "espirito santo": "ES",
-    "paraná": "PR",
-    "parana": "PR",
-    "rio grande do sul": "RS",
-    "santa catarina": "SC",
-    "bahia": "BA",
-}
-
-def normalize_state(state: str) -> str:
-    if not state:
-        return ""
-
-    state_lower = state.lower().strip()
-
-    if len(state) == 2:
-        return state.upper()
-
-    return STATE_MAP.get(state_lower, state[:2].upper())
-
 def normalize_cep(cep: str) -> str:
-    cep = sanitize_cep(cep)
-
-    if len(cep) != 8:
-        raise HTTPException(status_code=400, detail="CEP inválido.")
-
-    return cep
+    return validate_cep(cep)
 
 async def _load_product(db, product_id: str) -> dict:
     try:
@@ -63,6 +46,7 @@ async def _load_product(db, product_id: str) -> dict:
 # CREATE ORDER
 # =================================
 
+@traced()
 async def create_order(db, payload: dict) -> dict:
     if not payload.get("items"):
         raise HTTPException(status_code=400, detail="items não pode ser vazio.")
@@ -72,6 +56,8 @@ async def create_order(db, payload: dict) -> dict:
 
     cep = normalize_cep(payload["address"]["to_cep"])
     payload["address"]["to_cep"] = cep
+    # confere a UF com a faixa do CEP agora, não no carrinho do Melhor Envio
+    payload["address"]["receiver_state"] = resolve_state(cep, payload["address"].get("receiver_state"))
 
     items_out: list[dict[str, Any]] = []
     subtotal = 0.0
@@ -81,13 +67,7 @@ async def create_order(db, payload: dict) -> dict:
 
         prod = await _load_product(db, it["product_id"])
 
-        variation = next(
-            (
-                v for v in prod.get("variations", [])
-                if v["sku"] == it["sku"] and v.get("active", True)
-            ),
-            None,
-        )
+        variation = find_variation(prod, it["sku"])
 
         if not variation:
             raise HTTPException(
@@ -153,6 +133,9 @@ async def create_order(db, payload: dict) -> dict:
             "checkout": None,
             "label": None,
         },
+        "status_history": [
+            {"status": "created", "at": now, "source": "checkout", "meta": {}},
+        ],
         "created_at": now,
         "updated_at": now,
     }
@@ -166,6 +149,7 @@ async def create_order(db, payload: dict) -> dict:
 # CREATE MELHOR ENVIO CART
 # =================================
 
+@traced()
 async def _create_melhor_envio_cart(db, order: dict):
     token_doc = await me.get_current_token_doc()
 
@@ -184,10 +168,20 @@ async def _create_melhor_envio_cart(db, order: dict):
         "postal_code": normalize_cep(config.MELHOR_ENVIO_FROM_CEP),
     }
 
-    state = normalize_state(order["address"]["receiver_state"])
     cep = normalize_cep(order["address"]["to_cep"])
+    state = cep_index.uf(cep) or cep_index.state_abbr(order["address"]["receiver_state"]) or ""
+
+    # um carrinho por volume empacotado (antes era um por item)
+    parcels = await asyncio.to_thread(pack_items, order["items"])
+
+    # volumes já criados numa tentativa anterior (o empacotamento é determinístico)
+    done = (order.get("melhor_envio") or {}).get("cart_parcels") or {}
+
+    for index, parcel in enumerate(parcels):
+        if str(index) in done:
+            created_ids.append(done[str(index)])
+            continue
 
-    for item in order["items"]:
         payload = {
             "service": int(order["shipping"]["service_id"]),
             "from": sender,
@@ -209,14 +203,12 @@ async def _create_melhor_envio_cart(db, order: dict):
                     "name": item["name"],
                     "quantity": int(item["quantity"]),
                     "unitary_value": float(item["unit_price"]),
-                    "weight": float(item["weight_kg"]),
-                    "width": float(item["width_cm"]),
-                    "height": float(item["height_cm"]),
-                    "length": float(item["length_cm"]),
                 }
+                for item in parcel["items"]
             ],
+            "volumes": [me_volume(parcel)],
             "options": {
-                "insurance_value": float(order["total"]),
+                "insurance_value": parcel["insurance_value"],
                 "receipt": False,
                 "own_hand": False,
             },
@@ -226,14 +218,20 @@ async def _create_melhor_envio_cart(db, order: dict):
         r = await me.http_post(url, payload, token_doc)
 
         if r.status_code >= 400:
-            print("❌ MELHOR ENVIO ERROR")
-            print(r.text)
+            logger.error(f"Melhor Envio cart error {r.status_code}: {r.text[:500]}")
             raise HTTPException(status_code=r.status_code, detail=r.text)
 
         response = r.json()
 
         if response.get("id"):
-            created_ids.append(str(response["id"]))
+            cart_id = str(response["id"])
+            created_ids.append(cart_id)
+
+            # grava já: se um volume seguinte falhar, este não vira carrinho órfão
+            await db.orders.update_one(
+                {"_id": order["_id"]},
+                {"$set": {f"melhor_envio.cart_parcels.{index}": cart_id}},
+            )
 
     return created_ids
 
@@ -241,13 +239,43 @@ async def _create_melhor_envio_cart(db, order: dict):
 # GET ORDER
 # =================================
 
-async def get_order(db, order_id: str) -> dict:
+# campos de to_order_out (+ dono); nada de melhor_envio/mercado_pago/histórico
+ORDER_OUT_PROJECTION = {
+    "user_id": 1,
+    "status": 1,
+    "payment_status": 1,
+    "payment_id": 1,
+    "payment_provider": 1,
+    "items": 1,
+    "address": 1,
+    "shipping": 1,
+    "subtotal": 1,
+    "shipping_price": 1,
+    "total": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# o que _create_melhor_envio_cart lê do pedido
+CART_PROJECTION = {
+    "status": 1,
+    "items": 1,
+    "address": 1,
+    "shipping": 1,
+    "total": 1,
+    "melhor_envio.cart_parcels": 1,
+    "melhor_envio.cart_pending": 1,
+}
+
+
+@traced()
+async def get_order(db, order_id: str, projection: dict | None = None) -> dict:
     try:
         _id = ObjectId(order_id)
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido.")
 
-    doc = await db.orders.find_one({"_id": _id})
+    doc = await db.orders.find_one({"_id": _id}, projection or ORDER_OUT_PROJECTION)
 
     if not doc:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
@@ -258,35 +286,153 @@ async def get_order(db, order_id: str) -> dict:
 # UPDATE STATUS
 # =================================
 
+@traced()
 async def update_order_status(db, order_id: str, status: str, meta: dict | None = None) -> dict:
+    status = getattr(status, "value", status)
+
+    if status == "paid":
+        return await mark_paid(
+            db,
+            order_id,
+            source="admin",
+            payment_id=(meta or {}).get("payment_id"),
+            meta=meta,
+            projection=ORDER_OUT_PROJECTION,
+        )
+
+    return await transition(
+        db,
+        {"_id": parse_order_id(order_id)},
+        status,
+        source="admin",
+        meta=meta,
+        projection=ORDER_OUT_PROJECTION,
+    )
+
+# =================================
+# ENSURE MELHOR ENVIO CART
+# =================================
+
+@traced()
+async def ensure_carrier_cart(db, order: dict, projection: dict | None = None) -> dict:
+    """
+    Cria o carrinho no Melhor Envio uma única vez para pedidos pagos.
+
+    `order` precisa de status e melhor_envio.cart_order_ids; o pedido
+    devolvido traz os campos de `projection` (padrão: os mesmos dois).
+
+    Cada volume criado é gravado em melhor_envio.cart_parcels na hora, e
+    uma nova tentativa (após erro ou reserva vencida) só cria os que
+    faltam.
+    """
+    projection = projection or {"status": 1, "melhor_envio.cart_order_ids": 1}
+
+    if order.get("status") != "paid":
+        return order
+
+    if order.get("melhor_envio", {}).get("cart_order_ids"):
+        return order
+
+    now = _utcnow()
+    stale = now - timedelta(minutes=config.CARRIER_CART_CLAIM_MINUTES)
+
+    # reserva a criação: evita carrinhos duplicados com webhooks concorrentes;
+    # uma reserva vencida (worker morreu no meio) pode ser retomada
+    claimed = await db.orders.find_one_and_update(
+        {
+            "_id": order["_id"],
+            "melhor_envio.cart_order_ids.0": {"$exists": False},
+            "$or": [
+                {"melhor_envio.cart_pending": {"$ne": True}},
+                {"melhor_envio.cart_pending_at": {"$lt": stale}},
+                {"melhor_envio.cart_pending_at": {"$exists": False}},
+            ],
+        },
+        {"$set": {"melhor_envio.cart_pending": True, "melhor_envio.cart_pending_at": now}},
+        projection=CART_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+    if not claimed:
+        return order
+
+    if (claimed.get("melhor_envio") or {}).get("cart_pending"):
+        logger.warning(f"Stale carrier cart claim taken over for order {order['_id']}")
+
     try:
-        _id = ObjectId(order_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="order_id inválido.")
+        cart_ids = await _create_melhor_envio_cart(db, claimed)
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e)
+        logger.warning(f"Carrier cart not created for order {order['_id']}: {detail}")
 
-    order = await db.orders.find_one({"_id": _id})
+        return await db.orders.find_one_and_update(
+            {"_id": order["_id"]},
+            {
+                "$set": {
+                    "melhor_envio.cart_pending": False,
+                    "melhor_envio.cart_error": detail,
+                },
+                "$unset": {"melhor_envio.cart_pending_at": ""},
+            },
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
 
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado.")
+    return await db.orders.find_one_and_update(
+        {"_id": order["_id"]},
+        {
+            "$set": {
+                "melhor_envio.cart_order_ids": cart_ids,
+                "melhor_envio.cart_pending": False,
+                "melhor_envio.cart_error": None,
+                "updated_at": _utcnow(),
+            },
+            "$unset": {"melhor_envio.cart_pending_at": "", "melhor_envio.cart_parcels": ""},
+        },
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
 
-    update_data = {
-        "status": status,
-        "updated_at": _utcnow(),
+
+# pedidos pagos sem carrinho: erro gravado ou reserva abandonada
+def _cart_retry_filter(now: datetime) -> dict:
+    stale = now - timedelta(minutes=config.CARRIER_CART_CLAIM_MINUTES)
+
+    return {
+        "status": "paid",
+        "melhor_envio.cart_order_ids.0": {"$exists": False},
+        "$or": [
+            {"melhor_envio.cart_error": {"$type": "string"}},
+            {"melhor_envio.cart_pending": True, "melhor_envio.cart_pending_at": {"$lt": stale}},
+        ],
     }
 
-    if status == "paid":
-        update_data["payment_status"] = "paid"
 
-        if not order.get("melhor_envio", {}).get("cart_order_ids"):
-            cart_ids = await _create_melhor_envio_cart(db, order)
-            update_data["melhor_envio.cart_order_ids"] = cart_ids
+@traced()
+async def retry_carrier_carts(db, limit: int = 50) -> dict:
+    """
+    Nova tentativa de carrinho para pedidos pagos cujo carrinho falhou.
 
-    await db.orders.update_one(
-        {"_id": _id},
-        {"$set": update_data},
-    )
+    Reenvios do Mercado Pago são descartados pelo ledger, então sem isto
+    um erro do Melhor Envio no pagamento deixaria o pedido sem carrinho.
+    """
+    orders = await db.orders.find(
+        _cart_retry_filter(_utcnow()),
+        {"status": 1, "melhor_envio.cart_order_ids": 1},
+    ).limit(limit).to_list(None)
+
+    created = 0
+
+    for order in orders:
+        doc = await ensure_carrier_cart(db, order)
 
-    return await db.orders.find_one({"_id": _id})
+        if (doc or {}).get("melhor_envio", {}).get("cart_order_ids"):
+            created += 1
+
+    if orders:
+        logger.info(f"Carrier carts retried: {created}/{len(orders)} created")
+
+    return {"orders": len(orders), "created": created}
 
 # =================================
 # OUTPUT
@@ -313,39 +459,156 @@ def to_order_out(doc: dict) -> dict:
 # LISTAR ORDERS (ADMIN)
 # =================================
 
-async def list_orders(db, status: str | None = None):
-    query = {}
+# apenas os campos exibidos na listagem — evita trazer payloads do Melhor Envio
+ORDER_LIST_PROJECTION = {
+    "user_id": 1,
+    "status": 1,
+    "payment_status": 1,
+    "total": 1,
+    "shipping_price": 1,
+    "created_at": 1,
+    "address.receiver_name": 1,
+    "melhor_envio.tracking_code": 1,
+}
+
+ORDER_LIST_MAX_LIMIT = 200
+
+
+def encode_order_cursor(doc: dict) -> str:
+    created_at = doc["created_at"]
+
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+
+    raw = f"{created_at}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_order_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, _id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), ObjectId(_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor inválido.")
+
+
+def _to_order_list_item(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "user_id": doc.get("user_id"),
+        "status": doc.get("status"),
+        "payment_status": doc.get("payment_status"),
+        "total": doc.get("total"),
+        "shipping_price": doc.get("shipping_price"),
+        "created_at": doc.get("created_at"),
+        "receiver": doc.get("address", {}).get("receiver_name"),
+        "tracking_code": doc.get("melhor_envio", {}).get("tracking_code"),
+    }
+
+
+def build_order_filter_clauses(
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    q: str | None = None,
+) -> list[dict]:
+    clauses: list[dict] = []
 
     if status:
-        query["status"] = status
+        clauses.append({"status": status})
 
-    cursor = db.orders.find(query).sort("created_at", -1)
+    if date_from or date_to:
+        created_range = {}
 
-    orders = []
+        if date_from:
+            created_range["$gte"] = date_from
 
-    async for doc in cursor:
-        orders.append(
+        if date_to:
+            created_range["$lt"] = date_to
+
+        clauses.append({"created_at": created_range})
+
+    if q and q.strip():
+        term = q.strip()
+        clauses.append(
             {
-                "id": str(doc["_id"]),
-                "user_id": doc.get("user_id"),
-                "status": doc.get("status"),
-                "payment_status": doc.get("payment_status"),
-                "total": doc.get("total"),
-                "shipping_price": doc.get("shipping_price"),
-                "created_at": doc.get("created_at"),
-                "receiver": doc.get("address", {}).get("receiver_name"),
-                "tracking_code": doc.get("melhor_envio", {}).get("tracking_code"),
+                "$or": [
+                    {
+                        "address.receiver_name": {
+                            "$regex": re.escape(term),
+                            "$options": "i",
+                        }
+                    },
+                    {"melhor_envio.tracking_code": {"$in": [term, term.upper()]}},
+                ]
             }
         )
 
-    return orders
+    return clauses
+
+
+@traced()
+async def list_orders(
+    db,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    q: str | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+) -> dict:
+    limit = max(1, min(int(limit), ORDER_LIST_MAX_LIMIT))
+
+    clauses = build_order_filter_clauses(status, date_from, date_to, q)
+
+    # keyset: continua a partir do último (created_at, _id) da página anterior
+    if cursor:
+        last_created_at, last_id = decode_order_cursor(cursor)
+        clauses.append(
+            {
+                "$or": [
+                    {"created_at": {"$lt": last_created_at}},
+                    {"created_at": last_created_at, "_id": {"$lt": last_id}},
+                ]
+            }
+        )
+
+    query = {"$and": clauses} if clauses else {}
+
+    docs = await (
+        db.orders.find(query, ORDER_LIST_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    return {
+        "items": [_to_order_list_item(doc) for doc in docs],
+        "next_cursor": encode_order_cursor(docs[-1]) if has_more else None,
+    }
 
 # =================================
 # LIST MY ORDERS
 # =================================
 
+MY_ORDERS_PROJECTION = {
+    "status": 1,
+    "payment_status": 1,
+    "total": 1,
+    "shipping_price": 1,
+    "created_at": 1,
+    "address.receiver_name": 1,
+    "items.sku": 1,
+}
+
+
+@traced()
 async def list_orders_by_user(db, user_id: str):
-    cursor = db.orders.find({"user_id": user_id}).sort("created_at", -1)
+    cursor = db.orders.find({"user_id": user_id}, MY_ORDERS_PROJECTION).sort("created_at", -1)
 
     orders = []
 
@@ -369,13 +632,17 @@ async def list_orders_by_user(db, user_id: str):
 # GET LABEL FROM MELHOR ENVIO
 # =================================
 
+@traced()
 async def get_order_label(db, order_id: str):
     try:
         _id = ObjectId(order_id)
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido.")
 
-    order = await db.orders.find_one({"_id": _id})
+    order = await db.orders.find_one(
+        {"_id": _id},
+        {"melhor_envio.cart_order_ids": 1, "melhor_envio.label_file": 1},
+    )
 
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
@@ -388,59 +655,66 @@ async def get_order_label(db, order_id: str):
             detail="Pedido ainda não possui envio criado."
         )
 
-    token_doc = await me.get_current_token_doc()
-    order_id_me = cart_ids[0]
-
-    url = f"{config.ME_BASE}/api/v2/me/shipment/print/{order_id_me}"
-    r = await me.http_get(url, token_doc)
+    f, content_type = await fetch_label(db, order)
 
-    if r.status_code >= 400:
-        raise HTTPException(status_code=r.status_code, detail=r.text)
+    with f:
+        if content_type == "application/json":
+            return json.loads(await asyncio.to_thread(f.read))
 
-    try:
-        return r.json()
-    except Exception:
-        return {
-            "label_url": r.text
-        }
+    # PDF: o download é servido (e cacheado) pela rota de etiqueta
+    return {
+        "label_url": f"{config.API_BASE_URL}/api/shipping/label/order/{order_id}"
+    }
 
 # =================================
 # GET TRACKING
 # =================================
 
-async def get_order_tracking(db, order_id: str):
+TRACKING_PROJECTION = {"user_id": 1, "melhor_envio.cart_order_ids": 1, "melhor_envio.tracking": 1}
+
+
+@traced()
+async def get_order_tracking(db, order_id: str, order: dict | None = None):
+    """
+    Rastreio gravado pelo TrackingRefresher, com a data da última atualização.
+
+    Nunca chama o Melhor Envio: pedido ainda sem rastreio gravado volta com
+    `pending` até a próxima rodada do refresher.
+    """
     try:
         _id = ObjectId(order_id)
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido.")
 
-    order = await db.orders.find_one({"_id": _id})
+    if order is None:
+        order = await db.orders.find_one({"_id": _id}, TRACKING_PROJECTION)
 
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado.")
 
-    cart_ids = order.get("melhor_envio", {}).get("cart_order_ids")
+    melhor_envio = order.get("melhor_envio") or {}
 
-    if not cart_ids:
+    if not melhor_envio.get("cart_order_ids"):
         raise HTTPException(
             status_code=400,
             detail="Pedido ainda não possui envio criado."
         )
 
-    token_doc = await me.get_current_token_doc()
-    order_id_me = cart_ids[0]
+    tracking = melhor_envio.get("tracking")
 
-    url = f"{config.ME_BASE}/api/v2/me/shipment/tracking/{order_id_me}"
-    r = await me.http_get(url, token_doc)
+    if not tracking:
+        return {"tracking": {}, "refreshed_at": None, "stale": False, "pending": True}
 
-    if r.status_code >= 400:
-        raise HTTPException(status_code=r.status_code, detail=r.text)
+    refreshed_at = tracking["refreshed_at"]
 
-    try:
-        data = r.json()
-    except Exception:
-        data = r.text
+    if refreshed_at.tzinfo is None:
+        refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+
+    age = (_utcnow() - refreshed_at).total_seconds()
 
     return {
-        "tracking": data
-    }
\ No newline at end of file
+        "tracking": tracking["data"],
+        "refreshed_at": refreshed_at.isoformat(),
+        "stale": age > 2 * config.TRACKING_REFRESH_SECONDS,
+        "pending": False,
+    }
@@ -0,0 +1,151 @@
+"""
+Máquina de estados dos pedidos.
+
+Toda mudança de status passa por `transition`, que faz um compare-and-set
+(`find_one_and_update` filtrando pelos status de origem permitidos) e
+devolve o documento já atualizado em uma única ida ao Mongo. Cada
+transição é registrada em `status_history` (append-only).
+
+Usado por update_order_status, pelo webhook do Mercado Pago e pelos
+webhooks de pagamento/Melhor Envio. Cada transição efetiva é publicada
+em `order_events` (stream SSE do pedido).
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from app.core.tracing import traced
+from app.services.order_events import order_events, status_event
+
+logger = logging.getLogger(__name__)
+
+# status atual -> status para os quais pode ir
+TRANSITIONS: dict[str, set[str]] = {
+    "created": {"paid", "cancelled"},
+    "paid": {"shipped", "cancelled"},
+    "shipped": {"delivered", "cancelled"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+
+
+class InvalidTransition(HTTPException):
+    def __init__(self, current: str | None, target: str):
+        super().__init__(
+            status_code=409,
+            detail=f"Transição de status inválida: {current} → {target}",
+        )
+        self.current = current
+        self.target = target
+
+
+def allowed_sources(target: str) -> list[str]:
+    return [state for state, targets in TRANSITIONS.items() if target in targets]
+
+
+def parse_order_id(order_id) -> ObjectId:
+    if isinstance(order_id, ObjectId):
+        return order_id
+
+    try:
+        return ObjectId(order_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="order_id inválido.")
+
+
+@traced()
+async def transition(
+    db,
+    match: dict,
+    target: str,
+    source: str,
+    meta: dict | None = None,
+    extra_set: dict | None = None,
+    projection: dict | None = None,
+) -> dict:
+    """
+    Move o pedido que casa com `match` para `target`.
+
+    Se o pedido já estiver em `target`, devolve o documento sem alterá-lo.
+    Levanta 404 se não existir e InvalidTransition (409) se o status atual
+    não permitir a transição.
+    """
+    if target not in TRANSITIONS:
+        raise HTTPException(status_code=400, detail=f"Status inválido: {target}")
+
+    now = datetime.now(timezone.utc)
+
+    update_set = {"status": target, "updated_at": now}
+    update_set.update(extra_set or {})
+
+    doc = await db.orders.find_one_and_update(
+        {**match, "status": {"$in": allowed_sources(target)}},
+        {
+            "$set": update_set,
+            "$push": {
+                "status_history": {
+                    "status": target,
+                    "at": now,
+                    "source": source,
+                    "meta": meta or {},
+                }
+            },
+        },
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if doc:
+        logger.info(f"Order {doc['_id']} → {target} ({source})")
+        order_events.publish(status_event(doc["_id"], target, now, source))
+        return doc
+
+    # não casou: pedido inexistente, já no status alvo ou transição proibida
+    current = await db.orders.find_one(match, projection)
+
+    if not current:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado.")
+
+    if current.get("status") == target:
+        return current
+
+    raise InvalidTransition(current.get("status"), target)
+
+
+@traced()
+async def mark_paid(
+    db,
+    order_id,
+    source: str,
+    payment_id: str | None = None,
+    meta: dict | None = None,
+    projection: dict | None = None,
+    extra_set: dict | None = None,
+) -> dict:
+    """Confirma o pagamento e garante o carrinho no Melhor Envio."""
+    from app.services.order_service import ensure_carrier_cart
+
+    extra = {"payment_status": "paid"}
+
+    if payment_id:
+        extra["payment_id"] = str(payment_id)
+
+    extra.update(extra_set or {})
+
+    doc = await transition(
+        db,
+        {"_id": parse_order_id(order_id)},
+        "paid",
+        source,
+        meta=meta,
+        extra_set=extra,
+        projection={**(projection or {}), "status": 1, "melhor_envio.cart_order_ids": 1},
+    )
+
+    return await ensure_carrier_cart(db, doc, projection)
@@ -0,0 +1,271 @@
+"""
+Empacotamento 3D dos itens de um pedido nas caixas de envio.
+
+Antes cada item (e cada unidade, via quantity) ia para o Melhor Envio
+como um volume próprio com as medidas da variação — frete superestimado
+e uma chamada de carrinho por item. `pack_items` encaixa as unidades nas
+caixas de SHIPPING_BOXES com first-fit-decreasing:
+
+- unidades em ordem decrescente de volume;
+- cada unidade tenta as caixas já abertas (com rotação, em cada espaço
+  livre, divisão guilhotina do espaço que sobra) e, se não couber em
+  nenhuma, abre a maior caixa em que cabe;
+- no fim, cada caixa é trocada pela que ainda comporta o conteúdo com o
+  menor peso tarifado (maior entre o real e o cubado).
+
+Unidades maiores que qualquer caixa seguem na embalagem própria, como
+antes; uma unidade que ficou sozinha numa caixa também, quando a
+embalagem própria sai mais leve na tarifa (ex.: um cubo de 10 cm que só
+cabe na G). Cada volume sai com o peso real (itens + caixa), o peso
+cubado (C×L×A / PACKING_VOLUMETRIC_DIVISOR) e o valor declarado dos itens.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from fastapi import HTTPException
+
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+# folga para comparar medidas em cm vindas de float
+EPS = 1e-6
+
+
+def parse_boxes(spec: str) -> list[dict]:
+    """'P:16x11x6:1:0.05, M:27x18x9:5' -> caixas (nome:CxLxA:peso_max_kg[:tara_kg])."""
+    boxes = []
+
+    for raw in spec.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+
+        parts = raw.split(":")
+
+        try:
+            length, width, height = (float(v) for v in parts[1].lower().split("x"))
+            boxes.append({
+                "name": parts[0].strip(),
+                "length": length,
+                "width": width,
+                "height": height,
+                "max_weight": float(parts[2]) if len(parts) > 2 else float("inf"),
+                "tare": float(parts[3]) if len(parts) > 3 else 0.0,
+            })
+        except (IndexError, ValueError):
+            logger.warning(f"Invalid box spec ignored: {raw!r}")
+
+    return sorted(boxes, key=_volume)
+
+
+def _volume(dims) -> float:
+    if isinstance(dims, dict):
+        return dims["length"] * dims["width"] * dims["height"]
+    return dims[0] * dims[1] * dims[2]
+
+
+def _billable(dims, weight: float) -> float:
+    """Peso tarifado: o maior entre o real e o cubado."""
+    return max(weight, _volume(dims) / config.PACKING_VOLUMETRIC_DIVISOR)
+
+
+def _fits(dims: tuple, space: tuple) -> tuple | None:
+    """
+    Rotação de `dims` que cabe em `space`, ou None.
+
+    Prefere a orientação original (unidades iguais ficam alinhadas). Fora
+    isso, entre as 6 rotações alguma cabe se e só se as medidas ordenadas
+    cabem nas do espaço ordenadas; a escolhida põe a menor medida no menor
+    eixo.
+    """
+    if dims[0] <= space[0] + EPS and dims[1] <= space[1] + EPS and dims[2] <= space[2] + EPS:
+        return dims
+
+    axes = sorted(range(3), key=space.__getitem__)
+    small = sorted(dims)
+
+    if any(small[k] > space[axis] + EPS for k, axis in enumerate(axes)):
+        return None
+
+    rotated = [0.0, 0.0, 0.0]
+    for k, axis in enumerate(axes):
+        rotated[axis] = small[k]
+
+    return tuple(rotated)
+
+
+class _Parcel:
+    def __init__(self, box: dict):
+        self.box = box
+        self.units: list[dict] = []
+        self.weight = box["tare"]
+        # espaços livres (C, L, A), independentes entre si
+        self.spaces = [(box["length"], box["width"], box["height"])]
+        # a caixa só enche: o que não coube uma vez não cabe mais
+        self.rejected: set[tuple] = set()
+
+    def place(self, unit: dict) -> bool:
+        key = (unit["dims"], unit["weight"])
+
+        if key in self.rejected:
+            return False
+
+        if self.weight + unit["weight"] > self.box["max_weight"] + EPS:
+            self.rejected.add(key)
+            return False
+
+        # menor espaço primeiro: deixa os grandes para as próximas unidades
+        for index in sorted(range(len(self.spaces)), key=lambda i: _volume(self.spaces[i])):
+            space = self.spaces[index]
+            rotated = _fits(unit["dims"], space)
+
+            if rotated is None:
+                continue
+
+            a, b, c = rotated
+            length, width, height = space
+
+            # guilhotina: o resto do comprimento, o resto da largura, o que sobra em cima
+            rest = [(length - a, width, height), (a, width - b, height), (a, b, height - c)]
+
+            self.spaces[index:index + 1] = [s for s in rest if min(s) > EPS]
+            self.units.append(unit)
+            self.weight += unit["weight"]
+            return True
+
+        self.rejected.add(key)
+        return False
+
+
+def _fits_in_box(unit: dict, box: dict) -> bool:
+    dims = (box["length"], box["width"], box["height"])
+    return _fits(unit["dims"], dims) is not None and box["tare"] + unit["weight"] <= box["max_weight"] + EPS
+
+
+def _pack_into(units: list[dict], box: dict) -> bool:
+    """True se todas as unidades cabem em uma única caixa `box`."""
+    parcel = _Parcel(box)
+    return all(parcel.place(unit) for unit in units)
+
+
+def _expand(items: list[dict]) -> list[dict]:
+    units = []
+
+    for item in items:
+        quantity = int(item.get("quantity", 1))
+
+        if quantity < 1:
+            continue
+
+        unit = {
+            "sku": item.get("sku"),
+            "name": item.get("name"),
+            "dims": (float(item["length_cm"]), float(item["width_cm"]), float(item["height_cm"])),
+            "weight": float(item["weight_kg"]),
+            "value": float(item.get("unit_price", 0)),
+        }
+
+        units.extend([unit] * quantity)
+
+    if len(units) > config.PACKING_MAX_UNITS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Quantidade acima do limite de {config.PACKING_MAX_UNITS} unidades por envio.",
+        )
+
+    return units
+
+
+def _summary(units: list[dict], box: dict | None, dims: tuple, weight: float) -> dict:
+    length, width, height = dims
+    volumetric = length * width * height / config.PACKING_VOLUMETRIC_DIVISOR
+
+    items: dict[str, dict] = {}
+
+    for unit in units:
+        key = unit["sku"] or unit["name"] or ""
+        entry = items.setdefault(key, {"sku": unit["sku"], "name": unit["name"], "unit_price": unit["value"], "quantity": 0})
+        entry["quantity"] += 1
+
+    return {
+        "box": box["name"] if box else None,
+        "length": length,
+        "width": width,
+        "height": height,
+        "weight": round(weight, 3),
+        "volumetric_weight": round(volumetric, 3),
+        "billable_weight": round(max(weight, volumetric), 3),
+        "insurance_value": round(sum(u["value"] for u in units), 2),
+        "items": list(items.values()),
+    }
+
+
+def pack_items(items: list[dict], boxes: list[dict] | None = None) -> list[dict]:
+    """
+    Volumes para enviar os `items` (formato dos itens do pedido: medidas em
+    *_cm, weight_kg, unit_price, quantity).
+    """
+    boxes = SHIPPING_BOXES if boxes is None else boxes
+    units = sorted(_expand(items), key=lambda u: _volume(u["dims"]), reverse=True)
+
+    parcels: list[_Parcel] = []
+    loose: list[dict] = []
+
+    for unit in units:
+        if any(parcel.place(unit) for parcel in parcels):
+            continue
+
+        # abre a maior caixa (cabe mais do que vem depois); no fim ela é reduzida
+        box = next((b for b in reversed(boxes) if _fits_in_box(unit, b)), None)
+
+        if box is None:
+            # maior que qualquer caixa: vai na embalagem própria
+            loose.append(unit)
+            continue
+
+        parcel = _Parcel(box)
+        parcel.place(unit)
+        parcels.append(parcel)
+
+    result = []
+
+    for parcel in parcels:
+        content = sum(u["weight"] for u in parcel.units)
+
+        # entre as caixas que comportam tudo, a de menor peso tarifado
+        candidates = [parcel.box] + [
+            b for b in boxes if _volume(b) < _volume(parcel.box) and _pack_into(parcel.units, b)
+        ]
+        box = min(candidates, key=lambda b: (_billable(b, b["tare"] + content), _volume(b)))
+        weight = box["tare"] + content
+
+        if len(parcel.units) == 1:
+            unit = parcel.units[0]
+
+            # sozinha, a embalagem própria pode sair mais barata que a caixa
+            if _billable(unit["dims"], unit["weight"]) < _billable(box, weight):
+                loose.append(unit)
+                continue
+
+        result.append(_summary(parcel.units, box, (box["length"], box["width"], box["height"]), weight))
+
+    for unit in loose:
+        result.append(_summary([unit], None, unit["dims"], unit["weight"]))
+
+    return result
+
+
+def me_volume(parcel: dict) -> dict:
+    """Volume no formato do Melhor Envio (calculate e cart)."""
+    return {
+        "length": parcel["length"],
+        "width": parcel["width"],
+        "height": parcel["height"],
+        "weight": parcel["weight"],
+    }
+
+
+SHIPPING_BOXES = parse_boxes(config.SHIPPING_BOXES)
@@ -1,15 +1,41 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+from datetime import datetime, timezone
+
 import httpx
 from fastapi import HTTPException
 from app.core import config
+from app.core.health import register_backlog
+from app.core.http_client import get_client
+from app.core.metrics import cache_hit
+from app.core.tracing import traced
+from app.services import resilience
+from app.services.idempotency import key_lock, request_fingerprint
+
+logger = logging.getLogger(__name__)
+
+MERCADO_PAGO_BASE = config.MP_BASE_URL
+
+CREATE_PREFERENCE_TIMEOUT = 15
+GET_PAYMENT_TIMEOUT = 10
+
+
+# pré-criações de preferência em andamento (referência forte às tasks)
+_pending: set[asyncio.Task] = set()
 
-MERCADO_PAGO_BASE = "https://api.mercadopago.com"
+register_backlog("payment_preferences", lambda: len(_pending))
+
+
+async def _request(method: str, url: str, timeout: float, **kwargs) -> httpx.Response:
+    return await get_client("mercado_pago").request(method, url, timeout=timeout, **kwargs)
 
 
 # =========================
 # CREATE PREFERENCE
 # =========================
+@traced()
 async def create_preference(order: dict):
 
     if not config.MP_ACCESS_TOKEN:
@@ -79,20 +105,20 @@ async def create_preference(order: dict):
     # REQUEST
     # =========================
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.post(
-            url,
-            json=payload,
-            headers=headers
-        )
+    # não idempotente: uma nova tentativa criaria outra preferência
+    response = await resilience.call(
+        "mercado_pago",
+        "create_preference",
+        lambda timeout: _request("POST", url, timeout, json=payload, headers=headers),
+        timeout=CREATE_PREFERENCE_TIMEOUT,
+    )
 
     # =========================
     # ERROR HANDLING
     # =========================
 
     if response.status_code >= 400:
-        print("❌ MERCADO PAGO ERROR")
-        print(response.text)
+        logger.error(f"Mercado Pago preference error {response.status_code}: {response.text[:500]}")
 
         raise HTTPException(
             status_code=response.status_code,
@@ -102,9 +128,100 @@ async def create_preference(order: dict):
     return response.json()
 
 
+# =========================
+# REUSE / PRE-CREATE PREFERENCE
+# =========================
+def preference_fingerprint(order: dict) -> str:
+    """Muda só quando algo que vai na preferência muda (itens, total, URLs)."""
+    return request_fingerprint({
+        "items": [
+            [item.get("sku"), item.get("name"), int(item["quantity"]), float(item["unit_price"])]
+            for item in order["items"]
+        ],
+        "total": order.get("total"),
+        "frontend": config.FRONTEND_URL,
+        "api": config.API_BASE_URL,
+    })
+
+
+def _reusable(mercado_pago: dict | None, fingerprint: str) -> bool:
+    return bool(
+        mercado_pago
+        and mercado_pago.get("preference_id")
+        and mercado_pago.get("fingerprint") == fingerprint
+    )
+
+
+@traced()
+async def ensure_preference(db, order: dict) -> dict:
+    """
+    Devolve a preferência do pedido, criando uma nova só se os itens ou o
+    total mudaram desde a última (fingerprint salvo em `mercado_pago`).
+    """
+    fingerprint = preference_fingerprint(order)
+
+    if _reusable(order.get("mercado_pago"), fingerprint):
+        cache_hit("mp_preference", True)
+        return order["mercado_pago"]
+
+    async with key_lock(f"mp_preference:{order['_id']}"):
+        # outra requisição (ou a pré-criação) pode ter terminado enquanto esperávamos
+        current = await db.orders.find_one({"_id": order["_id"]}, {"mercado_pago": 1})
+        mercado_pago = (current or {}).get("mercado_pago")
+
+        if _reusable(mercado_pago, fingerprint):
+            cache_hit("mp_preference", True)
+            return mercado_pago
+
+        cache_hit("mp_preference", False)
+
+        preference = await create_preference(order)
+
+        mercado_pago = {
+            "preference_id": preference.get("id"),
+            "init_point": preference.get("init_point"),
+            "sandbox_init_point": preference.get("sandbox_init_point"),
+            "fingerprint": fingerprint,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+        await db.orders.update_one(
+            {"_id": order["_id"]},
+            {
+                "$set": {
+                    "payment_id": preference.get("id"),
+                    "payment_provider": "mercadopago",
+                    "updated_at": datetime.now(timezone.utc),
+                    "mercado_pago": mercado_pago,
+                }
+            },
+        )
+
+        return mercado_pago
+
+
+async def _precreate_preference(db, order: dict):
+    try:
+        await ensure_preference(db, order)
+    except Exception as e:
+        # o clique em "pagar" tenta de novo
+        logger.warning(f"Preference pre-creation failed for order {order['_id']}: {getattr(e, 'detail', e)}")
+
+
+def schedule_preference(db, order: dict):
+    """Cria a preferência em segundo plano logo após o pedido."""
+    if not config.MP_ACCESS_TOKEN:
+        return
+
+    task = asyncio.create_task(_precreate_preference(db, order))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
 # =========================
 # GET PAYMENT DETAILS
 # =========================
+@traced()
 async def get_payment(payment_id: str):
 
     if not config.MP_ACCESS_TOKEN:
@@ -119,12 +236,16 @@ async def get_payment(payment_id: str):
         "Authorization": f"Bearer {config.MP_ACCESS_TOKEN}",
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(url, headers=headers)
+    response = await resilience.call(
+        "mercado_pago",
+        "get_payment",
+        lambda timeout: _request("GET", url, timeout, headers=headers),
+        timeout=GET_PAYMENT_TIMEOUT,
+        idempotent=True,
+    )
 
     if response.status_code >= 400:
-        print("❌ MERCADO PAGO GET PAYMENT ERROR")
-        print(response.text)
+        logger.error(f"Mercado Pago get payment error {response.status_code}: {response.text[:500]}")
 
         raise HTTPException(
             status_code=response.status_code,
@@ -0,0 +1,53 @@
+"""
+Últimas cotações de frete bem-sucedidas, em memória.
+
+Quando o Melhor Envio está fora (circuito aberto, timeout, 5xx) a rota de
+cotação devolve a última resposta guardada para o mesmo CEP/produto/
+quantidade, marcada com `cached: true` e a data da cotação original.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app.core.config import QUOTE_CACHE_TTL_SECONDS
+from app.core.metrics import cache_hit
+
+QUOTE_CACHE_MAX = 5000
+
+
+def quote_key(to_cep: str, product_id: str, sku: str | None, quantity: int, insurance_value: float) -> tuple:
+    return (to_cep, str(product_id), sku or "", int(quantity), round(float(insurance_value), 2))
+
+
+class QuoteCache:
+    def __init__(self, ttl: float = QUOTE_CACHE_TTL_SECONDS, maxsize: int = QUOTE_CACHE_MAX):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+
+    def put(self, key: tuple, options: list[dict]):
+        self._items[key] = (
+            time.monotonic(),
+            {"options": options, "quoted_at": datetime.now(timezone.utc).isoformat()},
+        )
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, key: tuple) -> dict | None:
+        item = self._items.get(key)
+
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self._items.pop(key, None)
+            cache_hit("shipping_quotes", False)
+            return None
+
+        cache_hit("shipping_quotes", True)
+        return item[1]
+
+
+quote_cache = QuoteCache()
@@ -0,0 +1,195 @@
+"""
+Tabela de fretes aprendida das cotações do Melhor Envio.
+
+Cada cotação bem-sucedida alimenta a tabela: chave (prefixo do CEP de
+destino, faixa de peso) e, dentro dela, um preço por serviço (média
+móvel exponencial), o maior prazo visto e o nº de amostras. O destino é
+gravado em duas granularidades (RATE_TABLE_CEP_PREFIX dígitos do CEP e a
+UF, pelo cep_index), para cobrir CEPs ainda não cotados.
+
+`estimate` responde na hora, sem chamada externa: na cotação quando o
+Melhor Envio está fora ou sem token, e na página de produto
+(`estimate: true`). As opções voltam marcadas como estimativa.
+
+A tabela fica em memória e é persistida em `shipping_rates`, carregada
+no startup.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+from app.core import config
+from app.core.health import register_backlog
+from app.core.metrics import cache_hit
+from app.services.cep_index import cep_index
+
+logger = logging.getLogger(__name__)
+
+# peso do preço novo na média
+EWMA_ALPHA = 0.3
+
+# faixas de peso (kg), limite superior inclusivo; acima da última cai na faixa extra
+WEIGHT_BRACKETS = sorted(float(v) for v in config.RATE_TABLE_WEIGHT_BRACKETS.split(",") if v.strip())
+
+# gravações em shipping_rates agendadas após uma cotação
+_pending: set[asyncio.Task] = set()
+
+register_backlog("rate_table", lambda: len(_pending))
+
+
+def weight_bracket(weight: float) -> int:
+    return bisect_left(WEIGHT_BRACKETS, weight)
+
+
+def bracket_limit(bracket: int) -> float | None:
+    return WEIGHT_BRACKETS[bracket] if bracket < len(WEIGHT_BRACKETS) else None
+
+
+def cep_prefixes(cep: str) -> list[str]:
+    """Do mais específico para o mais amplo: prefixo do CEP, depois a UF."""
+    uf = cep_index.uf(cep)
+    return [cep[:config.RATE_TABLE_CEP_PREFIX], f"UF:{uf}" if uf else cep[:1]]
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateTable:
+    def __init__(self):
+        # (prefixo, faixa) -> {service_id: entrada}
+        self._rates: dict[tuple[str, int], dict[str, dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rates)
+
+    async def load(self, db):
+        self._rates.clear()
+
+        async for doc in db.shipping_rates.find({}, {"prefix": 1, "bracket": 1, "services": 1}):
+            self._rates[(doc["prefix"], doc["bracket"])] = doc.get("services") or {}
+
+        logger.info(f"Rate table loaded: {len(self._rates)} keys")
+
+    def learn(self, db, to_cep: str, weight: float, options: list[dict]):
+        """Registra as opções de uma cotação ao vivo (e persiste em segundo plano)."""
+        bracket = weight_bracket(weight)
+        now = datetime.now(timezone.utc)
+
+        for prefix in cep_prefixes(to_cep):
+            services = self._rates.setdefault((prefix, bracket), {})
+            changed = {}
+
+            for option in options:
+                price = _to_float(option.get("price"))
+
+                if price is None or option.get("id") is None:
+                    continue
+
+                sid = str(option["id"])
+                entry = services.get(sid)
+
+                if entry is None:
+                    entry = {
+                        "id": option["id"],
+                        "name": option.get("name"),
+                        "company": option.get("company"),
+                        "service": option.get("service"),
+                        "price": price,
+                        "delivery_time": option.get("delivery_time"),
+                        "samples": 0,
+                    }
+                else:
+                    entry = dict(entry)
+                    entry["price"] = round(EWMA_ALPHA * price + (1 - EWMA_ALPHA) * entry["price"], 2)
+                    times = [t for t in (entry.get("delivery_time"), option.get("delivery_time")) if t is not None]
+                    entry["delivery_time"] = max(times) if times else None
+
+                entry["samples"] += 1
+                entry["updated_at"] = now
+                services[sid] = changed[sid] = entry
+
+            if changed:
+                self._schedule_save(db, prefix, bracket, changed, now)
+
+    def estimate(self, to_cep: str, weight: float) -> dict | None:
+        """Opções estimadas para o CEP/peso, ou None se a tabela não cobre."""
+        bracket = weight_bracket(weight)
+        oldest = datetime.now(timezone.utc) - timedelta(days=config.RATE_TABLE_MAX_AGE_DAYS)
+
+        for prefix in cep_prefixes(to_cep):
+            # a própria faixa ou a próxima acima (estimativa nunca para menos)
+            for candidate in range(bracket, min(bracket + 2, len(WEIGHT_BRACKETS) + 1)):
+                services = self._rates.get((prefix, candidate))
+
+                if not services:
+                    continue
+
+                fresh = [e for e in services.values() if _aware(e.get("updated_at")) >= oldest]
+
+                if not fresh:
+                    continue
+
+                cache_hit("rate_table", True)
+
+                return {
+                    "options": [
+                        {
+                            "id": e["id"],
+                            "name": e.get("name"),
+                            "price": f"{e['price']:.2f}",
+                            "delivery_time": e.get("delivery_time"),
+                            "company": e.get("company"),
+                            "service": e.get("service"),
+                            "estimated": True,
+                        }
+                        for e in sorted(fresh, key=lambda e: e["price"])
+                    ],
+                    "estimated": True,
+                    "basis": {
+                        "cep_prefix": prefix,
+                        "max_weight_kg": bracket_limit(candidate),
+                        "samples": max(e["samples"] for e in fresh),
+                    },
+                }
+
+        cache_hit("rate_table", False)
+        return None
+
+    def _schedule_save(self, db, prefix: str, bracket: int, changed: dict, now: datetime):
+        task = asyncio.create_task(self._save(db, prefix, bracket, changed, now))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+    async def _save(self, db, prefix: str, bracket: int, changed: dict, now: datetime):
+        try:
+            await db.shipping_rates.update_one(
+                {"_id": f"{prefix}:{bracket}"},
+                {
+                    "$set": {
+                        "prefix": prefix,
+                        "bracket": bracket,
+                        "updated_at": now,
+                        **{f"services.{sid}": entry for sid, entry in changed.items()},
+                    }
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Rate table save failed for {prefix}:{bracket}: {e}")
+
+
+def _aware(value) -> datetime:
+    if not isinstance(value, datetime):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+rate_table = RateTable()
@@ -0,0 +1,223 @@
+"""
+Resiliência das chamadas externas (Melhor Envio, Mercado Pago).
+
+`call` envolve uma requisição httpx com:
+
+- timeout por operação, definido por quem chama;
+- novas tentativas com backoff exponencial e jitter, apenas em chamadas
+  idempotentes e apenas para erro de rede, timeout, 429 ou 5xx;
+- um circuit breaker por serviço: após BREAKER_FAILURE_THRESHOLD falhas
+  seguidas o circuito abre e as chamadas falham na hora (503) durante
+  BREAKER_RESET_SECONDS. Depois disso uma única chamada de teste
+  (half-open) decide se o circuito fecha ou volta a abrir.
+
+O estado de cada breaker aparece em /metrics (circuit_breaker_state).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+import httpx
+from fastapi import HTTPException
+
+from app.core import config
+from app.core.metrics import Counter, Gauge, registry, track_outbound
+
+logger = logging.getLogger(__name__)
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# teto para o Retry-After de um 429 antes de tentar de novo
+MAX_RETRY_AFTER_SECONDS = 2.0
+
+breaker_state = registry.register(Gauge(
+    "circuit_breaker_state",
+    "Estado do circuit breaker por serviço (0=fechado, 1=half-open, 2=aberto).",
+    ("service",),
+))
+
+breaker_rejections = registry.register(Counter(
+    "circuit_breaker_rejections_total",
+    "Chamadas recusadas com o circuito aberto.",
+    ("service",),
+))
+
+outbound_retries = registry.register(Counter(
+    "outbound_retries_total",
+    "Novas tentativas de chamadas externas.",
+    ("service", "operation"),
+))
+
+
+class CircuitOpenError(HTTPException):
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"Serviço externo indisponível ({service}). Tente novamente em instantes.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+        self.service = service
+
+
+class UpstreamError(HTTPException):
+    """Timeout ou erro de rede depois de esgotadas as tentativas."""
+
+    def __init__(self, service: str, exc: Exception):
+        timeout = isinstance(exc, httpx.TimeoutException)
+        super().__init__(
+            status_code=504 if timeout else 502,
+            detail=f"Falha ao falar com {service}: {'timeout' if timeout else type(exc).__name__}.",
+        )
+        self.service = service
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = config.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = config.BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        breaker_state.set(name, value=0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.state} → {state}")
+        self.state = state
+        breaker_state.set(self.name, value=STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def is_open(self) -> bool:
+        return self.state == "open" and self.retry_after() > 0
+
+    def before_call(self):
+        """Levanta CircuitOpenError se a chamada não deve sair."""
+        if self.state == "open":
+            remaining = self.retry_after()
+
+            if remaining > 0:
+                breaker_rejections.inc(self.name)
+                raise CircuitOpenError(self.name, remaining)
+
+            self._set_state("half_open")
+
+        if self.state == "half_open":
+            # só uma chamada de teste por vez
+            if self._probing:
+                breaker_rejections.inc(self.name)
+                raise CircuitOpenError(self.name, 1)
+            self._probing = True
+
+    def record_success(self):
+        self._probing = False
+        self.failures = 0
+        self._set_state("closed")
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self):
+        """Chamada de teste interrompida (cancelamento): libera sem julgar."""
+        self._probing = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    breaker = _breakers.get(service)
+
+    if breaker is None:
+        breaker = _breakers[service] = CircuitBreaker(service)
+
+    return breaker
+
+
+def backoff_delay(attempt: int, base: float = config.OUTBOUND_RETRY_BASE_SECONDS) -> float:
+    """Backoff exponencial com full jitter."""
+    return random.uniform(0, base * (2 ** attempt))
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    try:
+        return min(float(response.headers.get("Retry-After", "")), MAX_RETRY_AFTER_SECONDS)
+    except ValueError:
+        return None
+
+
+async def call(
+    service: str,
+    operation: str,
+    send: Callable[[float], Awaitable[httpx.Response]],
+    *,
+    timeout: float | None = None,
+    idempotent: bool = False,
+    retries: int | None = None,
+) -> httpx.Response:
+    """
+    Executa `send(timeout)` passando pelo breaker do serviço.
+
+    Respostas 4xx são devolvidas normalmente (o serviço está de pé);
+    5xx só contam como falha para o breaker e, se for a última tentativa,
+    também são devolvidas para quem chamou tratar.
+    """
+    breaker = get_breaker(service)
+    timeout = timeout or config.OUTBOUND_TIMEOUT_SECONDS
+    attempts = 1 + ((config.OUTBOUND_RETRIES if retries is None else retries) if idempotent else 0)
+
+    for attempt in range(attempts):
+        last = attempt + 1 == attempts
+
+        if attempt:
+            outbound_retries.inc(service, operation)
+
+        breaker.before_call()
+
+        try:
+            with track_outbound(service, operation):
+                response = await send(timeout)
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            logger.warning(f"{service} {operation} failed ({type(e).__name__}), attempt {attempt + 1}/{attempts}")
+
+            if last:
+                raise UpstreamError(service, e)
+
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if response.status_code in RETRYABLE_STATUS and not last:
+            delay = _retry_after_seconds(response) if response.status_code == 429 else None
+            await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+            continue
+
+        return response
@@ -0,0 +1,291 @@
+"""
+Operações de envio em lote (dia de postagem).
+
+Em vez de checkout → generate → print pedido a pedido, `run_shipping_batch`
+junta os `cart_order_ids` de vários pedidos pagos e chama cada endpoint do
+Melhor Envio uma vez por bloco de ME_BATCH_SIZE ids. Pedidos cujo bloco
+falha ficam fora das etapas seguintes e aparecem com o erro no resultado
+e em `melhor_envio.cart_error` do pedido, como no fluxo de um pedido só.
+Só entram pedidos em BATCH_STATUSES, com ou sem lista de ids.
+
+As respostas brutas de checkout/generate vão para `carrier_events` (uma
+por bloco); os resumos voltam para os pedidos em um único `bulk_write`,
+antes da impressão. As etiquetas de todos os blocos são
+juntadas em um PDF, guardado no label_store e servido por
+GET /api/admin/shipping/batches/{id}/labels.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.core import config
+from app.core.tracing import traced
+from app.services import melhor_envio as me
+from app.services.carrier_events import checkout_summary, label_summary, record_carrier_event
+from app.services.catalog_import import chunked
+from app.services.label_store import label_store
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ORDERS = 500
+
+BATCH_PROJECTION = {"status": 1, "melhor_envio.cart_order_ids": 1, "melhor_envio.label": 1}
+
+# status em que o pedido pode ir para checkout/generate/print
+BATCH_STATUSES = ("paid", "shipped")
+
+
+class BatchStepError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def merge_pdfs(parts: list[bytes]) -> bytes:
+    if len(parts) == 1:
+        return parts[0]
+
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+
+    for part in parts:
+        writer.append(io.BytesIO(part))
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def tracking_from(response: dict, cart_id: str) -> str | None:
+    """Código de rastreio de um envio na resposta do generate."""
+    if not isinstance(response, dict):
+        return None
+
+    entry = response.get(cart_id)
+
+    if isinstance(entry, dict) and entry.get("tracking"):
+        return entry["tracking"]
+
+    for item in response.get("data") or []:
+        if isinstance(item, dict) and item.get("id") == cart_id:
+            return item.get("tracking")
+
+    return None
+
+
+async def _post(path: str, payload: dict, token_doc: dict) -> dict:
+    r = await me.http_post(f"{config.ME_BASE}{path}", payload, token_doc)
+
+    if r.status_code >= 400:
+        logger.error(f"Melhor Envio batch {path} error {r.status_code}: {r.text[:500]}")
+        raise BatchStepError(r.status_code, r.text[:500])
+
+    return r.json()
+
+
+async def _print(cart_ids: list[str], token_doc: dict) -> bytes:
+    """PDF único com as etiquetas dos ids (o print aceita lista)."""
+    r = await me.http_post(
+        f"{config.ME_BASE}/api/v2/me/shipment/print",
+        {"mode": "private", "orders": cart_ids},
+        token_doc,
+    )
+
+    if r.status_code >= 400:
+        raise BatchStepError(r.status_code, r.text[:500])
+
+    if r.headers.get("content-type", "").startswith("application/pdf"):
+        return r.content
+
+    # resposta com link para o PDF
+    url = (r.json() or {}).get("url")
+
+    if not url:
+        raise BatchStepError(502, "Resposta do print sem PDF nem url.")
+
+    pdf = await me.http_get(url, token_doc)
+
+    if pdf.status_code >= 400:
+        raise BatchStepError(pdf.status_code, pdf.text[:500])
+
+    return pdf.content
+
+
+async def select_orders(db, order_ids: list[str] | None, status: str | None, include_labeled: bool) -> list[dict]:
+    status = status or "paid"
+
+    if status not in BATCH_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Status {status} não entra em lote de envio (use {', '.join(BATCH_STATUSES)}).",
+        )
+
+    # o status vale também para a lista: criado/cancelado nunca vai para o Melhor Envio
+    query: dict = {"melhor_envio.cart_order_ids.0": {"$exists": True}, "status": status}
+
+    if order_ids:
+        try:
+            query["_id"] = {"$in": [ObjectId(o) for o in order_ids]}
+        except Exception:
+            raise HTTPException(status_code=400, detail="order_id inválido na lista.")
+
+    if not include_labeled:
+        query["melhor_envio.label"] = None
+
+    return await db.orders.find(query, BATCH_PROJECTION).limit(BATCH_MAX_ORDERS).to_list(BATCH_MAX_ORDERS)
+
+
+@traced()
+async def run_shipping_batch(
+    db,
+    order_ids: list[str] | None = None,
+    status: str | None = None,
+    steps: tuple[str, ...] = ("checkout", "generate", "print"),
+    include_labeled: bool | None = None,
+) -> dict:
+    if include_labeled is None:
+        # só reimprimir: pedidos já com etiqueta entram
+        include_labeled = "generate" not in steps
+
+    orders = await select_orders(db, order_ids, status, include_labeled)
+
+    if not orders:
+        raise HTTPException(status_code=404, detail="Nenhum pedido elegível para o lote.")
+
+    token_doc = await me.get_current_token_doc()
+    now = datetime.now(timezone.utc)
+
+    # cart_id -> pedido
+    owner = {cid: o["_id"] for o in orders for cid in o["melhor_envio"]["cart_order_ids"]}
+    results = {o["_id"]: {"order_id": str(o["_id"]), "ok": True, "error": None} for o in orders}
+    updates: dict[ObjectId, dict] = {o["_id"]: {} for o in orders}
+    relabeled: set[ObjectId] = set()
+
+    selected = {str(o["_id"]) for o in orders}
+    skipped = [oid for oid in order_ids or [] if oid not in selected]
+
+    def fail(chunk: list[str], step: str, error: BatchStepError):
+        for cid in chunk:
+            result = results[owner[cid]]
+            if result["ok"]:
+                result.update(ok=False, error=f"{step}: {error.detail}")
+
+    def alive() -> list[str]:
+        return [cid for cid, oid in owner.items() if results[oid]["ok"]]
+
+    def chunk_orders(chunk: list[str]) -> list[ObjectId]:
+        return list(dict.fromkeys(owner[cid] for cid in chunk))
+
+    size = config.ME_BATCH_SIZE
+
+    if "checkout" in steps:
+        for chunk in chunked(alive(), size):
+            try:
+                response = await _post("/api/v2/me/shipment/checkout", {"orders": chunk}, token_doc)
+            except BatchStepError as e:
+                fail(chunk, "checkout", e)
+                continue
+
+            event_id = await record_carrier_event(db, chunk_orders(chunk), "checkout", response, now)
+            summary = checkout_summary(event_id, response, now, batch=True)
+            for cid in chunk:
+                updates[owner[cid]]["melhor_envio.checkout"] = summary
+
+    if "generate" in steps:
+        for chunk in chunked(alive(), size):
+            try:
+                response = await _post("/api/v2/me/shipment/generate", {"orders": chunk}, token_doc)
+            except BatchStepError as e:
+                fail(chunk, "generate", e)
+                continue
+
+            event_id = await record_carrier_event(db, chunk_orders(chunk), "generate", response, now)
+            summary = label_summary(event_id, now, batch=True)
+            for cid in chunk:
+                fields = updates[owner[cid]]
+                fields["melhor_envio.label"] = summary
+                relabeled.add(owner[cid])
+                tracking = tracking_from(response, cid)
+                if tracking:
+                    fields["melhor_envio.tracking_code"] = tracking
+
+    ops = [
+        UpdateOne(
+            {"_id": oid},
+            {
+                "$set": {**fields, "melhor_envio.cart_error": None, "updated_at": now},
+                # etiqueta nova: a cópia em cache (se houver) não vale mais
+                **({"$unset": {"melhor_envio.label_file": ""}} if oid in relabeled else {}),
+            },
+        )
+        for oid, fields in updates.items()
+        if fields
+    ]
+
+    if ops:
+        await db.orders.bulk_write(ops, ordered=False)
+
+    label_file = None
+
+    if "print" in steps:
+        parts = []
+
+        for chunk in chunked(alive(), size):
+            try:
+                parts.append(await _print(chunk, token_doc))
+            except BatchStepError as e:
+                fail(chunk, "print", e)
+
+        if parts:
+            try:
+                pdf = await asyncio.to_thread(merge_pdfs, parts)
+            except Exception as e:
+                # checkout/generate já foram gravados; só o PDF do lote falhou
+                logger.error(f"Could not merge batch labels: {e}")
+            else:
+                digest = await asyncio.to_thread(label_store.put, pdf, "application/pdf")
+                label_file = {"sha256": digest, "content_type": "application/pdf", "size": len(pdf)}
+
+    failed_ops = [
+        UpdateOne({"_id": oid}, {"$set": {"melhor_envio.cart_error": result["error"], "updated_at": now}})
+        for oid, result in results.items()
+        if not result["ok"]
+    ]
+
+    if failed_ops:
+        await db.orders.bulk_write(failed_ops, ordered=False)
+
+    batch = {
+        "created_at": now,
+        "steps": list(steps),
+        "order_ids": [str(o["_id"]) for o in orders],
+        "results": list(results.values()),
+        "label_file": label_file,
+    }
+
+    res = await db.shipping_batches.insert_one(batch)
+
+    ok = sum(1 for r in results.values() if r["ok"])
+    logger.info(f"Shipping batch {res.inserted_id}: {ok}/{len(orders)} orders ok")
+
+    return {
+        "batch_id": str(res.inserted_id),
+        "orders": len(orders),
+        "ok": ok,
+        "failed": len(orders) - ok,
+        "results": batch["results"],
+        "skipped": skipped,
+        "labels_url": (
+            f"/api/admin/shipping/batches/{res.inserted_id}/labels" if label_file else None
+        ),
+    }
@@ -1,14 +1,25 @@
+import logging
+from datetime import datetime, timezone
+
 from fastapi import HTTPException
 from bson import ObjectId
 
 from app.services import melhor_envio as me
+from app.services.carrier_events import checkout_summary, label_summary, record_carrier_event
+from app.services.label_store import fetch_label, label_response, schedule_label_prefetch
 from app.core import config
+from app.core.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+SHIPPING_PROJECTION = {"melhor_envio.cart_order_ids": 1}
 
 
 # =================================
 # CHECKOUT DO CARRINHO
 # =================================
 
+@traced()
 async def checkout_shipping(db, order_id: str):
 
     try:
@@ -16,7 +27,7 @@ async def checkout_shipping(db, order_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido")
 
-    order = await db.orders.find_one({"_id": _id})
+    order = await db.orders.find_one({"_id": _id}, SHIPPING_PROJECTION)
 
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
@@ -37,17 +48,19 @@ async def checkout_shipping(db, order_id: str):
     r = await me.http_post(url, payload, token_doc)
 
     if r.status_code >= 400:
-        print("❌ MELHOR ENVIO CHECKOUT ERROR")
-        print(r.text)
+        logger.error(f"Melhor Envio checkout error {r.status_code}: {r.text[:500]}")
         raise HTTPException(status_code=r.status_code, detail=r.text)
 
     response = r.json()
 
+    now = datetime.now(timezone.utc)
+    event_id = await record_carrier_event(db, [_id], "checkout", response, now)
+
     await db.orders.update_one(
         {"_id": _id},
         {
             "$set": {
-                "melhor_envio.checkout": response,
+                "melhor_envio.checkout": checkout_summary(event_id, response, now),
             }
         },
     )
@@ -58,6 +71,7 @@ async def checkout_shipping(db, order_id: str):
 # GERAR ETIQUETA PELO ORDER_ID
 # =================================
 
+@traced()
 async def generate_label_shipping(db, order_id: str):
 
     try:
@@ -65,7 +79,7 @@ async def generate_label_shipping(db, order_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido")
 
-    order = await db.orders.find_one({"_id": _id})
+    order = await db.orders.find_one({"_id": _id}, SHIPPING_PROJECTION)
 
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
@@ -86,8 +100,7 @@ async def generate_label_shipping(db, order_id: str):
     r = await me.http_post(url, payload, token_doc)
 
     if r.status_code >= 400:
-        print("❌ MELHOR ENVIO GENERATE ERROR")
-        print(r.text)
+        logger.error(f"Melhor Envio generate error {r.status_code}: {r.text[:500]}")
         raise HTTPException(status_code=r.status_code, detail=r.text)
 
     response = r.json()
@@ -103,59 +116,46 @@ async def generate_label_shipping(db, order_id: str):
     except Exception:
         pass
 
+    now = datetime.now(timezone.utc)
+    event_id = await record_carrier_event(db, [_id], "generate", response, now)
+
     await db.orders.update_one(
         {"_id": _id},
         {
             "$set": {
-                "melhor_envio.label": response,
+                "melhor_envio.label": label_summary(event_id, now),
                 "melhor_envio.tracking_code": tracking_code,
-            }
+            },
+            # etiqueta nova: a cópia em cache (se houver) não vale mais
+            "$unset": {"melhor_envio.label_file": ""},
         },
     )
 
+    order.setdefault("melhor_envio", {}).pop("label_file", None)
+    schedule_label_prefetch(db, order)
+
     return response
 
 # =================================
 # BAIXAR ETIQUETA DA ORDER
 # =================================
 
-from fastapi.responses import Response
-
-
-async def get_label_shipping(db, order_id: str):
+@traced()
+async def get_label_shipping(db, order_id: str, range_header: str | None = None):
 
     try:
         _id = ObjectId(order_id)
     except Exception:
         raise HTTPException(status_code=400, detail="order_id inválido")
 
-    order = await db.orders.find_one({"_id": _id})
+    order = await db.orders.find_one(
+        {"_id": _id},
+        {"melhor_envio.cart_order_ids": 1, "melhor_envio.label_file": 1},
+    )
 
     if not order:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    cart_ids = order.get("melhor_envio", {}).get("cart_order_ids", [])
-
-    if not cart_ids:
-        raise HTTPException(status_code=400, detail="Carrinho do Melhor Envio vazio")
-
-    token_doc = await me.get_current_token_doc()
-
-    order_id_me = cart_ids[0]
+    f, content_type = await fetch_label(db, order)
 
-    url = f"{config.ME_BASE}/api/v2/me/shipment/print/{order_id_me}"
-
-    r = await me.http_get(url, token_doc)
-
-    if r.status_code >= 400:
-        print("❌ MELHOR ENVIO PRINT ERROR")
-        print(r.text)
-        raise HTTPException(status_code=r.status_code, detail=r.text)
-
-    return Response(
-        content=r.content,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"inline; filename=etiqueta_{order_id}.pdf"
-        },
-    )
\ No newline at end of file
+    return label_response(f, content_type, f"etiqueta_{order_id}.pdf", range_header)
@@ -0,0 +1,153 @@
+"""
+Índice em memória SKU → (product_id, posição da variação).
+
+As variações ficam aninhadas nos documentos de produto; este índice
+evita varrer `prod["variations"]` em Python e permite resolver vários
+SKUs com uma única consulta ao Mongo. Entradas desatualizadas são
+detectadas na leitura (a posição não bate mais com o SKU) e corrigidas
+pela busca via índice multikey `variations.sku`.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from bson import ObjectId
+
+from app.core.metrics import cache_hit
+
+logger = logging.getLogger(__name__)
+
+STOCK_PROJECTION = {
+    "name": 1,
+    "active": 1,
+    "variations": 1,
+}
+
+
+class SkuIndex:
+    def __init__(self):
+        self._entries: dict[str, tuple[ObjectId, int]] = {}
+        self._loaded = False
+
+    def _index_product(self, doc: dict):
+        for position, v in enumerate(doc.get("variations", [])):
+            if v.get("sku"):
+                self._entries[v["sku"]] = (doc["_id"], position)
+
+    async def rebuild(self, db):
+        self._entries = {}
+
+        cursor = db.products.find({}, {"variations.sku": 1})
+
+        async for doc in cursor:
+            self._index_product(doc)
+
+        self._loaded = True
+        logger.info(f"SKU index rebuilt: {len(self._entries)} SKUs")
+
+    def invalidate(self):
+        self._entries = {}
+        self._loaded = False
+
+    def get(self, sku: str) -> tuple[ObjectId, int] | None:
+        return self._entries.get(sku)
+
+    async def resolve(self, db, skus: list[str]) -> dict[str, tuple[dict, dict]]:
+        """
+        Retorna {sku: (produto, variação)} para os SKUs encontrados.
+
+        Faz no máximo duas consultas: uma por _id para os SKUs já indexados
+        e outra por `variations.sku` para os que faltarem ou estiverem
+        desatualizados.
+        """
+        if not self._loaded:
+            await self.rebuild(db)
+
+        wanted = list(dict.fromkeys(skus))
+        found: dict[str, tuple[dict, dict]] = {}
+
+        known_ids = {self._entries[s][0] for s in wanted if s in self._entries}
+
+        if known_ids:
+            products = {
+                doc["_id"]: doc
+                async for doc in db.products.find(
+                    {"_id": {"$in": list(known_ids)}}, STOCK_PROJECTION
+                )
+            }
+
+            for sku in wanted:
+                entry = self._entries.get(sku)
+
+                if not entry or entry[0] not in products:
+                    continue
+
+                prod = products[entry[0]]
+                variations = prod.get("variations", [])
+                position = entry[1]
+
+                if position < len(variations) and variations[position].get("sku") == sku:
+                    found[sku] = (prod, variations[position])
+
+        missing = [s for s in wanted if s not in found]
+
+        for sku in wanted:
+            cache_hit("sku_index", sku in found)
+
+        if missing:
+            async for prod in db.products.find(
+                {"variations.sku": {"$in": missing}}, STOCK_PROJECTION
+            ):
+                self._index_product(prod)
+
+                for v in prod.get("variations", []):
+                    if v.get("sku") in missing:
+                        found[v["sku"]] = (prod, v)
+
+        return found
+
+
+sku_index = SkuIndex()
+
+
+def find_variation(prod: dict, sku: str) -> dict | None:
+    """Variação ativa de `prod` com o SKU dado, usando a posição indexada."""
+    entry = sku_index.get(sku)
+    variations = prod.get("variations", [])
+
+    if entry and entry[0] == prod.get("_id") and entry[1] < len(variations):
+        candidate = variations[entry[1]]
+
+        if candidate.get("sku") == sku:
+            return candidate if candidate.get("active", True) else None
+
+    return next(
+        (v for v in variations if v.get("sku") == sku and v.get("active", True)),
+        None,
+    )
+
+
+def stock_entry(sku: str, prod: dict | None, variation: dict | None) -> dict:
+    if not prod or not variation:
+        return {"sku": sku, "found": False, "available": False, "stock": 0}
+
+    active = bool(prod.get("active", True) and variation.get("active", True))
+    stock = int(variation.get("stock", 0))
+
+    return {
+        "sku": sku,
+        "found": True,
+        "product_id": str(prod["_id"]),
+        "name": prod.get("name"),
+        "price": float(variation.get("price", 0)),
+        "stock": stock,
+        "active": active,
+        "available": active and stock > 0,
+    }
+
+
+async def get_stock(db, skus: list[str]) -> list[dict]:
+    skus = list(dict.fromkeys(s for s in skus if s))
+    resolved = await sku_index.resolve(db, skus)
+    return [stock_entry(sku, *resolved.get(sku, (None, None))) for sku in skus]
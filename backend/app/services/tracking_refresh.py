@@ -0,0 +1,173 @@
+"""
+Atualização periódica do rastreio dos pedidos em trânsito.
+
+Em vez de consultar o Melhor Envio a cada visualização do pedido, um
+loop em segundo plano busca o rastreio de todos os pedidos com etiqueta
+gerada e ainda não entregues, em lotes de ME_BATCH_SIZE ids por chamada
+(POST /api/v2/me/shipment/tracking), e grava o resultado em
+`melhor_envio.tracking` com `refreshed_at`. GET /api/orders/{id}/tracking
+serve esse dado.
+
+A mesma rodada refaz o carrinho dos pedidos pagos em que ele falhou
+(`retry_carrier_carts`).
+
+Com vários workers, só quem pega o lease em `scheduler_locks` roda a
+rodada; os outros pulam.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.core import config
+from app.core.tracing import traced
+from app.services import melhor_envio as me
+from app.services.catalog_import import chunked
+from app.services.order_events import order_events, tracking_event
+from app.services.order_service import retry_carrier_carts
+
+logger = logging.getLogger(__name__)
+
+LEASE_ID = "tracking_refresh"
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# pedidos cujo rastreio ainda muda
+IN_TRANSIT_FILTER = {
+    "status": {"$in": ["paid", "shipped"]},
+    "melhor_envio.cart_order_ids.0": {"$exists": True},
+    "melhor_envio.label": {"$ne": None},
+}
+
+
+async def acquire_lease(db, lease_id: str, seconds: float) -> bool:
+    """True se este worker ficou com a rodada (lease expirado ou inexistente)."""
+    now = datetime.now(timezone.utc)
+
+    try:
+        doc = await db.scheduler_locks.find_one_and_update(
+            {"_id": lease_id, "until": {"$lt": now}},
+            {"$set": {"until": now + timedelta(seconds=seconds), "owner": WORKER_ID}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # lease ainda válido de outro worker (o upsert colidiu com o _id)
+        return False
+
+    return bool(doc and doc.get("owner") == WORKER_ID)
+
+
+async def fetch_tracking(cart_ids: list[str], token_doc: dict) -> dict:
+    r = await me.http_post(
+        f"{config.ME_BASE}/api/v2/me/shipment/tracking",
+        {"orders": cart_ids},
+        token_doc,
+        idempotent=True,
+    )
+
+    if r.status_code >= 400:
+        logger.error(f"Melhor Envio tracking error {r.status_code}: {r.text[:500]}")
+        return {}
+
+    data = r.json()
+    return data if isinstance(data, dict) else {}
+
+
+def tracking_update(order: dict, data: dict, now: datetime) -> dict:
+    entries = {cid: data[cid] for cid in order["melhor_envio"]["cart_order_ids"] if cid in data}
+    fields = {"melhor_envio.tracking": {"data": entries, "refreshed_at": now}}
+
+    codes = [e.get("tracking") for e in entries.values() if isinstance(e, dict) and e.get("tracking")]
+
+    if codes:
+        fields["melhor_envio.tracking_code"] = codes[0]
+
+    return fields
+
+
+@traced()
+async def refresh_tracking(db, query: dict | None = None) -> dict:
+    """Atualiza o rastreio dos pedidos que casam com `query` (padrão: em trânsito)."""
+    orders = await db.orders.find(
+        query or IN_TRANSIT_FILTER,
+        {"melhor_envio.cart_order_ids": 1},
+    ).to_list(None)
+
+    if not orders:
+        return {"orders": 0, "updated": 0}
+
+    token_doc = await me.get_current_token_doc()
+    now = datetime.now(timezone.utc)
+
+    owner = {cid: o for o in orders for cid in o["melhor_envio"]["cart_order_ids"]}
+    data: dict = {}
+
+    for chunk in chunked(list(owner), config.ME_BATCH_SIZE):
+        data.update(await fetch_tracking(chunk, token_doc))
+
+    updates = {
+        o["_id"]: tracking_update(o, data, now)
+        for o in orders
+        if any(cid in data for cid in o["melhor_envio"]["cart_order_ids"])
+    }
+
+    if updates:
+        await db.orders.bulk_write(
+            [UpdateOne({"_id": oid}, {"$set": fields}) for oid, fields in updates.items()],
+            ordered=False,
+        )
+
+        for oid, fields in updates.items():
+            order_events.publish(tracking_event(oid, fields["melhor_envio.tracking"]))
+
+    logger.info(f"Tracking refreshed for {len(updates)}/{len(orders)} orders")
+
+    return {"orders": len(orders), "updated": len(updates)}
+
+
+class TrackingRefresher:
+    def __init__(self, interval: float = config.TRACKING_REFRESH_SECONDS):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self.last_run: dict | None = None
+
+    def start(self, get_db):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(get_db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, get_db):
+        while True:
+            try:
+                db = get_db()
+
+                # lease um pouco menor que o intervalo, para a próxima rodada não esbarrar
+                if await acquire_lease(db, LEASE_ID, self.interval * 0.9):
+                    carts = await retry_carrier_carts(db)
+                    result = await refresh_tracking(db)
+                    self.last_run = {**result, "carts": carts, "at": datetime.now(timezone.utc).isoformat()}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Tracking refresh failed: {getattr(e, 'detail', e)}")
+
+            await asyncio.sleep(self.interval)
+
+
+tracking_refresher = TrackingRefresher()
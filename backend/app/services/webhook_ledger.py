@@ -0,0 +1,158 @@
+"""
+Registro de eventos de pagamento já processados.
+
+Cada combinação (provider, payment_id, status) é gravada uma única vez
+na coleção `payment_events` (índice único). Um LRU em memória guarda os
+pagamentos que já chegaram a um status terminal, para que reenvios da
+mesma notificação sejam descartados antes de qualquer chamada externa
+ou escrita no Mongo.
+
+"approved" não é terminal: um pagamento aprovado ainda pode ser
+estornado ou contestado. Para que reenvios do próprio "approved" não
+consultem o Mercado Pago de novo, cada notificação é reservada pela sua
+identidade (id da notificação, ação e date_created do corpo) em
+`payment_notifications` antes da consulta; uma notificação nova do mesmo
+pagamento (estorno, chargeback) tem outra identidade e passa.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.metrics import cache_hit
+
+# status a partir dos quais o pagamento não muda mais
+TERMINAL_PAYMENT_STATUSES = {"rejected", "cancelled", "refunded", "charged_back"}
+
+# pagamento aprovado e depois devolvido ao comprador
+REVERSED_PAYMENT_STATUSES = {"refunded", "charged_back"}
+
+RECENT_EVENTS_MAX = 5000
+
+# reenvios do Mercado Pago param em poucos dias
+NOTIFICATION_TTL_SECONDS = 7 * 24 * 3600
+
+
+class RecentEvents:
+    def __init__(self, maxsize: int = RECENT_EVENTS_MAX):
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def get(self, provider: str, payment_id: str) -> str | None:
+        key = (provider, payment_id)
+        status = self._items.get(key)
+
+        if status is not None:
+            self._items.move_to_end(key)
+
+        return status
+
+    def discard(self, provider: str, payment_id: str):
+        self._items.pop((provider, payment_id), None)
+
+    def add(self, provider: str, payment_id: str, status: str):
+        key = (provider, payment_id)
+        self._items[key] = status
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+recent_events = RecentEvents()
+recent_notifications = RecentEvents()
+
+
+async def already_final(db, provider: str, payment_id: str) -> bool:
+    """True se o pagamento já foi processado em um status terminal."""
+    if recent_events.get(provider, payment_id):
+        cache_hit("payment_events", True)
+        return True
+
+    cache_hit("payment_events", False)
+
+    doc = await db.payment_events.find_one(
+        {
+            "provider": provider,
+            "payment_id": payment_id,
+            "status": {"$in": list(TERMINAL_PAYMENT_STATUSES)},
+        },
+        {"status": 1},
+    )
+
+    if doc:
+        recent_events.add(provider, payment_id, doc["status"])
+        return True
+
+    return False
+
+
+async def record_event(db, provider: str, payment_id: str, status: str, order_id: str | None = None) -> bool:
+    """Grava o evento; retorna False se ele já havia sido registrado."""
+    try:
+        await db.payment_events.insert_one(
+            {
+                "provider": provider,
+                "payment_id": payment_id,
+                "status": status,
+                "order_id": order_id,
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+        inserted = True
+    except DuplicateKeyError:
+        inserted = False
+
+    if status in TERMINAL_PAYMENT_STATUSES:
+        recent_events.add(provider, payment_id, status)
+
+    return inserted
+
+
+async def forget_event(db, provider: str, payment_id: str, status: str):
+    """Desfaz record_event quando o processamento falha, permitindo reenvio."""
+    recent_events.discard(provider, payment_id)
+    await db.payment_events.delete_one(
+        {"provider": provider, "payment_id": payment_id, "status": status}
+    )
+
+
+def notification_key(data: dict) -> str | None:
+    """Identidade da notificação; None se o corpo não permite distinguir reenvios."""
+    payment_id = (data.get("data") or {}).get("id")
+    notification_id = data.get("id")
+    date_created = data.get("date_created")
+
+    if not payment_id or not (notification_id or date_created):
+        return None
+
+    return f"{payment_id}:{notification_id or ''}:{data.get('action') or ''}:{date_created or ''}"
+
+
+async def claim_notification(db, provider: str, key: str) -> bool:
+    """Reserva a notificação; retorna False se ela já foi recebida."""
+    if recent_notifications.get(provider, key):
+        cache_hit("payment_notifications", True)
+        return False
+
+    cache_hit("payment_notifications", False)
+
+    try:
+        await db.payment_notifications.insert_one(
+            {"provider": provider, "key": key, "created_at": datetime.now(timezone.utc)}
+        )
+        claimed = True
+    except DuplicateKeyError:
+        claimed = False
+
+    recent_notifications.add(provider, key, "seen")
+    return claimed
+
+
+async def release_notification(db, provider: str, key: str):
+    """Desfaz claim_notification quando o processamento falha, permitindo reenvio."""
+    recent_notifications.discard(provider, key)
+    await db.payment_notifications.delete_one({"provider": provider, "key": key})
@@ -0,0 +1,97 @@
+"""
+Importa/atualiza produtos em massa a partir de um arquivo CSV ou JSON.
+
+Substitui os scripts inserir_produtos.py / atualizar_produtos.py: em vez
+de editar o catálogo no código, exporte (GET /api/admin/export/products
+?format=csv), edite a planilha e importe de volta. Os produtos são
+casados pelo SKU das variações; o script só grava com --apply.
+
+Como usar:
+    python backend/scripts/importar_catalogo.py catalogo.csv
+    python backend/scripts/importar_catalogo.py catalogo.csv --apply
+"""
+
+import json
+import sys
+import os
+from pathlib import Path
+
+try:
+    from pymongo import MongoClient
+    from pymongo.errors import BulkWriteError
+except ImportError:
+    sys.exit("❌  pymongo não encontrado. Rode: pip install pymongo")
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    sys.exit("❌  python-dotenv não encontrado. Rode: pip install python-dotenv")
+
+env_path = Path(__file__).parent.parent / ".env"
+load_dotenv(env_path)
+
+MONGO_URL = os.getenv("MONGO_URL")
+if not MONGO_URL:
+    sys.exit(f"❌  MONGO_URL não encontrada em {env_path}")
+
+# Reutiliza o serviço já criado no backend
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from app.services.catalog_import import (
+    CatalogImportError, all_skus, chunked, parse_catalog, plan_import, validate_catalog,
+)
+
+args = [a for a in sys.argv[1:] if not a.startswith("--")]
+apply = "--apply" in sys.argv
+
+if not args:
+    sys.exit("Uso: python importar_catalogo.py <arquivo.csv|arquivo.json> [--apply]")
+
+path = Path(args[0])
+
+try:
+    raw_products = parse_catalog(path.read_bytes(), path.name)
+except (OSError, CatalogImportError, json.JSONDecodeError, UnicodeDecodeError) as e:
+    sys.exit(f"❌  Não foi possível ler {path}: {e}")
+
+products, errors = validate_catalog(raw_products)
+
+client = MongoClient(MONGO_URL)
+db_name = MONGO_URL.split("/")[-1].split("?")[0] or "moldz3d"
+col = client[db_name]["products"]
+
+existing = list(col.find({"variations.sku": {"$in": all_skus(products)}}))
+plan = plan_import(products, existing)
+report = plan["report"]
+
+print(f"\n📦  {len(raw_products)} produto(s) no arquivo\n")
+
+for item in report["created"]:
+    print(f"  ➕  Novo: '{item['name']}' ({len(item['skus'])} variação(ões))")
+for item in report["updated"]:
+    print(f"  ✏️   Atualizar [{', '.join(item['fields'])}]: '{item['name']}'")
+print(f"  ✔  Sem mudanças: {len(report['unchanged'])}")
+for item in errors + report["errors"]:
+    print(f"  ❌  Erro em '{item.get('name')}': {item['errors']}")
+
+if not apply:
+    print("\nSimulação apenas. Rode com --apply para gravar.\n")
+elif plan["operations"]:
+    inserted = modified = 0
+    try:
+        for chunk in chunked(plan["operations"]):
+            result = col.bulk_write(chunk, ordered=True)
+            inserted += result.inserted_count
+            modified += result.modified_count
+    except BulkWriteError as e:
+        inserted += e.details.get("nInserted", 0)
+        modified += e.details.get("nModified", 0)
+        for err in e.details.get("writeErrors", []):
+            print(f"  ❌  Erro ao gravar: {err.get('errmsg')}")
+        print(f"\n⚠️   Importação interrompida: {inserted} inserido(s), {modified} atualizado(s) antes do erro.\n")
+        client.close()
+        sys.exit(1)
+    print(f"\n✅  {inserted} inserido(s), {modified} atualizado(s).\n")
+else:
+    print("\nNada a gravar.\n")
+
+client.close()
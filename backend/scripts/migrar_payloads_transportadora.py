@@ -0,0 +1,148 @@
+"""
+Move as respostas brutas do Melhor Envio dos pedidos para `carrier_events`.
+
+Pedidos antigos guardam o retorno completo do checkout e do generate em
+`melhor_envio.checkout` / `melhor_envio.label`. O script grava cada um
+em `carrier_events` e deixa no pedido só o resumo com o `event_id`, no
+mesmo formato que o backend grava hoje. Só grava com --apply.
+
+Pode ser rodado de novo, inclusive depois de uma execução interrompida:
+os pedidos são gravados a cada bloco, pedidos já convertidos são
+ignorados, e o evento é um upsert pela chave (pedido, tipo, hash do
+payload), então um pedido cujo evento já foi inserido reaproveita o
+mesmo documento em vez de duplicar.
+
+Como usar:
+    python backend/scripts/migrar_payloads_transportadora.py
+    python backend/scripts/migrar_payloads_transportadora.py --apply
+"""
+
+import hashlib
+import json
+import sys
+from itertools import islice
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    from pymongo import MongoClient, ReturnDocument, UpdateOne
+except ImportError:
+    sys.exit("❌  pymongo não encontrado. Rode: pip install pymongo")
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    sys.exit("❌  python-dotenv não encontrado. Rode: pip install python-dotenv")
+
+env_path = Path(__file__).parent.parent / ".env"
+load_dotenv(env_path)
+
+MONGO_URL = os.getenv("MONGO_URL")
+if not MONGO_URL:
+    sys.exit(f"❌  MONGO_URL não encontrada em {env_path}")
+
+# Reutiliza o serviço já criado no backend
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from app.services.carrier_events import checkout_summary, event_doc, label_summary
+from app.services.catalog_import import IMPORT_CHUNK_SIZE
+
+apply = "--apply" in sys.argv
+
+client = MongoClient(MONGO_URL)
+db_name = MONGO_URL.split("/")[-1].split("?")[0] or "moldz3d"
+db = client[db_name]
+
+
+def legacy(value) -> bool:
+    """Payload bruto: qualquer valor preenchido que ainda não é um resumo."""
+    return bool(value) and not (isinstance(value, dict) and "event_id" in value)
+
+
+query = {
+    "$or": [
+        {"melhor_envio.checkout": {"$nin": [None, {}]}, "melhor_envio.checkout.event_id": {"$exists": False}},
+        {"melhor_envio.label": {"$nin": [None, {}]}, "melhor_envio.label.event_id": {"$exists": False}},
+    ]
+}
+
+
+def migration_key(order_id, kind: str, payload) -> str:
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{order_id}:{kind}:{digest}"
+
+
+def upsert_event(order_id, kind: str, payload, at):
+    """_id do evento deste payload, inserido só na primeira vez."""
+    key = migration_key(order_id, kind, payload)
+    doc = db.carrier_events.find_one_and_update(
+        {"migration_key": key},
+        {"$setOnInsert": {**event_doc([order_id], kind, payload, at), "migration_key": key}},
+        upsert=True,
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["_id"]
+
+
+def convert(order) -> dict:
+    melhor_envio = order.get("melhor_envio") or {}
+    at = order.get("updated_at") or datetime.now(timezone.utc)
+    fields = {}
+
+    for kind, key in (("checkout", "checkout"), ("generate", "label")):
+        payload = melhor_envio.get(key)
+
+        if not legacy(payload):
+            continue
+
+        event_id = upsert_event(order["_id"], kind, payload, at)
+
+        if kind == "checkout":
+            fields["melhor_envio.checkout"] = checkout_summary(event_id, payload, at)
+        else:
+            fields["melhor_envio.label"] = label_summary(event_id, at)
+
+    return fields
+
+
+def batches(cursor, size: int = IMPORT_CHUNK_SIZE):
+    while chunk := list(islice(cursor, size)):
+        yield chunk
+
+
+orders = db.orders.find(
+    query,
+    {"melhor_envio.checkout": 1, "melhor_envio.label": 1, "updated_at": 1},
+)
+
+if apply:
+    db.carrier_events.create_index("migration_key", unique=True, sparse=True)
+
+events = modified = 0
+
+# grava os pedidos a cada bloco: uma interrupção perde no máximo um bloco,
+# e o upsert dos eventos evita duplicá-los na próxima execução
+for chunk in batches(orders):
+    events += sum(
+        legacy((o.get("melhor_envio") or {}).get(key))
+        for o in chunk
+        for key in ("checkout", "label")
+    )
+
+    if not apply:
+        continue
+
+    ops = [UpdateOne({"_id": o["_id"]}, {"$set": fields}) for o in chunk if (fields := convert(o))]
+
+    if ops:
+        modified += db.orders.bulk_write(ops, ordered=False).modified_count
+
+print(f"\n🚚  {events} payload(s) do Melhor Envio para mover para carrier_events\n")
+
+if not apply:
+    print("Simulação apenas. Rode com --apply para gravar.\n")
+else:
+    print(f"✅  {modified} pedido(s) convertido(s).\n")
+
+client.close()
@@ -0,0 +1,158 @@
+"""
+Stub local do Melhor Envio e do Mercado Pago com injeção de falhas.
+
+Serve para exercitar timeouts, novas tentativas e o circuit breaker sem
+depender dos sandboxes. Aponte o backend para o stub:
+
+    MELHOR_ENVIO_BASE_URL=http://127.0.0.1:8090
+    MP_BASE_URL=http://127.0.0.1:8090
+
+Como usar:
+    python backend/scripts/stub_falhas.py                 # porta 8090
+    FAULT_ERROR_RATE=0.5 FAULT_LATENCY_MS=3000 python backend/scripts/stub_falhas.py
+
+As falhas também podem ser trocadas com o stub rodando:
+    curl -X POST 'http://127.0.0.1:8090/_faults?error_rate=1&latency_ms=0'
+"""
+
+import asyncio
+import os
+import random
+import sys
+import uuid
+
+try:
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, Response
+except ImportError:
+    sys.exit("❌  fastapi/uvicorn não encontrados. Rode: pip install -r backend/requirements.txt")
+
+faults = {
+    # fração das requisições que respondem 503
+    "error_rate": float(os.getenv("FAULT_ERROR_RATE", "0")),
+    # atraso fixo antes de responder
+    "latency_ms": float(os.getenv("FAULT_LATENCY_MS", "0")),
+    # fração das requisições que nunca respondem (provoca timeout)
+    "hang_rate": float(os.getenv("FAULT_HANG_RATE", "0")),
+}
+
+app = FastAPI(title="Stub Melhor Envio / Mercado Pago")
+
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    if request.url.path.startswith("/_faults"):
+        return await call_next(request)
+
+    if random.random() < faults["hang_rate"]:
+        await asyncio.sleep(3600)
+
+    if faults["latency_ms"]:
+        await asyncio.sleep(faults["latency_ms"] / 1000)
+
+    if random.random() < faults["error_rate"]:
+        return JSONResponse({"message": "falha injetada"}, status_code=503)
+
+    return await call_next(request)
+
+
+@app.post("/_faults")
+async def set_faults(error_rate: float | None = None, latency_ms: float | None = None, hang_rate: float | None = None):
+    for key, value in (("error_rate", error_rate), ("latency_ms", latency_ms), ("hang_rate", hang_rate)):
+        if value is not None:
+            faults[key] = value
+    return faults
+
+
+# ── Melhor Envio ──────────────────────────────────────────────
+
+@app.post("/api/v2/me/shipment/calculate")
+async def calculate():
+    return [
+        {"id": 1, "name": "PAC", "price": "25.90", "delivery_time": 8, "company": {"name": "Correios"}},
+        {"id": 2, "name": "SEDEX", "price": "42.10", "delivery_time": 3, "company": {"name": "Correios"}},
+    ]
+
+
+@app.post("/api/v2/me/cart")
+async def cart():
+    return {"id": str(uuid.uuid4()), "status": "pending"}
+
+
+@app.post("/api/v2/me/shipment/checkout")
+async def checkout(request: Request):
+    body = await request.json()
+    return {"purchase": {"id": str(uuid.uuid4()), "orders": [{"id": o} for o in body.get("orders", [])]}}
+
+
+@app.post("/api/v2/me/shipment/generate")
+async def generate(request: Request):
+    body = await request.json()
+    return {o: {"status": True, "message": "Envio gerado"} for o in body.get("orders", [])}
+
+
+def minimal_pdf() -> bytes:
+    """PDF válido de uma página (o suficiente para juntar etiquetas em lote)."""
+    objects = [
+        b"<</Type/Catalog/Pages 2 0 R>>",
+        b"<</Type/Pages/Kids[3 0 R]/Count 1>>",
+        b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 283 425]>>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    return bytes(out)
+
+
+LABEL_PDF = minimal_pdf()
+
+
+@app.get("/api/v2/me/shipment/print/{order_id}")
+async def print_label(order_id: str):
+    return Response(LABEL_PDF, media_type="application/pdf")
+
+
+@app.post("/api/v2/me/shipment/print")
+async def print_labels():
+    return Response(LABEL_PDF, media_type="application/pdf")
+
+
+@app.get("/api/v2/me/shipment/tracking/{order_id}")
+async def tracking(order_id: str):
+    return {order_id: {"status": "posted", "tracking": "BR123456789", "events": []}}
+
+
+@app.post("/api/v2/me/shipment/tracking")
+async def tracking_batch(request: Request):
+    body = await request.json()
+    return {
+        o: {"status": "posted", "tracking": f"BR{abs(hash(o)) % 10**9:09d}BR", "events": []}
+        for o in body.get("orders", [])
+    }
+
+
+# ── Mercado Pago ──────────────────────────────────────────────
+
+@app.post("/checkout/preferences")
+async def preference():
+    pref_id = str(uuid.uuid4())
+    return {"id": pref_id, "init_point": f"http://127.0.0.1:8090/checkout/{pref_id}"}
+
+
+@app.get("/v1/payments/{payment_id}")
+async def payment(payment_id: str):
+    return {"id": payment_id, "status": "approved", "external_reference": None}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8090")))
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# o pacote `app` fica em backend/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
@@ -0,0 +1,108 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import DuplicateKeyError
+
+from app.routes import admin
+from app.services.sku_index import sku_index
+
+
+class UniqueSkuProducts:
+    """mongomock não aplica índice único multikey; emula variations.sku."""
+
+    def __init__(self, collection, with_key_value=True):
+        self._collection = collection
+        self._with_key_value = with_key_value
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def _check(self, variations, exclude=None):
+        for v in variations or []:
+            query = {"variations.sku": v["sku"]}
+            if exclude is not None:
+                query["_id"] = {"$ne": exclude}
+
+            if await self._collection.find_one(query):
+                details = {"keyValue": {"variations.sku": v["sku"]}} if self._with_key_value else {}
+                raise DuplicateKeyError("E11000 duplicate key error", 11000, details)
+
+    async def insert_one(self, doc):
+        await self._check(doc.get("variations"))
+        return await self._collection.insert_one(doc)
+
+    async def update_one(self, query, update):
+        await self._check(update["$set"].get("variations"), query["_id"])
+        return await self._collection.update_one(query, update)
+
+
+class DB:
+    def __init__(self, products):
+        self.products = products
+
+
+def variation(sku):
+    return {
+        "sku": sku, "model": "M", "color": "preto", "size": "P", "price": 10,
+        "weight_kg": 0.1, "width_cm": 5, "height_cm": 5, "length_cm": 5, "stock": 1,
+    }
+
+
+def admin_client(monkeypatch, with_key_value=True):
+    db = DB(UniqueSkuProducts(AsyncMongoMockClient()["test"].products, with_key_value))
+    monkeypatch.setattr(admin, "get_db", lambda: db)
+
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[admin.get_admin_user] = lambda: {"is_admin": True}
+    return TestClient(app)
+
+
+def test_duplicate_sku_returns_409_with_the_sku(monkeypatch):
+    client = admin_client(monkeypatch)
+    body = {"name": "Vaso", "description": "Vaso", "variations": [variation("VASO-1")]}
+
+    first = client.post("/api/admin/products", json=body)
+    assert first.status_code == 201
+
+    other = client.post("/api/admin/products", json={**body, "variations": [variation("COPO-1")]})
+
+    response = client.post("/api/admin/products", json={**body, "variations": [variation("X"), variation("VASO-1")]})
+    assert response.status_code == 409
+    assert "VASO-1" in response.json()["detail"]
+
+    response = client.patch(f"/api/admin/products/{other.json()['id']}", json={"variations": [variation("VASO-1")]})
+    assert response.status_code == 409
+    assert "VASO-1" in response.json()["detail"]
+
+
+def test_duplicate_sku_without_key_value_is_looked_up(monkeypatch):
+    client = admin_client(monkeypatch, with_key_value=False)
+    body = {"name": "Vaso", "description": "Vaso", "variations": [variation("VASO-1")]}
+    product_id = client.post("/api/admin/products", json=body).json()["id"]
+
+    # o próprio produto não conta como conflito
+    assert client.put(f"/api/admin/products/{product_id}", json=body).status_code == 200
+
+    response = client.post("/api/admin/products", json={**body, "variations": [variation("A"), variation("VASO-1")]})
+    assert response.status_code == 409
+    assert response.json()["detail"].endswith("VASO-1")
+
+
+def test_product_writes_invalidate_sku_index(monkeypatch):
+    client = admin_client(monkeypatch)
+    body = {"name": "Vaso", "description": "Vaso", "variations": [variation("VASO-1")]}
+
+    sku_index._loaded = True
+    product_id = client.post("/api/admin/products", json=body).json()["id"]
+    assert sku_index._loaded is False
+
+    sku_index._loaded = True
+    client.patch(f"/api/admin/products/{product_id}", json={"variations": [variation("VASO-2")]})
+    assert sku_index._loaded is False
+
+    sku_index._loaded = True
+    client.delete(f"/api/admin/products/{product_id}")
+    assert sku_index._loaded is False
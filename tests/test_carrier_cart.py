@@ -0,0 +1,161 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core import config
+from app.services import order_service
+from app.services.order_service import ensure_carrier_cart
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.text = str(data)
+
+    def json(self):
+        return self._data
+
+
+def paid_order(**melhor_envio):
+    # duas unidades de 20 kg: não cabem juntas na GG (30 kg), viram dois volumes
+    return {
+        "_id": ObjectId(),
+        "status": "paid",
+        "items": [
+            {
+                "sku": "A", "name": "Estátua", "quantity": 2, "unit_price": 100,
+                "length_cm": 50, "width_cm": 30, "height_cm": 25, "weight_kg": 20,
+            }
+        ],
+        "address": {
+            "to_cep": "01001000", "receiver_name": "Ana", "receiver_phone": "11999999999",
+            "receiver_document": "12345678909", "receiver_address": "Praça da Sé",
+            "receiver_number": "1", "receiver_district": "Sé", "receiver_city": "São Paulo",
+            "receiver_state": "SP",
+        },
+        "shipping": {"service_id": 1},
+        "total": 200,
+        "melhor_envio": melhor_envio,
+    }
+
+
+def patch_me(monkeypatch, responses):
+    calls = []
+
+    async def token_doc():
+        return {}
+
+    async def http_post(url, payload, token):
+        calls.append(payload)
+        return responses.pop(0)
+
+    monkeypatch.setattr(config, "MELHOR_ENVIO_FROM_CEP", "01001000")
+    monkeypatch.setattr(order_service.me, "get_current_token_doc", token_doc)
+    monkeypatch.setattr(order_service.me, "http_post", http_post)
+    return calls
+
+
+def test_failed_parcel_keeps_created_carts_and_retry_creates_only_the_rest(monkeypatch):
+    calls = patch_me(monkeypatch, [
+        FakeResponse(200, {"id": "cart-1"}),
+        FakeResponse(500, {"error": "falhou"}),
+        FakeResponse(200, {"id": "cart-2"}),
+    ])
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        order = paid_order()
+        await db.orders.insert_one(order)
+
+        failed = await ensure_carrier_cart(db, order)
+        stored = await db.orders.find_one({"_id": order["_id"]})
+
+        done = await ensure_carrier_cart(db, failed, {"status": 1, "melhor_envio": 1})
+        return failed, stored, done
+
+    failed, stored, done = asyncio.run(main())
+
+    assert stored["melhor_envio"]["cart_parcels"] == {"0": "cart-1"}
+    assert stored["melhor_envio"]["cart_error"]
+    assert len(calls) == 3
+    assert done["melhor_envio"]["cart_order_ids"] == ["cart-1", "cart-2"]
+    assert "cart_parcels" not in done["melhor_envio"]
+    assert "cart_pending_at" not in done["melhor_envio"]
+
+
+def test_stale_claim_is_taken_over_but_live_claim_is_not(monkeypatch):
+    calls = patch_me(monkeypatch, [FakeResponse(200, {"id": "c1"}), FakeResponse(200, {"id": "c2"})])
+    now = datetime.now(timezone.utc)
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        live = paid_order(cart_pending=True, cart_pending_at=now)
+        stale = paid_order(
+            cart_pending=True,
+            cart_pending_at=now - timedelta(minutes=config.CARRIER_CART_CLAIM_MINUTES + 1),
+        )
+        await db.orders.insert_many([live, stale])
+
+        await ensure_carrier_cart(db, live)
+        return await ensure_carrier_cart(db, stale)
+
+    result = asyncio.run(main())
+
+    assert len(calls) == 2
+    assert result["melhor_envio"]["cart_order_ids"] == ["c1", "c2"]
+
+
+def test_sweep_retries_failed_and_abandoned_carts(monkeypatch):
+    calls = patch_me(monkeypatch, [FakeResponse(200, {"id": f"c{i}"}) for i in range(4)])
+    now = datetime.now(timezone.utc)
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        failed = paid_order(cart_pending=False, cart_error="Melhor Envio fora do ar")
+        abandoned = paid_order(
+            cart_pending=True,
+            cart_pending_at=now - timedelta(minutes=config.CARRIER_CART_CLAIM_MINUTES + 1),
+        )
+        in_progress = paid_order(cart_pending=True, cart_pending_at=now)
+        never_failed = paid_order(cart_pending=False)
+        await db.orders.insert_many([failed, abandoned, in_progress, never_failed])
+
+        result = await order_service.retry_carrier_carts(db)
+        stored = await db.orders.find_one({"_id": failed["_id"]})
+        return result, stored
+
+    result, stored = asyncio.run(main())
+
+    assert result == {"orders": 2, "created": 2}
+    assert len(calls) == 4
+    assert stored["melhor_envio"]["cart_order_ids"] == ["c0", "c1"]
+    assert stored["melhor_envio"]["cart_error"] is None
+
+
+def test_admin_retry_endpoint(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.routes import admin
+
+    patch_me(monkeypatch, [FakeResponse(200, {"id": "c1"}), FakeResponse(200, {"id": "c2"})])
+    db = AsyncMongoMockClient()["test"]
+    order = paid_order(cart_pending=False, cart_error="falhou")
+    created = {**paid_order(), "status": "created"}
+    asyncio.run(db.orders.insert_many([order, created]))
+
+    monkeypatch.setattr(admin, "get_db", lambda: db)
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[admin.get_admin_user] = lambda: {"role": "admin"}
+    client = TestClient(app)
+
+    response = client.post(f"/api/admin/orders/{order['_id']}/carrier-cart")
+    assert response.status_code == 200
+    assert response.json()["cart_order_ids"] == ["c1", "c2"]
+    assert response.json()["cart_error"] is None
+
+    assert client.post(f"/api/admin/orders/{created['_id']}/carrier-cart").status_code == 409
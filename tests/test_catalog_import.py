@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services.catalog_import import import_catalog
+from app.services.sku_index import sku_index
+
+
+def product(name, sku):
+    return {
+        "name": name,
+        "description": "Peça impressa em 3D",
+        "variations": [
+            {
+                "sku": sku, "model": "M", "color": "preto", "size": "P", "price": 10,
+                "weight_kg": 0.1, "width_cm": 5, "height_cm": 5, "length_cm": 5, "stock": 1,
+            }
+        ],
+    }
+
+
+def test_write_error_reports_applied_operations_and_invalidates_index():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.products.create_index("name", unique=True)
+        await db.products.insert_one({**product("Vaso", "OLD-1"), "active": True})
+
+        sku_index._loaded = True
+        content = json.dumps([product("Luminária", "NEW-1"), product("Vaso", "NEW-2"), product("Copo", "NEW-3")])
+
+        return await import_catalog(db, content.encode(), "catalogo.json", dry_run=False), db
+
+    report, db = asyncio.run(run())
+
+    assert report["partial"] is True
+    assert report["applied"] == {"inserted": 1, "modified": 0}
+    assert [e["operation"] for e in report["write_errors"]] == [1]
+    assert report["write_errors"][0]["code"] == 11000
+    assert sku_index._loaded is False
+
+
+def test_successful_import_is_not_partial():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        content = json.dumps([product("Luminária", "NEW-1")])
+        return await import_catalog(db, content.encode(), "catalogo.json", dry_run=False)
+
+    report = asyncio.run(run())
+
+    assert report["partial"] is False
+    assert report["applied"] == {"inserted": 1, "modified": 0}
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services import idempotency
+from app.services.idempotency import request_fingerprint, run_idempotent
+
+PAYLOAD = {"items": [{"sku": "A", "quantity": 1}]}
+
+
+def processing_record(lease_until):
+    return {
+        "_id": "orders.create:u1:k1",
+        "status": "processing",
+        "fingerprint": request_fingerprint(PAYLOAD),
+        "created_at": lease_until - timedelta(seconds=60),
+        "lease_until": lease_until,
+    }
+
+
+def run(db, handler, payload=PAYLOAD):
+    return run_idempotent(db, "orders.create", "k1", "u1", payload, handler)
+
+
+def test_replays_completed_response():
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"id": "o1"}
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        return await run(db, handler), await run(db, handler)
+
+    assert asyncio.run(main()) == ({"id": "o1"}, {"id": "o1"})
+    assert len(calls) == 1
+
+
+def test_stale_processing_record_is_taken_over():
+    async def handler():
+        return {"id": "o2"}
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await db.idempotency_keys.insert_one(processing_record(datetime.now(timezone.utc) - timedelta(seconds=1)))
+
+        response = await run(db, handler)
+        return response, await db.idempotency_keys.find_one({"_id": "orders.create:u1:k1"})
+
+    response, record = asyncio.run(main())
+
+    assert response == {"id": "o2"}
+    assert record["status"] == "completed"
+
+
+def test_live_processing_record_still_conflicts(monkeypatch):
+    monkeypatch.setattr(idempotency, "WAIT_TIMEOUT_SECONDS", 0.3)
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL_SECONDS", 0.05)
+
+    async def handler():
+        raise AssertionError("handler não deve rodar")
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await db.idempotency_keys.insert_one(processing_record(datetime.now(timezone.utc) + timedelta(seconds=60)))
+        await run(db, handler)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main())
+
+    assert exc.value.status_code == 409
+
+
+def test_stale_record_with_other_payload_is_rejected():
+    async def handler():
+        raise AssertionError("handler não deve rodar")
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await db.idempotency_keys.insert_one(processing_record(datetime.now(timezone.utc) - timedelta(seconds=1)))
+        await run(db, handler, payload={"items": []})
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main())
+
+    assert exc.value.status_code == 422
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services import label_store as label_store_module
+from app.services.label_store import LabelStore, fetch_label, label_response
+
+PDF = b"%PDF-1.4 " + b"x" * 200_000
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {"content-type": "application/pdf"}
+    text = ""
+
+    def __init__(self, content):
+        self.content = content
+
+
+def serve(f, range_header=None):
+    app = FastAPI()
+
+    @app.get("/label")
+    def label():
+        return label_response(f, "application/pdf", "etiqueta.pdf", range_header)
+
+    return TestClient(app).get("/label")
+
+
+def test_label_evicted_after_open_is_still_served(tmp_path):
+    store = LabelStore(tmp_path, max_bytes=10 * 1024 * 1024)
+    digest = store.put(PDF, "application/pdf")
+
+    f = store.open(digest, "application/pdf")
+
+    # put concorrente de outro pedido remove o arquivo antes do streaming
+    store._path(digest, "application/pdf").unlink()
+    assert store.open(digest, "application/pdf") is None
+
+    response = serve(f)
+    assert response.status_code == 200
+    assert response.content == PDF
+    assert f.closed
+
+
+def test_invalid_range_closes_file(tmp_path):
+    store = LabelStore(tmp_path, max_bytes=10 * 1024 * 1024)
+    f = store.open(store.put(PDF, "application/pdf"), "application/pdf")
+
+    with pytest.raises(HTTPException) as e:
+        label_response(f, "application/pdf", "etiqueta.pdf", f"bytes={len(PDF) + 10}-")
+
+    assert e.value.status_code == 416
+    assert f.closed
+
+
+def test_fetch_label_never_returns_missing_file(monkeypatch, tmp_path):
+    # limite menor que a etiqueta: o put seguinte de outro pedido a remove
+    store = LabelStore(tmp_path, max_bytes=len(PDF) + 10)
+    other = b"%PDF-1.4 outro pedido" + b"y" * 100
+    original_put = store.put
+
+    def put_then_evict(content, content_type):
+        digest = original_put(content, content_type)
+        original_put(other, content_type)
+        store._path(digest, content_type).unlink(missing_ok=True)
+        return digest
+
+    async def token_doc():
+        return {}
+
+    async def http_get(url, token):
+        return FakeResponse(PDF)
+
+    monkeypatch.setattr(store, "put", put_then_evict)
+    monkeypatch.setattr(label_store_module, "label_store", store)
+    monkeypatch.setattr(label_store_module.me, "get_current_token_doc", token_doc)
+    monkeypatch.setattr(label_store_module.me, "http_get", http_get)
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        order = {"_id": ObjectId(), "melhor_envio": {"cart_order_ids": ["c1"]}}
+        await db.orders.insert_one(order)
+        return await fetch_label(db, order)
+
+    f, content_type = asyncio.run(main())
+
+    assert content_type == "application/pdf"
+    assert f.read() == PDF
@@ -0,0 +1,43 @@
+import runpy
+import sys
+from pathlib import Path
+
+import mongomock
+import pymongo
+from bson import ObjectId
+
+SCRIPT = Path(__file__).resolve().parents[1] / "backend" / "scripts" / "migrar_payloads_transportadora.py"
+
+CHECKOUT = {"purchase": {"id": "p1"}, "orders": ["c1"]}
+LABEL = {"c1": {"status": True, "message": "ok"}}
+
+
+def run_script(monkeypatch, client):
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost/loja")
+    monkeypatch.setattr(pymongo, "MongoClient", lambda url: client)
+    monkeypatch.setattr(sys, "argv", [str(SCRIPT), "--apply"])
+    monkeypatch.setattr(client, "close", lambda: None)
+    runpy.run_path(str(SCRIPT), run_name="__main__")
+
+
+def test_rerun_after_interruption_does_not_duplicate_events(monkeypatch):
+    client = mongomock.MongoClient()
+    db = client["loja"]
+    order_id = ObjectId()
+    db.orders.insert_one({"_id": order_id, "melhor_envio": {"checkout": CHECKOUT, "label": LABEL}})
+
+    run_script(monkeypatch, client)
+
+    # simula uma execução interrompida: eventos gravados, pedido ainda com o bruto
+    migrated = db.orders.find_one({"_id": order_id})
+    db.orders.update_one({"_id": order_id}, {"$set": {"melhor_envio": {"checkout": CHECKOUT, "label": LABEL}}})
+
+    run_script(monkeypatch, client)
+    run_script(monkeypatch, client)
+
+    order = db.orders.find_one({"_id": order_id})
+
+    assert db.carrier_events.count_documents({}) == 2
+    assert order["melhor_envio"]["checkout"]["event_id"] == migrated["melhor_envio"]["checkout"]["event_id"]
+    assert order["melhor_envio"]["checkout"]["purchase_id"] == "p1"
+    assert order["melhor_envio"]["label"]["generated"] is True
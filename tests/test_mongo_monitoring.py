@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from app.core.metrics import registry
+from app.db.monitoring import MongoCommandMonitor, mongo_pool_monitor
+
+
+def event(request_id, duration_ms=3.0, command="find"):
+    return SimpleNamespace(
+        command_name=command,
+        command={command: "orders", "filter": {"status": "paid"}},
+        request_id=request_id,
+        connection_id=("localhost", 27017),
+        duration_micros=int(duration_ms * 1000),
+        address=("localhost", 27017),
+    )
+
+
+def test_command_latency_goes_through_the_shared_registry():
+    monitor = MongoCommandMonitor(slow_ms=1000)
+    monitor.reset()
+
+    for request_id, ms in ((1, 3.0), (2, 30.0)):
+        monitor.started(event(request_id, ms))
+        monitor.succeeded(event(request_id, ms))
+
+    monitor.started(event(3))
+    monitor.failed(event(3))
+
+    text = registry.render()
+
+    assert text.count("# TYPE mongo_command_duration_seconds histogram") == 1
+    assert 'mongo_command_duration_seconds_count{command="find",collection="orders",route="-"} 3' in text
+    assert 'mongo_command_failures_total{command="find",collection="orders",route="-"} 1' in text
+
+    [entry] = monitor.snapshot()["commands"]
+
+    assert entry["count"] == 3
+    assert entry["failures"] == 1
+    assert entry["max_ms"] == 30.0
+    assert entry["buckets"]["5"] == 2
+    assert entry["buckets"]["50"] == 1
+
+
+def test_pool_gauges_are_registry_metrics():
+    created = event(0)
+
+    mongo_pool_monitor.connection_created(created)
+    mongo_pool_monitor.connection_checked_out(created)
+
+    text = registry.render()
+
+    assert text.count("# TYPE mongo_pool_connections gauge") == 1
+    assert 'mongo_pool_checked_out{address="localhost:27017"} 1' in text
+
+    mongo_pool_monitor.connection_checked_in(created)
+    mongo_pool_monitor.connection_closed(created)
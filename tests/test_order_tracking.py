@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services import order_service, tracking_refresh
+from app.services.order_service import get_order_tracking
+
+
+def test_order_without_stored_tracking_is_pending_without_calling_carrier(monkeypatch):
+    async def forbidden(*args, **kwargs):
+        raise AssertionError("não deve chamar o Melhor Envio")
+
+    monkeypatch.setattr(tracking_refresh.me, "http_post", forbidden)
+    monkeypatch.setattr(order_service.me, "get_current_token_doc", forbidden)
+
+    order = {"_id": ObjectId(), "melhor_envio": {"cart_order_ids": ["c1"]}}
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await db.orders.insert_one(order)
+        return await get_order_tracking(db, str(order["_id"]))
+
+    assert asyncio.run(main()) == {"tracking": {}, "refreshed_at": None, "stale": False, "pending": True}
+
+
+def test_stored_tracking_is_served():
+    now = datetime.now(timezone.utc)
+    order = {
+        "_id": ObjectId(),
+        "melhor_envio": {
+            "cart_order_ids": ["c1"],
+            "tracking": {"data": {"c1": {"status": "posted"}}, "refreshed_at": now},
+        },
+    }
+
+    result = asyncio.run(get_order_tracking(None, str(order["_id"]), order))
+
+    assert result["tracking"] == {"c1": {"status": "posted"}}
+    assert result["pending"] is False
+    assert result["stale"] is False
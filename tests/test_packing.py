@@ -0,0 +1,39 @@
+from app.services.packing import pack_items
+
+
+def item(length, width, height, weight, quantity=1, sku="A"):
+    return {
+        "sku": sku, "name": sku, "unit_price": 10, "quantity": quantity,
+        "length_cm": length, "width_cm": width, "height_cm": height, "weight_kg": weight,
+    }
+
+
+def test_single_small_item_ships_in_its_own_packaging_when_cheaper():
+    # o cubo de 10 cm só cabe na G (36x27x18), que cuba 2.916 kg
+    [parcel] = pack_items([item(10, 10, 10, 0.2)])
+
+    assert parcel["box"] is None
+    assert (parcel["length"], parcel["width"], parcel["height"]) == (10, 10, 10)
+    assert parcel["billable_weight"] == 0.2
+
+
+def test_single_item_never_billed_above_its_own_packaging():
+    for dims in ((10, 8, 4), (15, 10, 5), (25, 17, 8), (30, 20, 15)):
+        [parcel] = pack_items([item(*dims, 0.3)])
+        own = max(0.3, dims[0] * dims[1] * dims[2] / 6000)
+
+        assert parcel["billable_weight"] <= round(own, 3)
+
+
+def test_several_units_share_the_smallest_box_that_holds_them():
+    parcels = pack_items([item(10, 8, 4, 0.1, quantity=6)])
+
+    assert [p["box"] for p in parcels] == ["M"]
+    assert parcels[0]["items"][0]["quantity"] == 6
+
+
+def test_oversized_unit_keeps_its_own_dimensions():
+    [parcel] = pack_items([item(80, 40, 40, 5)])
+
+    assert parcel["box"] is None
+    assert parcel["length"] == 80
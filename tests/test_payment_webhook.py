@@ -0,0 +1,168 @@
+import asyncio
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from app.routes import payments
+from app.services.webhook_ledger import already_final, recent_events, record_event
+
+
+def test_approved_payment_is_not_terminal():
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await record_event(db, "mercadopago", "p1", "approved")
+        before = await already_final(db, "mercadopago", "p1")
+
+        await record_event(db, "mercadopago", "p1", "refunded")
+        return before, await already_final(db, "mercadopago", "p1")
+
+    assert asyncio.run(main()) == (False, True)
+
+
+def test_refund_after_approval_cancels_order(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    order_id = ObjectId()
+    status = {"value": "refunded"}
+
+    async def get_payment(payment_id):
+        return {"external_reference": str(order_id), "status": status["value"]}
+
+    async def setup():
+        await db.orders.insert_one({
+            "_id": order_id, "status": "paid", "payment_id": "p2", "payment_status": "paid",
+            "payment_provider": "mercadopago", "mercado_pago": {"payment_id": "p2"},
+        })
+        await record_event(db, "mercadopago", "p2", "approved", str(order_id))
+
+    asyncio.run(setup())
+    recent_events.discard("mercadopago", "p2")
+
+    monkeypatch.setattr(payments, "get_db", lambda: db)
+    monkeypatch.setattr(payments, "get_payment", get_payment)
+
+    app = FastAPI()
+    app.include_router(payments.router)
+    client = TestClient(app)
+    body = {"type": "payment", "data": {"id": "p2"}}
+
+    assert client.post("/api/payments/webhook", json=body).json() == {"ok": True}
+
+    order = asyncio.run(db.orders.find_one({"_id": order_id}))
+    assert order["status"] == "cancelled"
+    assert order["payment_status"] == "refunded"
+
+    # reenvio do estorno: descartado antes de consultar o Mercado Pago
+    status["value"] = None
+    assert client.post("/api/payments/webhook", json=body).json() == {"ok": True, "duplicate": True}
+
+
+def webhook_client(monkeypatch, db, get_payment):
+    monkeypatch.setattr(payments, "get_db", lambda: db)
+    monkeypatch.setattr(payments, "get_payment", get_payment)
+
+    app = FastAPI()
+    app.include_router(payments.router)
+    return TestClient(app)
+
+
+def notification(payment_id, notification_id, action="payment.updated"):
+    return {
+        "id": notification_id,
+        "type": "payment",
+        "action": action,
+        "date_created": "2026-10-19T12:00:00Z",
+        "data": {"id": payment_id},
+    }
+
+
+def test_redelivered_approval_does_not_call_mercado_pago(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    order_id = ObjectId()
+    calls = []
+
+    async def get_payment(payment_id):
+        calls.append(payment_id)
+        return {"external_reference": str(order_id), "status": "approved"}
+
+    async def ensure_carrier_cart(db, doc, projection=None):
+        return doc
+
+    asyncio.run(db.orders.insert_one({
+        "_id": order_id, "status": "created", "payment_id": "pref-1", "payment_provider": "mercadopago",
+        "mercado_pago": {"preference_id": "pref-1"}, "melhor_envio": {"cart_order_ids": []},
+    }))
+    monkeypatch.setattr("app.services.order_service.ensure_carrier_cart", ensure_carrier_cart)
+    client = webhook_client(monkeypatch, db, get_payment)
+    body = notification("p3", 111, "payment.created")
+
+    assert client.post("/api/payments/webhook", json=body).json() == {"ok": True}
+    assert client.post("/api/payments/webhook", json=body).json() == {"ok": True, "duplicate": True}
+    assert calls == ["p3"]
+
+    order = asyncio.run(db.orders.find_one({"_id": order_id}))
+    assert order["status"] == "paid"
+    assert order["mercado_pago"]["payment_id"] == "p3"
+
+    # notificação nova do mesmo pagamento (ex.: estorno) ainda consulta
+    recent_events.discard("mercadopago", "p3")
+    client.post("/api/payments/webhook", json=notification("p3", 112))
+    assert calls == ["p3", "p3"]
+
+
+def test_failed_processing_releases_notification(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    calls = []
+
+    async def get_payment(payment_id):
+        calls.append(payment_id)
+        if len(calls) == 1:
+            raise RuntimeError("Mercado Pago fora do ar")
+        return {}
+
+    client = webhook_client(monkeypatch, db, get_payment)
+    client_errors = TestClient(client.app, raise_server_exceptions=False)
+    body = notification("p4", 211)
+
+    assert client_errors.post("/api/payments/webhook", json=body).status_code == 500
+    assert client.post("/api/payments/webhook", json=body).json() == {"ok": True}
+    assert calls == ["p4", "p4"]
+
+
+def test_refund_cancels_order_paid_by_admin(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    order_id = ObjectId()
+
+    async def get_payment(payment_id):
+        return {"external_reference": str(order_id), "status": "refunded"}
+
+    # pago pelo PATCH do admin: payment_id ainda é o da preferência
+    asyncio.run(db.orders.insert_one({
+        "_id": order_id, "status": "paid", "payment_status": "paid", "payment_id": "pref-2",
+        "payment_provider": "mercadopago", "mercado_pago": {"preference_id": "pref-2"},
+    }))
+    client = webhook_client(monkeypatch, db, get_payment)
+
+    assert client.post("/api/payments/webhook", json=notification("p5", 311)).json() == {"ok": True}
+
+    order = asyncio.run(db.orders.find_one({"_id": order_id}))
+    assert order["status"] == "cancelled"
+    assert order["payment_status"] == "refunded"
+
+
+def test_refund_of_another_payment_keeps_order_paid(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    order_id = ObjectId()
+
+    async def get_payment(payment_id):
+        return {"external_reference": str(order_id), "status": "refunded"}
+
+    asyncio.run(db.orders.insert_one({
+        "_id": order_id, "status": "paid", "payment_status": "paid", "payment_id": "p6",
+        "payment_provider": "mercadopago", "mercado_pago": {"payment_id": "p6"},
+    }))
+    client = webhook_client(monkeypatch, db, get_payment)
+
+    assert client.post("/api/payments/webhook", json=notification("p7", 411)).json() == {"ok": True}
+    assert asyncio.run(db.orders.find_one({"_id": order_id}))["status"] == "paid"
@@ -0,0 +1,192 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from app.core import metrics, rate_limit
+from app.core.rate_limit import (
+    MemoryBucketStore, MongoBucketStore, RateLimitMiddleware, Rule, client_ip, parse_rules,
+)
+from app.core.request_context import RequestContextMiddleware
+
+BACKEND = Path(__file__).resolve().parents[1] / "backend"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def take(store, key, rule):
+    return asyncio.run(store.take(key, rule))
+
+
+# ── regras ──
+
+def test_parse_rules():
+    rules = parse_rules("POST /api/auth/login=10/60:8, get /api/x=5/1")
+
+    login = rules[("POST", "/api/auth/login")]
+    assert (login.capacity, login.period, login.concurrency) == (10, 60.0, 8)
+    assert rules[("GET", "/api/x")].concurrency is None
+
+
+def test_parse_rules_ignores_bad_specs():
+    rules = parse_rules("POST /ok=1/1,semigual,POST /a=x/60,POST /b=10,/sem-metodo=1/1,POST /c=1/1:y,,")
+
+    assert list(rules) == [("POST", "/ok")]
+
+
+# ── token bucket ──
+
+def test_bucket_allows_burst_then_refills_at_rate(clock):
+    store = MemoryBucketStore()
+    rule = Rule("POST", "/x", capacity=3, period=60)  # 1 token a cada 20 s
+
+    assert [take(store, "k", rule)[0] for _ in range(3)] == [True, True, True]
+
+    allowed, retry_after = take(store, "k", rule)
+    assert not allowed
+    assert retry_after == pytest.approx(20)
+
+    clock.now += 10
+    allowed, retry_after = take(store, "k", rule)
+    assert not allowed
+    assert retry_after == pytest.approx(10)
+
+    clock.now += 10
+    assert take(store, "k", rule)[0]
+    assert not take(store, "k", rule)[0]
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    store = MemoryBucketStore()
+    rule = Rule("POST", "/x", capacity=2, period=1)
+
+    take(store, "k", rule)
+    clock.now += 3600
+
+    assert [take(store, "k", rule)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_buckets_are_per_key_and_capped(clock):
+    store = MemoryBucketStore(max_keys=2)
+    rule = Rule("POST", "/x", capacity=1, period=60)
+
+    assert take(store, "a", rule)[0]
+    assert take(store, "b", rule)[0]
+    assert not take(store, "a", rule)[0]
+
+    take(store, "c", rule)
+    assert len(store._buckets) == 2
+
+
+def test_mongo_store_rejects_known_empty_bucket_without_round_trip(clock):
+    store = MongoBucketStore()
+    calls = []
+
+    async def _take(key, rule):
+        calls.append(key)
+        return False, 5.0
+
+    store._take = _take
+    rule = Rule("POST", "/x", capacity=1, period=5)
+
+    assert take(store, "k", rule) == (False, 5.0)
+    clock.now += 2
+    assert take(store, "k", rule) == (False, pytest.approx(3.0))
+    assert calls == ["k"]
+
+    clock.now += 4
+    take(store, "k", rule)
+    assert calls == ["k", "k"]
+
+
+# ── IP do cliente ──
+
+def scope_with(forwarded=None, client=("10.0.0.1", 5000)):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return {"headers": headers, "client": client}
+
+
+def test_client_ip_takes_the_hop_added_by_the_trusted_proxy():
+    # o cliente forjou "1.1.1.1"; o proxy acrescentou o IP real
+    scope = scope_with("1.1.1.1, 203.0.113.7")
+
+    assert client_ip(scope, hops=1) == "203.0.113.7"
+    assert client_ip(scope_with("1.1.1.1, 203.0.113.7, 198.51.100.2"), hops=2) == "203.0.113.7"
+
+
+def test_client_ip_without_proxy_ignores_the_header():
+    assert client_ip(scope_with("1.1.1.1"), hops=0) == "10.0.0.1"
+    assert client_ip(scope_with(None), hops=1) == "10.0.0.1"
+
+
+# ── middleware ──
+
+def make_client(rules, store=None):
+    app = FastAPI()
+
+    @app.post("/api/auth/login")
+    async def login():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, rules=rules, store=store or MemoryBucketStore())
+    app.add_middleware(RequestContextMiddleware)
+    app.add_middleware(CORSMiddleware, allow_origins=["https://loja.example"], allow_methods=["*"], allow_headers=["*"])
+
+    return TestClient(app)
+
+
+def test_over_limit_gets_429_with_retry_after_and_cors_headers():
+    client = make_client(parse_rules("POST /api/auth/login=2/60"))
+    headers = {"Origin": "https://loja.example"}
+
+    assert [client.post("/api/auth/login", headers=headers).status_code for _ in range(2)] == [200, 200]
+
+    response = client.post("/api/auth/login", headers=headers)
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
+    assert response.headers["access-control-allow-origin"] == "https://loja.example"
+    assert response.json()["request_id"]
+
+
+def test_outbound_saturation_sheds_with_503(monkeypatch):
+    monkeypatch.setattr(metrics, "_outbound_in_flight", 10_000)
+    client = make_client(parse_rules("POST /api/auth/login=100/60"))
+
+    response = client.post("/api/auth/login")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_route_concurrency_limit_sheds_with_503():
+    middleware = RateLimitMiddleware(None, rules={}, store=MemoryBucketStore())
+    rule = Rule("POST", "/api/auth/login", capacity=100, period=60, concurrency=1)
+    middleware._active[rule.name] = 1
+
+    response = asyncio.run(middleware._check({"headers": [], "client": ("1.2.3.4", 1)}, rule, rule.path))
+
+    assert response.status_code == 503
+
+
+def test_cors_is_the_outermost_middleware(monkeypatch):
+    monkeypatch.chdir(BACKEND)
+    from app.main import app
+
+    assert app.user_middleware[0].cls is CORSMiddleware
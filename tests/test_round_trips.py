@@ -0,0 +1,127 @@
+"""Idas ao Mongo por requisição nas rotas de endereço e autenticação."""
+
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from app.routes import addresses, auth
+from app.routes.auth import get_current_user, hash_password
+
+# operações que vão ao servidor (cursores contam na criação)
+OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "insert_one", "update_one",
+    "update_many", "delete_one", "count_documents", "aggregate",
+}
+
+USER_ID = ObjectId()
+
+ADDRESS = {
+    "title": "Casa",
+    "receiver_name": "Ana Souza",
+    "receiver_phone": "11999999999",
+    "receiver_document": "12345678909",
+    "to_cep": "01001-000",
+    "receiver_address": "Praça da Sé",
+    "receiver_number": "1",
+    "receiver_district": "Sé",
+    "receiver_city": "São Paulo",
+    "receiver_state": "SP",
+}
+
+
+class CountingCollection:
+    def __init__(self, collection, calls: list):
+        self._collection = collection
+        self._calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+
+        if name not in OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._calls.append((self._collection.name, name))
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+class CountingDB:
+    def __init__(self, db):
+        self._db = db
+        self.calls: list[tuple[str, str]] = []
+
+    def __getattr__(self, name):
+        return CountingCollection(getattr(self._db, name), self.calls)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    counting = CountingDB(AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(addresses, "get_db", lambda: counting)
+    monkeypatch.setattr(auth, "get_db", lambda: counting)
+    return counting
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(addresses.router)
+    app.include_router(auth.router)
+    app.dependency_overrides[get_current_user] = lambda: {"_id": USER_ID}
+    return TestClient(app)
+
+
+def test_create_address_is_one_round_trip(client, db):
+    assert client.post("/api/addresses", json=ADDRESS).status_code == 200
+    assert db.calls == [("addresses", "insert_one")]
+
+
+def test_create_default_address_clears_others_in_one_extra_round_trip(client, db):
+    assert client.post("/api/addresses", json={**ADDRESS, "is_default": True}).status_code == 200
+    assert db.calls == [("addresses", "update_many"), ("addresses", "insert_one")]
+
+
+def test_update_address_is_one_round_trip(client, db):
+    address_id = client.post("/api/addresses", json=ADDRESS).json()["id"]
+    db.calls.clear()
+
+    response = client.put(f"/api/addresses/{address_id}", json={"title": "Trabalho"})
+
+    assert response.status_code == 200
+    assert response.json()["title"] == "Trabalho"
+    assert db.calls == [("addresses", "find_one_and_update")]
+
+
+def test_update_missing_address_is_404_without_extra_read(client, db):
+    response = client.put(f"/api/addresses/{ObjectId()}", json={"title": "Trabalho"})
+
+    assert response.status_code == 404
+    assert db.calls == [("addresses", "find_one_and_update")]
+
+
+def test_register_does_not_read_back_the_user(client, db):
+    body = {"name": "Ana", "email": "ana@example.com", "password": "segredo123"}
+
+    assert client.post("/api/auth/register", json=body).status_code == 200
+    assert db.calls == [("users", "find_one"), ("users", "insert_one")]
+
+
+def test_login_is_two_round_trips(client, db):
+    asyncio.run(db._db.users.insert_one({
+        "name": "Ana",
+        "email": "ana@example.com",
+        "password_hash": hash_password("segredo123"),
+        "provider": "local",
+        "created_at": "2026-01-01T00:00:00+00:00",
+    }))
+
+    body = {"email": "ana@example.com", "password": "segredo123"}
+
+    assert client.post("/api/auth/login", json=body).status_code == 200
+    assert db.calls == [("users", "find_one"), ("users", "update_one")]
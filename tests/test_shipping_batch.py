@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from app.services import shipping_batch
+from app.services.shipping_batch import run_shipping_batch
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.text = str(data)
+        self.headers = {"content-type": "application/json"}
+
+    def json(self):
+        return self._data
+
+
+def order(status, cart_id, **melhor_envio):
+    return {
+        "_id": ObjectId(),
+        "status": status,
+        "melhor_envio": {"cart_order_ids": [cart_id], "label": None, **melhor_envio},
+    }
+
+
+def patch_me(monkeypatch, handler):
+    async def token_doc():
+        return {}
+
+    async def http_post(url, payload, token):
+        return handler(url, payload)
+
+    monkeypatch.setattr(shipping_batch.me, "get_current_token_doc", token_doc)
+    monkeypatch.setattr(shipping_batch.me, "http_post", http_post)
+
+
+def run(db, **kwargs):
+    return asyncio.run(run_shipping_batch(db, steps=("checkout", "generate"), **kwargs))
+
+
+def test_order_ids_only_pick_orders_in_batch_status(monkeypatch):
+    sent = []
+
+    def handler(url, payload):
+        sent.extend(payload["orders"])
+        return FakeResponse(200, {c: {"tracking": f"BR{c}"} for c in payload["orders"]})
+
+    patch_me(monkeypatch, handler)
+
+    db = AsyncMongoMockClient()["test"]
+    paid = order("paid", "c1", label_file={"sha256": "old"})
+    created = order("created", "c2")
+    cancelled = order("cancelled", "c3")
+    asyncio.run(db.orders.insert_many([paid, created, cancelled]))
+
+    result = run(db, order_ids=[str(paid["_id"]), str(created["_id"]), str(cancelled["_id"])])
+
+    assert set(sent) == {"c1"}
+    assert result["orders"] == 1
+    assert result["skipped"] == [str(created["_id"]), str(cancelled["_id"])]
+
+    stored = asyncio.run(db.orders.find_one({"_id": paid["_id"]}))
+    assert "label_file" not in stored["melhor_envio"]
+    assert stored["melhor_envio"]["tracking_code"] == "BRc1"
+    assert stored["melhor_envio"]["cart_error"] is None
+
+
+def test_ineligible_status_filter_is_rejected():
+    db = AsyncMongoMockClient()["test"]
+
+    with pytest.raises(HTTPException) as exc:
+        run(db, status="cancelled")
+
+    assert exc.value.status_code == 400
+
+
+def test_failed_step_is_written_back_to_the_order(monkeypatch):
+    def handler(url, payload):
+        if url.endswith("/generate"):
+            return FakeResponse(422, {"message": "saldo insuficiente"})
+        return FakeResponse(200, {})
+
+    patch_me(monkeypatch, handler)
+
+    db = AsyncMongoMockClient()["test"]
+    paid = order("paid", "c1")
+    asyncio.run(db.orders.insert_one(paid))
+
+    result = run(db)
+
+    assert result["failed"] == 1
+    stored = asyncio.run(db.orders.find_one({"_id": paid["_id"]}))
+    assert stored["melhor_envio"]["cart_error"].startswith("generate:")
+    assert stored["melhor_envio"]["checkout"]
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from app.routes import auth
+from app.routes.auth import (
+    create_access_token, create_stream_token, get_current_user, get_current_user_stream,
+)
+
+USER_ID = ObjectId()
+ORDER_ID = str(ObjectId())
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    asyncio.run(db.users.insert_one({"_id": USER_ID, "name": "Ana"}))
+    monkeypatch.setattr(auth, "get_db", lambda: db)
+    return db
+
+
+def stream(order_id=ORDER_ID, authorization=None, stream_token=None):
+    return asyncio.run(get_current_user_stream(order_id, authorization, stream_token))
+
+
+def status_of(call) -> int:
+    with pytest.raises(HTTPException) as exc:
+        call()
+    return exc.value.status_code
+
+
+def test_stream_token_opens_its_own_order():
+    token = create_stream_token(str(USER_ID), ORDER_ID)
+    assert stream(stream_token=token)["_id"] == USER_ID
+
+
+def test_stream_token_is_bound_to_the_order():
+    token = create_stream_token(str(USER_ID), ORDER_ID)
+    assert status_of(lambda: stream(order_id=str(ObjectId()), stream_token=token)) == 401
+
+
+def test_session_token_is_refused_in_the_query_string():
+    token = create_access_token({"sub": str(USER_ID)})
+    assert status_of(lambda: stream(stream_token=token)) == 401
+
+
+def test_session_token_still_works_in_the_header():
+    token = create_access_token({"sub": str(USER_ID)})
+    assert stream(authorization=f"Bearer {token}")["_id"] == USER_ID
+
+
+def test_stream_token_is_not_a_session_token():
+    token = create_stream_token(str(USER_ID), ORDER_ID)
+    assert status_of(lambda: asyncio.run(get_current_user(f"Bearer {token}"))) == 401